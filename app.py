@@ -2,8 +2,10 @@ from fastapi import FastAPI, Form, Request
 from fastapi.responses import HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
+from metrics import instrument
 
 app = FastAPI()
+instrument(app, "app")
 
 # Load HTML templates from the "templates" directory
 templates = Jinja2Templates(directory="templates")
@@ -1,226 +1,433 @@
 # main.py
-from fastapi import FastAPI, File, UploadFile, Form, Request
-from fastapi.responses import HTMLResponse
+from fastapi import FastAPI, File, UploadFile, Form, Request, Response, Depends, Query
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 import pandas as pd
-import numpy as np
-import io
+import asyncio
+import hashlib
 import os
+import re
 import json
 from typing import List, Optional
-from sklearn.preprocessing import StandardScaler, MinMaxScaler, RobustScaler
-from sklearn.impute import SimpleImputer
+from pydantic import BaseModel
 import base64
-from io import BytesIO
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import seaborn as sns
 from pandas.api.types import is_numeric_dtype
+from starlette.concurrency import run_in_threadpool
+from data_ingest import (
+    CSV_BLOCK_BYTES, UnsupportedFormatError, excel_sheets, file_extension, is_excel, iter_upload, read_spooled,
+    shutdown_excel_pool, spool_to_disk
+)
+from data_ingest_cache import IngestCacheMiss, SheetNotFoundError, ingest_cache, ingest_upload, read_cached
+from data_store import SessionStore, new_session_id, valid_session_id
+from data_oplog import OperationError, OperationLog, pipeline_progress
+from data_outofcore import CHART_SAMPLE_ROWS, OutOfCoreLog, ParquetFrame, adopt_parquet, load_out_of_core
+from data_profile import column_types, missing_values
+from data_compact import COMPACT_BY_DEFAULT, compact_frame
+from data_pipeline import list_pipelines, load_pipeline, plan_pipeline, save_pipeline
+from data_executor import compute_pool, render_pool, pool_stats, shutdown_pools
+from data_charts import (
+    ChartError, chart_columns, png_data_uri, render_aggregated, render_chart, render_correlation, validate_chart,
+    warm_up as warm_up_plotting
+)
+from data_correlation import (
+    PAIRPLOT_SAMPLE_ROWS, CorrelationError, cached_correlation, correlation_cache, sample_rows, top_correlated
+)
+from data_downsample import aggregate_chart, should_aggregate
+from data_export import EXPORT_FORMATS, ExportError, content_disposition, export_stream, iter_arrow
+from data_preview import PreviewError, cached_sort_order, page, validate_page
+from data_cache import LRUCache
+from data_jobs import JobCancelled, JobError, JobQueue, job_events
+from data_json import ORIENTS, FrameJSONResponse, dumps, fragment
+from metrics import instrument, register_collector, span
+
+# pandas >= 3 always uses copy-on-write; older versions need it switched on so
+# that shallow copies of a frame do not see each other's column updates
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
 
 # Create FastAPI app
-app = FastAPI(title="Data Preprocessing and Visualization App")
+app = FastAPI(title="Data Preprocessing and Visualization App", default_response_class=FrameJSONResponse)
+instrument(app, "data")
+
+# Setup templates and static files (both ship with the app; nothing is written at import).
+# They are found next to this file, whatever the working directory.
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+templates = Jinja2Templates(directory=os.path.join(APP_DIR, "templates"))
+app.mount("/static", StaticFiles(directory=os.path.join(APP_DIR, "static")), name="static")
+
+# Rendered chart PNGs keyed by ETag, bounded by total size
+CHART_CACHE_MB = float(os.environ.get("DATA_CHART_CACHE_MB", 64))
+chart_cache = LRUCache(CHART_CACHE_MB * 1024 * 1024)
+# Charts depend on per-session data: let the browser keep them but revalidate every time
+CHART_CACHE_CONTROL = "private, no-cache"
+
+# Keyed store holding one dataset per session, spilled to disk under memory pressure
+dataset_store = SessionStore()
+SESSION_COOKIE = "session_id"
+SESSION_HEADER = "X-Session-ID"
 
-# Create templates and static directories if they don't exist
-os.makedirs("templates", exist_ok=True)
-os.makedirs("static", exist_ok=True)
+# Background uploads, pipeline runs and charts, polled or followed over SSE
+job_queue = JobQueue()
 
-# Setup templates and static files
-templates = Jinja2Templates(directory="templates")
-app.mount("/static", StaticFiles(directory="static"), name="static")
+# Dependency resolving the caller's session id from the header or cookie,
+# starting a new session when there is none
+def resolve_session(request: Request, response: Response) -> str:
+    session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+    if not valid_session_id(session_id):
+        session_id = new_session_id()
+        response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    response.headers[SESSION_HEADER] = session_id
+    return session_id
 
-# Create an in-memory store for the uploaded file
-uploaded_file = {"dataframe": None, "filename": None, "preprocessed": None}
+# Dependency resolving the caller's dataset from the session header or cookie
+async def current_dataset(request: Request, response: Response):
+    session_id = resolve_session(request, response)
+
+    # Reloading an evicted session reads from disk, so keep it off the event loop
+    uploaded_file = await run_in_threadpool(dataset_store.get, session_id)
+    try:
+        yield uploaded_file
+    finally:
+        await run_in_threadpool(dataset_store.release, session_id, request.method != "GET")
 
 @app.get("/", response_class=HTMLResponse)
 async def index(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    return templates.TemplateResponse(request, "data.html")
+
+# Store a freshly parsed dataframe (or out-of-core ParquetFrame) and build the upload summary
+# With `commit` given, the session is updated through commit(apply), which may
+# refuse by raising (a job cancelled meanwhile); the session is then left as it was.
+def store_upload(uploaded_file, df, filename, memory=None, source=None, commit=None):
+    previous = uploaded_file["history"]
+    # Preprocessing is recorded as a log of operations over the uploaded frame.
+    # A profile from the ingest cache seeds the log, and the same upload always
+    # gets the same token so chart and correlation caches carry over.
+    profile, token = (source["profile"], source["token"]) if source else (None, None)
+    log_class = OutOfCoreLog if isinstance(df, ParquetFrame) else OperationLog
+    history = log_class(df, profile, token)
+    # Profile every column once at ingest; operations only re-profile what they touch
+    profile = history.profile()
+
+    # The session is switched to the new upload in one step
+    def apply():
+        uploaded_file.update(
+            filename=filename,
+            history=history,
+            # Kept to switch sheets later; the profile and token now live in the log
+            source=source and {key: value for key, value in source.items() if key not in ("profile", "token")},
+        )
 
-@app.post("/upload/")
-async def upload_file(file: UploadFile = File(...)):
     try:
-        # Read the file content
-        contents = await file.read()
-        buffer = io.BytesIO(contents)
-        
-        # Check file extension to determine how to read it
-        file_extension = file.filename.split('.')[-1].lower()
-        
-        if file_extension == 'csv':
-            df = pd.read_csv(buffer)
-        elif file_extension in ['xls', 'xlsx']:
-            df = pd.read_excel(buffer)
+        apply() if commit is None else commit(apply)
+    except BaseException:
+        if isinstance(history, OutOfCoreLog):
+            history.close()
+        raise
+    if isinstance(previous, OutOfCoreLog):
+        previous.close()
+
+    info = {
+        "columns": df.columns.tolist(),
+        "column_types": column_types(profile),
+        "rows": len(df),
+        "filename": filename,
+        "missing_values": missing_values(profile),
+        "sample_data": fragment(df.head(5))
+    }
+    if memory is not None:
+        info["memory"] = memory
+    if source is not None:
+        info["cached"] = source["cached"]
+        if source["sheets"] is not None:
+            info["sheets"] = source["sheets"]
+            info["sheet"] = source["sheet"]
+    return info
+
+# Parse a spooled upload whose bytes hash to `digest`, through the ingest
+# cache when it is enabled; with path=None the upload is read back from the
+# cache (to switch sheets). Returns the frame (a ParquetFrame in out-of-core
+# mode), the per-column memory report when dtypes were compacted, and the
+# upload's source: how it was parsed, its sheets, and the profile and cache
+# token to seed the operation log with.
+def parse_upload(path, digest, extension, out_of_core=False, compact=False, on_progress=None, sheet=None):
+    source = {
+        "digest": digest, "extension": extension, "out_of_core": out_of_core, "compact": compact,
+        "sheets": None, "sheet": sheet, "cached": False, "profile": None, "token": None
+    }
+    if not ingest_cache.enabled:
+        if path is None:
+            raise IngestCacheMiss("The ingest cache is disabled. Upload the file again to pick another sheet.")
+        if is_excel(path):
+            source["sheets"] = excel_sheets(path)
+            source["sheet"] = sheet if sheet is not None else source["sheets"][0]
+        if out_of_core:
+            # Parquet already stores columns compactly
+            df, _ = load_out_of_core(path, on_progress, sheet)
+            return df, None, source
+        df, _ = read_spooled(path, on_progress, sheet)
+    else:
+        result = ingest_upload(path, digest, extension, sheet, out_of_core, on_progress)
+        source.update(sheets=result["sheets"], sheet=result["sheet"], cached=result["cached"])
+        mode = "out-of-core" if out_of_core else "compact" if compact else "full"
+        if out_of_core:
+            if result["parquet"] is None:
+                df, _ = load_out_of_core(path, on_progress, result["sheet"])
+                return df, None, source
+            try:
+                df = adopt_parquet(result["parquet"])
+            except FileNotFoundError:
+                # Evicted by another upload before it could be linked: convert again
+                if path is None:
+                    raise IngestCacheMiss("The upload is no longer cached. Upload it again.")
+                df, _ = load_out_of_core(path, on_progress, result["sheet"])
+                return df, None, source
+            finally:
+                if result["temporary"]:
+                    ingest_cache.discard(result["parquet"])
+            source["token"] = f"{result['key']}:{mode}"
+            return df, None, source
+        if result["frame"] is not None:
+            df, profile = result["frame"], result["profile"]
         else:
-            return {"error": "Unsupported file format. Please upload CSV or Excel files."}
-        
-        # Store the dataframe in memory
-        uploaded_file["dataframe"] = df
-        uploaded_file["filename"] = file.filename
-        uploaded_file["preprocessed"] = df.copy()  # Initialize preprocessed with original
-        
-        # Get column types
-        column_types = {}
-        for col in df.columns:
-            if is_numeric_dtype(df[col]):
-                column_types[col] = "numeric"
-            else:
-                column_types[col] = "categorical"
-        
-        # Basic dataset info
-        info = {
-            "columns": df.columns.tolist(),
-            "column_types": column_types,
-            "rows": len(df),
-            "filename": file.filename,
-            "missing_values": df.isna().sum().to_dict(),
-            "sample_data": df.head(5).to_dict(orient="records")
-        }
-        
-        return info
+            df, profile = read_cached(result)
+        if result["parquet"] is not None:
+            source["token"] = f"{result['key']}:{mode}"
+        # Compacting changes dtypes and memory, so the cached profile only fits the full frame
+        if not compact:
+            source["profile"] = profile
+    if compact:
+        df, memory = compact_frame(df)
+        return df, memory, source
+    return df, None, source
+
+# With out_of_core=true the dataset is converted to Parquet and never loaded into memory.
+# With compact=true (default: DATA_COMPACT_DTYPES) numeric and text columns get smaller dtypes.
+# Repeat uploads of the same bytes are read back from the ingest cache.
+# Workbooks are read from `sheet` (default: the first sheet); the response lists the sheets.
+@app.post("/upload/")
+async def upload_file(
+    file: UploadFile = File(...),
+    out_of_core: bool = False,
+    compact: bool = COMPACT_BY_DEFAULT,
+    sheet: Optional[str] = None,
+    uploaded_file: dict = Depends(current_dataset)
+):
+    path = None
+    try:
+        # Spool the upload to disk in chunks instead of reading it into memory
+        path, digest = await spool_to_disk(iter_upload(file), file.filename)
+
+        # Parse the spooled file chunk by chunk off the event loop
+        df, memory, source = await compute_pool.run(
+            parse_upload, path, digest, file_extension(file.filename), out_of_core, compact, None, sheet
+        )
+
+        return await compute_pool.run(store_upload, uploaded_file, df, file.filename, memory, source)
+    except (UnsupportedFormatError, SheetNotFoundError) as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error processing file: {str(e)}"}
+    finally:
+        if path:
+            os.unlink(path)
+
+# Raw-body upload: the request body is spooled to disk as it arrives and the
+# response streams parsing progress as newline-delimited JSON
+@app.post("/upload/stream/")
+async def upload_file_stream(
+    request: Request,
+    filename: str,
+    out_of_core: bool = False,
+    compact: bool = COMPACT_BY_DEFAULT,
+    sheet: Optional[str] = None,
+    uploaded_file: dict = Depends(current_dataset)
+):
+    try:
+        path, digest = await spool_to_disk(request.stream(), filename)
+    except UnsupportedFormatError as e:
+        return {"error": str(e)}
+
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def on_progress(snapshot):
+        loop.call_soon_threadsafe(queue.put_nowait, {"stage": "parsing", **snapshot})
+
+    def parse():
+        try:
+            return parse_upload(path, digest, file_extension(filename), out_of_core, compact, on_progress, sheet)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+
+    session_id = uploaded_file.session_id
+
+    async def events():
+        # The dependency releases the session before the body is streamed,
+        # so hold it again until the parsed frame has been stored
+        uploaded_file = await run_in_threadpool(dataset_store.get, session_id)
+        try:
+            parsing = asyncio.ensure_future(compute_pool.run(parse))
+            while (event := await queue.get()) is not None:
+                yield dumps(event) + b"\n"
+            try:
+                df, memory, source = await parsing
+            except SheetNotFoundError as e:
+                yield dumps({"error": str(e)}) + b"\n"
+                return
+            except Exception as e:
+                yield dumps({"error": f"Error processing file: {str(e)}"}) + b"\n"
+                return
+            info = await compute_pool.run(store_upload, uploaded_file, df, filename, memory, source)
+            yield dumps({"stage": "done", **info}) + b"\n"
+        finally:
+            os.unlink(path)
+            await run_in_threadpool(dataset_store.release, session_id)
+
+    response = StreamingResponse(events(), media_type="application/x-ndjson")
+    response.headers[SESSION_HEADER] = session_id
+    response.set_cookie(SESSION_COOKIE, session_id, httponly=True, samesite="lax")
+    return response
+
+# Sheets of the uploaded workbook and the one currently loaded
+@app.get("/upload/sheets/")
+async def get_sheets(uploaded_file: dict = Depends(current_dataset)):
+    source = uploaded_file["source"]
+    if source is None:
+        return {"error": "No file has been uploaded yet."}
+    if source["sheets"] is None:
+        return {"error": "The uploaded file is not an Excel workbook."}
+    return {"filename": uploaded_file["filename"], "sheets": source["sheets"], "sheet": source["sheet"], "success": True}
+
+# Load another sheet of the uploaded workbook from the ingest cache, replacing
+# the current dataset (and its preprocessing history)
+@app.post("/upload/sheet/")
+async def select_sheet(sheet: str = Form(...), uploaded_file: dict = Depends(current_dataset)):
+    source = uploaded_file["source"]
+    if source is None:
+        return {"error": "No file has been uploaded yet."}
+    if source["sheets"] is None:
+        return {"error": "The uploaded file is not an Excel workbook."}
+    try:
+        df, memory, source = await compute_pool.run(
+            parse_upload, None, source["digest"], source["extension"], source["out_of_core"], source["compact"],
+            None, sheet
+        )
+        return await compute_pool.run(store_upload, uploaded_file, df, uploaded_file["filename"], memory, source)
+    except (SheetNotFoundError, IngestCacheMiss) as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error loading sheet: {str(e)}"}
+
+# The preprocessed frame for a session, or None before the first upload
+def preprocessed_frame(uploaded_file):
+    history = uploaded_file["history"]
+    return None if history is None else history.current()
 
 @app.post("/preprocess/handle-missing/")
-async def handle_missing_values(columns: List[str] = Form(...), method: str = Form(...)):
+async def handle_missing_values(columns: List[str] = Form(...), method: str = Form(...), uploaded_file: dict = Depends(current_dataset)):
     try:
-        df = uploaded_file["preprocessed"]
-        if df is None:
+        history = uploaded_file["history"]
+        if history is None:
             return {"error": "No file has been uploaded yet."}
         
-        # Validate columns
-        for col in columns:
-            if col not in df.columns:
-                return {"error": f"Column '{col}' not found in the dataset."}
-        
-        # Apply imputation based on method
-        for col in columns:
-            if method == "mean" and is_numeric_dtype(df[col]):
-                df[col] = df[col].fillna(df[col].mean())
-            elif method == "median" and is_numeric_dtype(df[col]):
-                df[col] = df[col].fillna(df[col].median())
-            elif method == "mode":
-                df[col] = df[col].fillna(df[col].mode()[0])
-            elif method == "constant":
-                df[col] = df[col].fillna(0 if is_numeric_dtype(df[col]) else "unknown")
-            elif method == "drop_rows":
-                df = df.dropna(subset=columns)
-            else:
-                return {"error": f"Invalid method '{method}' for column '{col}'."}
-        
-        # Update the preprocessed dataframe
-        uploaded_file["preprocessed"] = df
+        # Validate columns and apply imputation based on method
+        df = await compute_pool.run(history.apply, "handle-missing", columns=columns, method=method)
         
         return {
             "success": True,
             "message": f"Successfully handled missing values in {len(columns)} column(s) using {method} method.",
             "rows": len(df),
-            "missing_values": df.isna().sum().to_dict()
+            "missing_values": missing_values(await compute_pool.run(history.profile))
         }
+    except OperationError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error handling missing values: {str(e)}"}
 
 @app.post("/preprocess/normalize/")
-async def normalize_columns(columns: List[str] = Form(...), method: str = Form(...)):
+async def normalize_columns(columns: List[str] = Form(...), method: str = Form(...), uploaded_file: dict = Depends(current_dataset)):
     try:
-        df = uploaded_file["preprocessed"]
-        if df is None:
+        history = uploaded_file["history"]
+        if history is None:
             return {"error": "No file has been uploaded yet."}
         
-        # Validate columns are numeric
-        for col in columns:
-            if col not in df.columns:
-                return {"error": f"Column '{col}' not found in the dataset."}
-            if not is_numeric_dtype(df[col]):
-                return {"error": f"Column '{col}' is not numeric and cannot be normalized."}
-        
-        # Apply normalization based on method
-        if method == "minmax":
-            scaler = MinMaxScaler()
-            df[columns] = scaler.fit_transform(df[columns])
-        elif method == "standard":
-            scaler = StandardScaler()
-            df[columns] = scaler.fit_transform(df[columns])
-        elif method == "robust":
-            scaler = RobustScaler()
-            df[columns] = scaler.fit_transform(df[columns])
-        else:
-            return {"error": f"Invalid normalization method '{method}'."}
-        
-        # Update the preprocessed dataframe
-        uploaded_file["preprocessed"] = df
+        # Validate columns are numeric and apply normalization based on method
+        df = await compute_pool.run(history.apply, "normalize", columns=columns, method=method)
         
         # Get sample of normalized data
-        sample_data = df[columns].head(5).to_dict(orient="records")
+        sample_data = fragment(df[columns].head(5))
         
         return {
             "success": True,
             "message": f"Successfully normalized {len(columns)} column(s) using {method} method.",
             "sample_data": sample_data
         }
+    except OperationError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error normalizing data: {str(e)}"}
 
+# One-hot options: sparse output, a max_categories cap with an "other" column,
+# and a JSON category mapping (as returned by an earlier call) to reuse
+# instead of fitting the categories on this data
 @app.post("/preprocess/encode-categorical/")
-async def encode_categorical(columns: List[str] = Form(...), method: str = Form(...)):
+async def encode_categorical(
+    columns: List[str] = Form(...),
+    method: str = Form(...),
+    sparse: bool = Form(False),
+    max_categories: Optional[int] = Form(None),
+    mapping: Optional[str] = Form(None),
+    uploaded_file: dict = Depends(current_dataset)
+):
     try:
-        df = uploaded_file["preprocessed"]
-        if df is None:
+        history = uploaded_file["history"]
+        if history is None:
             return {"error": "No file has been uploaded yet."}
         
-        # Validate columns
-        for col in columns:
-            if col not in df.columns:
-                return {"error": f"Column '{col}' not found in the dataset."}
-        
-        # Apply encoding based on method
+        params = {"columns": columns, "method": method}
         if method == "onehot":
-            # One-hot encoding
-            for col in columns:
-                # Get dummies and join with original dataframe
-                dummies = pd.get_dummies(df[col], prefix=col)
-                df = pd.concat([df.drop(col, axis=1), dummies], axis=1)
-        elif method == "label":
-            # Label encoding
-            for col in columns:
-                # Map each unique value to a number
-                categories = df[col].astype('category').cat.categories
-                df[col] = df[col].astype('category').cat.codes
-        else:
-            return {"error": f"Invalid encoding method '{method}'."}
+            params.update(sparse=sparse, max_categories=max_categories)
+            if mapping:
+                try:
+                    params["mapping"] = json.loads(mapping)
+                except ValueError:
+                    return {"error": "The category mapping must be valid JSON."}
+        
+        # Validate columns and apply encoding based on method
+        def encode():
+            df, op = history.apply_recorded("encode-categorical", **params)
+            # The recorded operation carries the fitted category mapping
+            return df, op["params"].get("mapping")
         
-        # Update the preprocessed dataframe
-        uploaded_file["preprocessed"] = df
+        df, fitted = await compute_pool.run(encode)
         
         # Get new column list after encoding
         new_columns = df.columns.tolist()
         
-        return {
+        result = {
             "success": True,
             "message": f"Successfully encoded {len(columns)} column(s) using {method} method.",
             "new_columns": new_columns,
-            "sample_data": df.head(5).to_dict(orient="records")
+            "sample_data": fragment(df.head(5))
         }
+        if fitted is not None:
+            result["mapping"] = fitted
+        return result
+    except OperationError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error encoding categorical data: {str(e)}"}
 
 @app.post("/preprocess/drop-columns/")
-async def drop_columns(columns: List[str] = Form(...)):
+async def drop_columns(columns: List[str] = Form(...), uploaded_file: dict = Depends(current_dataset)):
     try:
-        df = uploaded_file["preprocessed"]
-        if df is None:
+        history = uploaded_file["history"]
+        if history is None:
             return {"error": "No file has been uploaded yet."}
         
-        # Validate columns
-        for col in columns:
-            if col not in df.columns:
-                return {"error": f"Column '{col}' not found in the dataset."}
-        
-        # Drop columns
-        df = df.drop(columns=columns)
-        
-        # Update the preprocessed dataframe
-        uploaded_file["preprocessed"] = df
+        # Validate and drop columns
+        df = await compute_pool.run(history.apply, "drop-columns", columns=columns)
         
         # Get new column list after dropping
         new_columns = df.columns.tolist()
@@ -231,113 +438,344 @@ async def drop_columns(columns: List[str] = Form(...)):
             "new_columns": new_columns,
             "rows": len(df)
         }
+    except OperationError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error dropping columns: {str(e)}"}
 
+class PipelineStep(BaseModel):
+    op: str
+    params: dict = {}
+
+class PipelineSpec(BaseModel):
+    steps: List[PipelineStep]
+
+# Plan and run a list of steps as one log entry and build the response.
+# report(step_number, total_steps, step) is called before each step.
+def pipeline_result(history, steps, report=None):
+    token = pipeline_progress.set(report)
+    try:
+        plan = plan_pipeline(steps, history.current().columns)
+        df = history.apply("pipeline", steps=plan)
+    finally:
+        pipeline_progress.reset(token)
+    return {
+        "success": True,
+        "message": f"Successfully ran {len(steps)} step(s) as {len(plan)} planned step(s).",
+        "plan": plan,
+        "rows": len(df),
+        "columns": df.columns.tolist(),
+        "missing_values": missing_values(history.profile()),
+        "sample_data": fragment(df.head(5))
+    }
+
+# Plan and run a list of steps as one log entry, serializing a single response
+async def run_pipeline_steps(uploaded_file, steps):
+    history = uploaded_file["history"]
+    if history is None:
+        return {"error": "No file has been uploaded yet."}
+    
+    try:
+        return await compute_pool.run(pipeline_result, history, steps)
+    except OperationError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error running pipeline: {str(e)}"}
+
+@app.post("/preprocess/pipeline/")
+async def run_preprocessing_pipeline(
+    spec: PipelineSpec,
+    save_as: Optional[str] = None,
+    uploaded_file: dict = Depends(current_dataset)
+):
+    steps = [step.model_dump() for step in spec.steps]
+    if save_as:
+        try:
+            save_pipeline(save_as, steps)
+        except OperationError as e:
+            return {"error": str(e)}
+    return await run_pipeline_steps(uploaded_file, steps)
+
+@app.get("/preprocess/pipelines/")
+async def get_saved_pipelines():
+    return {"pipelines": list_pipelines(), "success": True}
+
+@app.post("/preprocess/pipelines/{name}/")
+async def save_preprocessing_pipeline(name: str, spec: PipelineSpec):
+    try:
+        steps = [step.model_dump() for step in spec.steps]
+        save_pipeline(name, steps)
+        return {"success": True, "message": f"Saved pipeline '{name}'.", "plan": plan_pipeline(steps)}
+    except OperationError as e:
+        return {"error": str(e)}
+
+# Replay a saved pipeline against the session's current data
+@app.post("/preprocess/pipelines/{name}/run/")
+async def run_saved_pipeline(name: str, uploaded_file: dict = Depends(current_dataset)):
+    try:
+        steps = load_pipeline(name)
+    except OperationError as e:
+        return {"error": str(e)}
+    return await run_pipeline_steps(uploaded_file, steps)
+
+# Rendered charts keyed by everything that determines the image. The dataset
+# version changes with every preprocessing step, so stale charts are never served.
+def chart_etag(version, chart_type, x_column, y_column, hue, title, figsize, correlation="pearson"):
+    key = json.dumps([version, chart_type, x_column, y_column, hue, title, list(figsize), correlation])
+    return '"' + hashlib.sha1(key.encode()).hexdigest() + '"'
+
+# Render a chart (or fetch it from the cache). Returns its ETag and PNG bytes.
+# report(stage, progress) is called as rendering moves through its stages.
+async def build_chart(uploaded_file, chart_type, x_column, y_column, hue, title, figsize, correlation="pearson",
+                      report=None):
+    report = report or (lambda stage, progress=None: None)
+    history = uploaded_file["history"]
+    if history is None:
+        raise ChartError("No file has been uploaded yet.")
+    
+    etag = chart_etag(history.version, chart_type, x_column, y_column, hue, title, figsize, correlation)
+    png = chart_cache.get(etag)
+    if png is not None:
+        return etag, png
+    
+    report("loading", 0.1)
+    df = await compute_pool.run(history.current)
+    
+    # Validate columns
+    for col in (x_column, y_column, hue):
+        if col and col not in df.columns:
+            raise ChartError(f"Column '{col}' not found in the dataset.")
+    
+    validate_chart(chart_type, y_column)
+    
+    # Out-of-core data is charted from a fixed-seed sample of its rows
+    if isinstance(df, ParquetFrame):
+        if chart_type in ("heatmap", "pairplot"):
+            wanted = [col for col, dtype in df.dtypes.items() if is_numeric_dtype(dtype) or col == hue]
+        else:
+            wanted = chart_columns(df, chart_type, x_column, y_column, hue)
+        report("sampling", 0.2)
+        df = await compute_pool.run(df.sample, CHART_SAMPLE_ROWS, wanted)
+    
+    # Heatmaps and pairplots work from the numeric correlation matrix, cached per version
+    if chart_type in ("heatmap", "pairplot"):
+        report("correlating", 0.3)
+        try:
+            corr = await compute_pool.run(cached_correlation, history.version, df, correlation)
+        except CorrelationError as e:
+            raise ChartError(str(e))
+        report("rendering", 0.6)
+        if chart_type == "heatmap":
+            png = await render_pool.run(render_correlation, corr, title, figsize)
+        else:
+            # The most correlated columns, over a bounded sample of rows
+            columns = top_correlated(corr)
+            frame = df[columns + [hue] if hue and hue not in columns else columns]
+            frame = await compute_pool.run(sample_rows, frame, PAIRPLOT_SAMPLE_ROWS)
+            png = await render_pool.run(render_chart, frame, chart_type, x_column, y_column, hue, title, figsize)
+        chart_cache.put(etag, png)
+        return etag, png
+    
+    # Render in the render pool, shipping only the columns the chart reads.
+    # Large frames are summarized first so render time stays flat as data grows.
+    frame = df[chart_columns(df, chart_type, x_column, y_column, hue)]
+    if should_aggregate(frame, chart_type):
+        report("aggregating", 0.3)
+        summary = await compute_pool.run(aggregate_chart, frame, chart_type, x_column, y_column, hue)
+        report("rendering", 0.6)
+        png = await render_pool.run(render_aggregated, summary, chart_type, x_column, y_column, hue, title, figsize)
+    else:
+        report("rendering", 0.6)
+        png = await render_pool.run(render_chart, frame, chart_type, x_column, y_column, hue, title, figsize)
+    chart_cache.put(etag, png)
+    return etag, png
+
+# Entity tags in an If-None-Match list, weak or strong
+_ENTITY_TAG_RE = re.compile(r'(?:W/)?("[^"]*")')
+
+# If-None-Match per RFC 9110: "*" or a list of entity tags, compared weakly
+# (a W/ prefix is ignored). Only GET and HEAD are answered with 304; other
+# methods ignore the header and send the full response.
+def not_modified(request, etag):
+    header = request.headers.get("if-none-match")
+    if header is None or request.method not in ("GET", "HEAD"):
+        return False
+    if header.strip() == "*":
+        return True
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    return opaque in _ENTITY_TAG_RE.findall(header)
+
 @app.post("/visualization/create/")
 async def create_visualization(
+    request: Request,
+    response: Response,
     chart_type: str = Form(...), 
     x_column: str = Form(...),
     y_column: Optional[str] = Form(None),
     hue: Optional[str] = Form(None),
-    title: str = Form(...)
+    title: str = Form(...),
+    width: float = Form(10),
+    height: float = Form(6),
+    correlation: str = Form("pearson"),
+    uploaded_file: dict = Depends(current_dataset)
 ):
     try:
-        df = uploaded_file["preprocessed"]
-        if df is None:
-            return {"error": "No file has been uploaded yet."}
-        
-        # Validate columns
-        if x_column not in df.columns:
-            return {"error": f"Column '{x_column}' not found in the dataset."}
-        
-        if y_column and y_column not in df.columns:
-            return {"error": f"Column '{y_column}' not found in the dataset."}
-        
-        if hue and hue not in df.columns:
-            return {"error": f"Column '{hue}' not found in the dataset."}
-        
-        # Create figure
-        plt.figure(figsize=(10, 6))
-        
-        # Create appropriate plot based on chart type
-        if chart_type == "bar":
-            if not y_column:
-                return {"error": "Y-axis column is required for bar chart."}
-            sns.barplot(x=x_column, y=y_column, hue=hue, data=df)
-        elif chart_type == "histogram":
-            sns.histplot(df[x_column], kde=True)
-        elif chart_type == "scatter":
-            if not y_column:
-                return {"error": "Y-axis column is required for scatter plot."}
-            sns.scatterplot(x=x_column, y=y_column, hue=hue, data=df)
-        elif chart_type == "box":
-            sns.boxplot(x=x_column, y=y_column, hue=hue, data=df)
-        elif chart_type == "line":
-            if not y_column:
-                return {"error": "Y-axis column is required for line chart."}
-            sns.lineplot(x=x_column, y=y_column, hue=hue, data=df)
-        elif chart_type == "heatmap":
-            # For heatmap, we need to create a correlation matrix
-            corr_matrix = df.corr()
-            sns.heatmap(corr_matrix, annot=True, cmap="coolwarm")
-        elif chart_type == "pairplot":
-            # For pairplot, create a new figure with seaborn directly
-            # We'll limit to 5 columns to avoid too many plots
-            numeric_cols = [col for col in df.columns if is_numeric_dtype(df[col])]
-            if len(numeric_cols) > 5:
-                numeric_cols = numeric_cols[:5]
-                
-            g = sns.pairplot(df[numeric_cols], hue=hue if hue in numeric_cols else None)
-            plt.close(g.fig)  # Close the original figure
-            
-            # Save the pairplot figure
-            buf = BytesIO()
-            g.savefig(buf, format="png")
-            buf.seek(0)
-            img_str = base64.b64encode(buf.read()).decode('utf-8')
-            return {"image": f"data:image/png;base64,{img_str}", "success": True}
-        else:
-            return {"error": f"Unsupported chart type: {chart_type}"}
-        
-        # Set title
-        plt.title(title)
-        plt.tight_layout()
-        
-        # Convert plot to base64 string
-        buf = BytesIO()
-        plt.savefig(buf, format="png")
-        plt.close()
-        buf.seek(0)
-        img_str = base64.b64encode(buf.read()).decode('utf-8')
+        etag, png = await build_chart(uploaded_file, chart_type, x_column, y_column, hue, title, (width, height), correlation)
+        if not_modified(request, etag):
+            return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL})
         
-        return {"image": f"data:image/png;base64,{img_str}", "success": True}
+        response.headers["ETag"] = etag
+        response.headers["Cache-Control"] = CHART_CACHE_CONTROL
+        with span("base64"):
+            image = png_data_uri(png)
+        return {"image": image, "success": True}
+    except ChartError as e:
+        return {"error": str(e)}
     except Exception as e:
         return {"error": f"Error creating visualization: {str(e)}"}
 
+# Same chart as a plain PNG, so an <img> tag can use the browser's HTTP cache
+@app.get("/visualization/image/")
+async def get_visualization_image(
+    request: Request,
+    chart_type: str,
+    x_column: str,
+    title: str,
+    y_column: Optional[str] = None,
+    hue: Optional[str] = None,
+    width: float = 10,
+    height: float = 6,
+    correlation: str = "pearson",
+    uploaded_file: dict = Depends(current_dataset)
+):
+    try:
+        etag, png = await build_chart(uploaded_file, chart_type, x_column, y_column, hue, title, (width, height), correlation)
+    except ChartError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except Exception as e:
+        return JSONResponse({"error": f"Error creating visualization: {str(e)}"}, status_code=500)
+    
+    headers = {"ETag": etag, "Cache-Control": CHART_CACHE_CONTROL}
+    if not_modified(request, etag):
+        return Response(status_code=304, headers=headers)
+    return Response(png, media_type="image/png", headers=headers)
+
 @app.get("/data/preview/")
-async def get_data_preview():
-    df = uploaded_file["preprocessed"]
+async def get_data_preview(uploaded_file: dict = Depends(current_dataset)):
+    df = await compute_pool.run(preprocessed_frame, uploaded_file)
     if df is None:
         return {"error": "No file has been uploaded yet."}
     
-    # Get basic info about preprocessed data
+    # Get basic info about preprocessed data; missing counts come from the profile cache
+    profile = await compute_pool.run(uploaded_file["history"].profile)
     return {
         "columns": df.columns.tolist(),
         "rows": len(df),
-        "sample_data": df.head(10).to_dict(orient="records"),
-        "missing_values": df.isna().sum().to_dict(),
+        "sample_data": fragment(df.head(10)),
+        "missing_values": missing_values(profile),
         "success": True
     }
 
+# Cached per-column dtype, null count, min/max, mean, distinct estimate and memory
+@app.get("/data/profile/")
+async def get_data_profile(uploaded_file: dict = Depends(current_dataset)):
+    history = uploaded_file["history"]
+    if history is None:
+        return {"error": "No file has been uploaded yet."}
+    return {**await compute_pool.run(history.profile), "success": True}
+
+# Paginated, column-projected rows, optionally sorted, as JSON or Arrow IPC.
+# JSON rows are records by default; orient=columns gives {"column": [values, ...]}.
+@app.get("/data/rows/")
+async def get_data_rows(
+    offset: int = 0,
+    limit: int = 100,
+    columns: Optional[List[str]] = Query(None),
+    sort: Optional[str] = None,
+    descending: bool = False,
+    format: str = "json",
+    orient: str = "records",
+    uploaded_file: dict = Depends(current_dataset)
+):
+    history = uploaded_file["history"]
+    if history is None:
+        return JSONResponse({"error": "No file has been uploaded yet."}, status_code=404)
+    if format not in ("json", "arrow"):
+        return JSONResponse({"error": f"Unsupported format '{format}'. Use json or arrow."}, status_code=400)
+    if orient not in ORIENTS:
+        return JSONResponse({"error": f"Unsupported orient '{orient}'. Use records or columns."}, status_code=400)
+    
+    def build_page():
+        df = history.current()
+        validate_page(df, offset, limit, columns, sort)
+        if isinstance(df, ParquetFrame):
+            # Only the row groups the page falls in are read
+            if sort:
+                raise PreviewError("Sorting is not available in out-of-core mode.")
+            return len(df), df.slice(offset, limit, columns)
+        order = cached_sort_order(history.version, df, sort, descending) if sort else None
+        return len(df), page(df, offset, limit, columns, order)
+    
+    try:
+        total_rows, rows = await compute_pool.run(build_page)
+    except PreviewError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    
+    headers = {"X-Total-Rows": str(total_rows)}
+    if format == "arrow":
+        body = await compute_pool.run(lambda: b"".join(iter_arrow(rows)))
+        return Response(body, media_type=EXPORT_FORMATS["arrow"][1], headers=headers)
+    
+    return FrameJSONResponse({
+        "offset": offset,
+        "limit": limit,
+        "total_rows": total_rows,
+        "columns": rows.columns.tolist(),
+        "rows": await compute_pool.run(fragment, rows, orient),
+        "success": True
+    }, headers=headers)
+
+# Pearson or Spearman correlation of the numeric columns, cached per dataset
+# version; ?top=N also lists the N most correlated columns
+@app.get("/data/correlation/")
+async def get_data_correlation(method: str = "pearson", top: Optional[int] = None, uploaded_file: dict = Depends(current_dataset)):
+    history = uploaded_file["history"]
+    if history is None:
+        return {"error": "No file has been uploaded yet."}
+    
+    def correlate():
+        df = history.current()
+        if isinstance(df, ParquetFrame):
+            numeric = [col for col, dtype in df.dtypes.items() if is_numeric_dtype(dtype)]
+            df = df.sample(CHART_SAMPLE_ROWS, numeric)
+        return cached_correlation(history.version, df, method)
+    
+    try:
+        corr = await compute_pool.run(correlate)
+    except CorrelationError as e:
+        return {"error": str(e)}
+    
+    result = {
+        "method": method,
+        "columns": corr.columns.tolist(),
+        # Constant columns have no correlation: NaN becomes null
+        "matrix": fragment(corr.to_numpy()),
+        "success": True
+    }
+    if top:
+        result["top_columns"] = top_correlated(corr, top)
+    return result
+
 @app.get("/data/download/")
-async def download_preprocessed_data():
-    df = uploaded_file["preprocessed"]
+async def download_preprocessed_data(uploaded_file: dict = Depends(current_dataset)):
+    df = await compute_pool.run(preprocessed_frame, uploaded_file)
     if df is None:
         return {"error": "No file has been uploaded yet."}
+    if isinstance(df, ParquetFrame):
+        return {"error": "Out-of-core datasets are too large to download inline; use /data/export/."}
     
     # Convert to CSV
-    csv_content = df.to_csv(index=False)
+    csv_content = await compute_pool.run(df.to_csv, index=False)
     # Encode as base64
     b64_content = base64.b64encode(csv_content.encode()).decode()
     
@@ -347,379 +785,292 @@ async def download_preprocessed_data():
         "success": True
     }
 
+# Streams the preprocessed data in row chunks as CSV, gzip CSV, Parquet or Arrow IPC
+@app.get("/data/export/")
+async def export_preprocessed_data(format: str = "csv", uploaded_file: dict = Depends(current_dataset)):
+    df = await compute_pool.run(preprocessed_frame, uploaded_file)
+    if df is None:
+        return JSONResponse({"error": "No file has been uploaded yet."}, status_code=404)
+    
+    try:
+        chunks, download_name, media_type = export_stream(df, uploaded_file["filename"], format)
+    except ExportError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": content_disposition(download_name)}
+    )
+
 @app.post("/preprocess/reset/")
-async def reset_preprocessing():
+async def reset_preprocessing(uploaded_file: dict = Depends(current_dataset)):
     try:
-        # Reset preprocessed to original
-        if uploaded_file["dataframe"] is not None:
-            uploaded_file["preprocessed"] = uploaded_file["dataframe"].copy()
+        # Reset preprocessed to original by moving the log cursor back to the base frame
+        history = uploaded_file["history"]
+        if history is not None:
+            df = history.reset()
             
             return {
                 "success": True,
                 "message": "Preprocessing has been reset to original data.",
-                "columns": uploaded_file["preprocessed"].columns.tolist(),
-                "rows": len(uploaded_file["preprocessed"])
+                "columns": df.columns.tolist(),
+                "rows": len(df)
             }
         else:
             return {"error": "No file has been uploaded yet."}
     except Exception as e:
         return {"error": f"Error resetting preprocessing: {str(e)}"}
 
-# Create the HTML template file
-with open("templates/index.html", "w") as f:
-    f.write("""
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Data Preprocessing and Visualization</title>
-    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/css/bootstrap.min.css" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.0.0-beta3/css/all.min.css">
-    <style>
-        body {
-            padding: 20px;
-            background-color: #f8f9fa;
-        }
-        .container-fluid {
-            max-width: 1400px;
-        }
-        .card {
-            margin-bottom: 20px;
-            border-radius: 10px;
-            box-shadow: 0 4px 6px rgba(0,0,0,0.1);
-        }
-        .chart-container {
-            margin-bottom: 30px;
-            text-align: center;
-        }
-        .chart-container img {
-            max-width: 100%;
-            border-radius: 8px;
-            box-shadow: 0 4px 8px rgba(0,0,0,0.1);
-        }
-        .loader {
-            border: 4px solid #f3f3f3;
-            border-top: 4px solid #3498db;
-            border-radius: 50%;
-            width: 30px;
-            height: 30px;
-            animation: spin 2s linear infinite;
-            display: none;
-            margin: 20px auto;
-        }
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-        .nav-tabs .nav-link {
-            border-radius: 8px 8px 0 0;
-        }
-        .nav-tabs .nav-link.active {
-            font-weight: bold;
-            background-color: #fff;
-            border-bottom-color: #fff;
-        }
-        #visualization-gallery {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 20px;
-            margin-top: 20px;
-        }
-        .table-responsive {
-            max-height: 400px;
-            overflow-y: auto;
-        }
-        .column-badge {
-            display: inline-block;
-            margin: 5px;
-            padding: 5px 10px;
-            border-radius: 20px;
-            background-color: #e9ecef;
-            cursor: pointer;
-        }
-        .column-badge.selected {
-            background-color: #0d6efd;
-            color: white;
-        }
-        .column-badge.numeric {
-            border-left: 4px solid #28a745;
-        }
-        .column-badge.categorical {
-            border-left: 4px solid #dc3545;
+@app.post("/preprocess/undo/")
+async def undo_preprocessing(steps: int = Form(1), uploaded_file: dict = Depends(current_dataset)):
+    try:
+        history = uploaded_file["history"]
+        if history is None:
+            return {"error": "No file has been uploaded yet."}
+        
+        df = await compute_pool.run(history.undo, steps)
+        
+        return {
+            "success": True,
+            "message": f"Undid {steps} preprocessing step(s).",
+            "columns": df.columns.tolist(),
+            "rows": len(df),
+            "history": history.history()
         }
-    </style>
-</head>
-<body>
-    <div class="container-fluid">
-        <h1 class="text-center mb-4">Data Preprocessing and Visualization</h1>
+    except OperationError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error undoing preprocessing: {str(e)}"}
+
+@app.post("/preprocess/redo/")
+async def redo_preprocessing(steps: int = Form(1), uploaded_file: dict = Depends(current_dataset)):
+    try:
+        history = uploaded_file["history"]
+        if history is None:
+            return {"error": "No file has been uploaded yet."}
         
-        <!-- Upload Section -->
-        <div class="card mb-4">
-            <div class="card-body">
-                <h5 class="card-title">Dataset Upload</h5>
-                <form id="upload-form">
-                    <div class="mb-3">
-                        <input type="file" class="form-control" id="file-input" accept=".csv,.xlsx,.xls" required>
-                        <div class="form-text">Supported formats: CSV, Excel (.xlsx, .xls)</div>
-                    </div>
-                    <button type="submit" class="btn btn-primary">
-                        <i class="fas fa-upload"></i> Upload
-                    </button>
-                </form>
-                <div id="upload-loader" class="loader"></div>
-                <div id="upload-feedback" class="alert mt-3" style="display: none;"></div>
-            </div>
-        </div>
+        df = await compute_pool.run(history.redo, steps)
         
-        <!-- Main Content (hidden until file is uploaded) -->
-        <div id="main-content" style="display: none;">
-            <ul class="nav nav-tabs" id="myTab" role="tablist">
-                <li class="nav-item" role="presentation">
-                    <button class="nav-link active" id="data-tab" data-bs-toggle="tab" data-bs-target="#data" type="button" role="tab" aria-controls="data" aria-selected="true">
-                        <i class="fas fa-table"></i> Data Preview
-                    </button>
-                </li>
-                <li class="nav-item" role="presentation">
-                    <button class="nav-link" id="preprocess-tab" data-bs-toggle="tab" data-bs-target="#preprocess" type="button" role="tab" aria-controls="preprocess" aria-selected="false">
-                        <i class="fas fa-cogs"></i> Preprocessing
-                    </button>
-                </li>
-                <li class="nav-item" role="presentation">
-                    <button class="nav-link" id="visualize-tab" data-bs-toggle="tab" data-bs-target="#visualize" type="button" role="tab" aria-controls="visualize" aria-selected="false">
-                        <i class="fas fa-chart-bar"></i> Visualization
-                    </button>
-                </li>
-            </ul>
-            
-            <div class="tab-content" id="myTabContent">
-                <!-- Data Preview Tab -->
-                <div class="tab-pane fade show active" id="data" role="tabpanel" aria-labelledby="data-tab">
-                    <div class="card mt-3">
-                        <div class="card-body">
-                            <div class="row">
-                                <div class="col-md-6">
-                                    <h5 class="card-title">Dataset Information</h5>
-                                    <p><strong>Filename:</strong> <span id="data-filename"></span></p>
-                                    <p><strong>Rows:</strong> <span id="data-rows"></span></p>
-                                    <p><strong>Columns:</strong> <span id="data-columns-count"></span></p>
-                                    <div>
-                                        <strong>Column List:</strong>
-                                        <div id="data-columns-list" class="mt-2"></div>
-                                    </div>
-                                </div>
-                                <div class="col-md-6">
-                                    <h5>Missing Values</h5>
-                                    <div id="missing-values" class="table-responsive">
-                                        <table class="table table-sm">
-                                            <thead>
-                                                <tr>
-                                                    <th>Column</th>
-                                                    <th>Missing Count</th>
-                                                </tr>
-                                            </thead>
-                                            <tbody id="missing-values-body"></tbody>
-                                        </table>
-                                    </div>
-                                </div>
-                            </div>
-                            
-                            <h5 class="mt-4">Data Sample</h5>
-                            <div class="table-responsive">
-                                <table class="table table-striped table-hover" id="data-preview-table">
-                                    <thead id="data-preview-header"></thead>
-                                    <tbody id="data-preview-body"></tbody>
-                                </table>
-                            </div>
-                            
-                            <div class="mt-3">
-                                <button class="btn btn-success" id="download-btn">
-                                    <i class="fas fa-download"></i> Download Processed Data
-                                </button>
-                                <button class="btn btn-secondary" id="reset-btn">
-                                    <i class="fas fa-undo"></i> Reset to Original
-                                </button>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-                
-                <!-- Preprocessing Tab -->
-                <div class="tab-pane fade" id="preprocess" role="tabpanel" aria-labelledby="preprocess-tab">
-                    <div class="row mt-3">
-                        <!-- Missing Values -->
-                        <div class="col-md-6">
-                            <div class="card">
-                                <div class="card-body">
-                                    <h5 class="card-title">Handle Missing Values</h5>
-                                    <form id="missing-values-form">
-                                        <div class="mb-3">
-                                            <label class="form-label">Select Columns</label>
-                                            <div id="missing-columns-selection"></div>
-                                        </div>
-                                        <div class="mb-3">
-                                            <label for="missing-method" class="form-label">Method</label>
-                                            <select class="form-select" id="missing-method" required>
-                                                <option value="" selected disabled>Select method</option>
-                                                <option value="mean">Mean (numeric only)</option>
-                                                <option value="median">Median (numeric only)</option>
-                                                <option value="mode">Mode (most frequent value)</option>
-                                                <option value="constant">Fill with constant (0 or "unknown")</option>
-                                                <option value="drop_rows">Drop rows with missing values</option>
-                                            </select>
-                                        </div>
-                                        <button type="submit" class="btn btn-primary">Apply</button>
-                                    </form>
-                                    <div id="missing-values-loader" class="loader"></div>
-                                    <div id="missing-values-feedback" class="alert mt-3" style="display: none;"></div>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <!-- Normalization -->
-                        <div class="col-md-6">
-                            <div class="card">
-                                <div class="card-body">
-                                    <h5 class="card-title">Normalize Data</h5>
-                                    <form id="normalize-form">
-                                        <div class="mb-3">
-                                            <label class="form-label">Select Numeric Columns</label>
-                                            <div id="normalize-columns-selection"></div>
-                                        </div>
-                                        <div class="mb-3">
-                                            <label for="normalize-method" class="form-label">Method</label>
-                                            <select class="form-select" id="normalize-method" required>
-                                                <option value="" selected disabled>Select method</option>
-                                                <option value="minmax">Min-Max Scaling (0-1)</option>
-                                                <option value="standard">Standard Scaling (z-score)</option>
-                                                <option value="robust">Robust Scaling (using quantiles)</option>
-                                            </select>
-                                        </div>
-                                        <button type="submit" class="btn btn-primary">Apply</button>
-                                    </form>
-                                    <div id="normalize-loader" class="loader"></div>
-                                    <div id="normalize-feedback" class="alert mt-3" style="display: none;"></div>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <!-- Categorical Encoding -->
-                        <div class="col-md-6 mt-4">
-                            <div class="card">
-                                <div class="card-body">
-                                    <h5 class="card-title">Encode Categorical Data</h5>
-                                    <form id="encoding-form">
-                                        <div class="mb-3">
-                                            <label class="form-label">Select Categorical Columns</label>
-                                            <div id="categorical-columns-selection"></div>
-                                        </div>
-                                        <div class="mb-3">
-                                            <label for="encoding-method" class="form-label">Method</label>
-                                            <select class="form-select" id="encoding-method" required>
-                                                <option value="" selected disabled>Select method</option>
-                                                <option value="onehot">One-Hot Encoding</option>
-                                                <option value="label">Label Encoding</option>
-                                            </select>
-                                        </div>
-                                        <button type="submit" class="btn btn-primary">Apply</button>
-                                    </form>
-                                    <div id="encoding-loader" class="loader"></div>
-                                    <div id="encoding-feedback" class="alert mt-3" style="display: none;"></div>
-                                </div>
-                            </div>
-                        </div>
-                        
-                        <!-- Drop Columns -->
-                        <div class="col-md-6 mt-4">
-                            <div class="card">
-                                <div class="card-body">
-                                    <h5 class="card-title">Drop Columns</h5>
-                                    <form id="drop-columns-form">
-                                        <div class="mb-3">
-                                            <label class="form-label">Select Columns to Drop</label>
-                                            <div id="drop-columns-selection"></div>
-                                        </div>
-                                        <button type="submit" class="btn btn-danger">Drop Selected Columns</button>
-                                    </form>
-                                    <div id="drop-columns-loader" class="loader"></div>
-                                    <div id="drop-columns-feedback" class="alert mt-3" style="display: none;"></div>
-                                </div>
-                            </div>
-                        </div>
-                    </div>
-                </div>
-                
-                <!-- Visualization Tab -->
-                <div class="tab-pane fade" id="visualize" role="tabpanel" aria-labelledby="visualize-tab">
-                    <div class="card mt-3">
-                        <div class="card-body">
-                            <h5 class="card-title">Create Visualization</h5>
-                            <form id="visualization-form" class="row">
-                                <div class="col-md-4 mb-3">
-                                    <label for="chart-type" class="form-label">Chart Type</label>
-                                    <select class="form-select" id="chart-type" required>
-                                        <option value="" selected disabled>Select chart type</option>
-                                        <option value="bar">Bar Chart</option>
-                                        <option value="histogram">Histogram</option>
-                                        <option value="scatter">Scatter Plot</option>
-                                        <option value="box">Box Plot</option>
-                                        <option value="line">Line Chart</option>
-                                        <option value="heatmap">Correlation Heatmap</option>
-                                        <option value="pairplot">Pair Plot</option>
-                                    </select>
-                                </div>
-                                
-                                <div class="col-md-4 mb-3">
-                                    <label for="x-column" class="form-label">X-Axis Column</label>
-                                    <select class="form-select" id="x-column" required>
-                                        <option value="" selected disabled>Select column</option>
-                                    </select>
-                                </div>
-                                
-                                <div class="col-md-4 mb-3">
-                                    <label for="y-column" class="form-label">Y-Axis Column</label>
-                                    <select class="form-select" id="y-column">
-                                        <option value="" selected disabled>Select column (optional)</option>
-                                    </select>
-                                    <small class="form-text text-muted">Required for Bar, Scatter, Box, and Line charts</small>
-                                </div>
-                                
-                                <div class="col-md-8 mb-3">
-                                    <label for="chart-title" class="form-label">Chart Title</label>
-                                    <input type="text" class="form-control" id="chart-title" placeholder="Enter chart title" required>
-                                </div>
-                                
-                                <div class="col-md-4 mb-3">
-                                    <label for="hue-column" class="form-label">Color By (Hue)</label>
-                                    <select class="form-select" id="hue-column">
-                                        <option value="" selected disabled>Select column (optional)</option>
-                                    </select>
-                                </div>
-                                
-                                <div class="col-12">
-                                    <button type="submit" class="btn btn-primary">
-                                        <i class="fas fa-chart-line"></i> Create Visualization
-                                    </button>
-                                </div>
-                            </form>
-                            <div id="visualization-loader" class="loader"></div>
-                            <div id="visualization-feedback" class="alert mt-3" style="display: none;"></div>
-                        </div>
-                    </div>
-                    
-                    <!-- Visualization Gallery -->
-                    <div id="visualization-gallery"></div>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <!-- Bootstrap JS Bundle with Popper -->
-    <script src="https://cdn.jsdelivr.net/npm/bootstrap@5.3.0/dist/js/bootstrap.bundle.min.js"></script>
-    <!-- Custom JavaScript -->
-    <script src="/static/js/main.js"></script>
-</body>
-</html>
-    
-""")
-    
\ No newline at end of file
+        return {
+            "success": True,
+            "message": f"Redid {steps} preprocessing step(s).",
+            "columns": df.columns.tolist(),
+            "rows": len(df),
+            "history": history.history()
+        }
+    except OperationError as e:
+        return {"error": str(e)}
+    except Exception as e:
+        return {"error": f"Error redoing preprocessing: {str(e)}"}
+
+@app.get("/preprocess/history/")
+async def get_preprocessing_history(uploaded_file: dict = Depends(current_dataset)):
+    history = uploaded_file["history"]
+    if history is None:
+        return {"error": "No file has been uploaded yet."}
+    return {**history.history(), "success": True}
+
+@app.get("/data/sessions/")
+async def get_session_stats():
+    return {**dataset_store.stats(), "success": True}
+
+@app.get("/data/executor/")
+async def get_executor_stats():
+    return {
+        **pool_stats(),
+        "chart_cache": chart_cache.stats(),
+        "correlation_cache": correlation_cache.stats(),
+        "jobs": job_queue.stats(),
+        "ingest_cache": ingest_cache.stats(),
+        "success": True
+    }
+
+# Background jobs. Each submit endpoint returns a job id straight away; the job
+# runs once a worker slot is free and can be polled, followed as server-sent
+# events, or cancelled. Jobs are only visible to the session that submitted them.
+
+# Parse a spooled upload and store it in the session, reporting parse progress
+async def upload_job(job, session_id, path, digest, filename, out_of_core, compact, sheet):
+    size = max(os.path.getsize(path), 1)
+
+    def on_progress(snapshot):
+        # Parsing is roughly 80% of the work; chunks are about CSV_BLOCK_BYTES of input each
+        job.report("parsing", 0.8 * min(snapshot["chunks"] * CSV_BLOCK_BYTES / size, 1.0))
+
+    job.report("parsing", 0.0)
+    try:
+        df, memory, source = await compute_pool.run(
+            parse_upload, path, digest, file_extension(filename), out_of_core, compact, on_progress, sheet
+        )
+    except JobCancelled:
+        raise
+    except (UnsupportedFormatError, SheetNotFoundError) as e:
+        raise JobError(str(e))
+    except Exception as e:
+        raise JobError(f"Error processing file: {str(e)}")
+    job.report("storing", 0.8)
+    uploaded_file = await run_in_threadpool(dataset_store.get, session_id)
+    try:
+        # A cancel that arrives while storing still stops the job before it changes the session
+        return await compute_pool.run(store_upload, uploaded_file, df, filename, memory, source, job.commit)
+    finally:
+        await run_in_threadpool(dataset_store.release, session_id)
+
+async def pipeline_job(job, session_id, steps):
+    def report(number, total, step):
+        job.report(f"step {number}/{total}: {step['op']}", (number - 1) / total)
+
+    uploaded_file = await run_in_threadpool(dataset_store.get, session_id)
+    try:
+        history = uploaded_file["history"]
+        if history is None:
+            raise JobError("No file has been uploaded yet.")
+        job.report("planning", 0.0)
+        try:
+            return await compute_pool.run(pipeline_result, history, steps, report)
+        except OperationError as e:
+            raise JobError(str(e))
+    finally:
+        await run_in_threadpool(dataset_store.release, session_id)
+
+async def chart_job(job, session_id, *chart):
+    uploaded_file = await run_in_threadpool(dataset_store.get, session_id)
+    try:
+        try:
+            etag, png = await build_chart(uploaded_file, *chart, report=job.report)
+        except ChartError as e:
+            raise JobError(str(e))
+        with span("base64"):
+            image = png_data_uri(png)
+        return {"image": image, "etag": etag}
+    finally:
+        await run_in_threadpool(dataset_store.release, session_id, False)
+
+def job_response(job):
+    return {**job.snapshot(), "success": True}
+
+# The body is spooled before responding; parsing and storing happen in the job
+@app.post("/jobs/upload/")
+async def submit_upload_job(
+    file: UploadFile = File(...),
+    out_of_core: bool = False,
+    compact: bool = COMPACT_BY_DEFAULT,
+    sheet: Optional[str] = None,
+    session_id: str = Depends(resolve_session)
+):
+    try:
+        path, digest = await spool_to_disk(iter_upload(file), file.filename)
+    except UnsupportedFormatError as e:
+        return {"error": str(e)}
+    job = job_queue.submit(
+        "upload", session_id,
+        lambda job: upload_job(job, session_id, path, digest, file.filename, out_of_core, compact, sheet),
+        cleanup=lambda: os.unlink(path)
+    )
+    return job_response(job)
+
+@app.post("/jobs/pipeline/")
+async def submit_pipeline_job(spec: PipelineSpec, session_id: str = Depends(resolve_session)):
+    steps = [step.model_dump() for step in spec.steps]
+    job = job_queue.submit("pipeline", session_id, lambda job: pipeline_job(job, session_id, steps))
+    return job_response(job)
+
+@app.post("/jobs/chart/")
+async def submit_chart_job(
+    chart_type: str = Form(...),
+    x_column: str = Form(...),
+    y_column: Optional[str] = Form(None),
+    hue: Optional[str] = Form(None),
+    title: str = Form(...),
+    width: float = Form(10),
+    height: float = Form(6),
+    correlation: str = Form("pearson"),
+    session_id: str = Depends(resolve_session)
+):
+    chart = (chart_type, x_column, y_column, hue, title, (width, height), correlation)
+    job = job_queue.submit("chart", session_id, lambda job: chart_job(job, session_id, *chart))
+    return job_response(job)
+
+@app.get("/jobs/")
+async def list_jobs(session_id: str = Depends(resolve_session)):
+    return {"jobs": [job.snapshot() for job in job_queue.list(session_id)], "success": True}
+
+@app.get("/jobs/{job_id}/")
+async def get_job(job_id: str, session_id: str = Depends(resolve_session)):
+    job = job_queue.get(job_id, session_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found."}, status_code=404)
+    return job_response(job)
+
+# Server-sent events with the job's state after every change, until it finishes
+@app.get("/jobs/{job_id}/events/")
+async def get_job_events(job_id: str, session_id: str = Depends(resolve_session)):
+    job = job_queue.get(job_id, session_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found."}, status_code=404)
+    headers = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    return StreamingResponse(job_events(job), media_type="text/event-stream", headers=headers)
+
+# Queued jobs stop at once; running jobs stop at their next progress report
+@app.post("/jobs/{job_id}/cancel/")
+async def cancel_job(job_id: str, session_id: str = Depends(resolve_session)):
+    job = job_queue.get(job_id, session_id)
+    if job is None:
+        return JSONResponse({"error": "Job not found."}, status_code=404)
+    job.cancel()
+    return job_response(job)
+
+# Memory and cache gauges for /metrics
+register_collector(
+    "data_sessions", "gauge", "Dataset sessions by where their data is held.",
+    lambda: [({"state": state}, dataset_store.stats()[state]) for state in ("in_memory", "spilled")]
+)
+register_collector(
+    "data_session_memory_bytes", "gauge", "Estimated memory held by in-memory dataset sessions.",
+    dataset_store.memory_in_use
+)
+for cache_name, cache in (("chart", chart_cache), ("correlation", correlation_cache)):
+    register_collector(
+        f"data_{cache_name}_cache_bytes", "gauge", f"Bytes held by the {cache_name} cache.",
+        lambda cache=cache: cache.stats()["bytes"]
+    )
+    register_collector(
+        f"data_{cache_name}_cache_requests_total", "counter", f"Lookups in the {cache_name} cache by result.",
+        lambda cache=cache: [({"result": "hit"}, cache.stats()["hits"]), ({"result": "miss"}, cache.stats()["misses"])]
+    )
+register_collector(
+    "data_ingest_cache_bytes", "gauge", "Bytes held by the ingest cache.", lambda: ingest_cache.stats()["bytes"]
+)
+register_collector(
+    "data_ingest_cache_requests_total", "counter", "Lookups in the ingest cache by result.",
+    lambda: [({"result": "hit"}, ingest_cache.hits), ({"result": "miss"}, ingest_cache.misses)]
+)
+register_collector(
+    "data_jobs", "gauge", "Background jobs by status.",
+    lambda: [({"status": status}, count) for status, count in job_queue.stats().items()
+             if status not in ("workers", "jobs")]
+)
+
+# Import the heavy libraries (matplotlib and seaborn in the render workers,
+# sklearn in the compute pool) in the background once the server is up, so
+# startup stays fast and the first chart or scaling request does not pay for them
+WARM_UP = os.environ.get("DATA_WARM_UP", "1").lower() in ("1", "true", "yes")
+warm_up_tasks = []
+
+def warm_up_preprocessing():
+    import sklearn.preprocessing  # noqa: F401
+
+@app.on_event("startup")
+async def start_warm_up():
+    if not WARM_UP:
+        return
+    # One call per render worker, submitted together so that each worker process starts and imports
+    calls = [render_pool.run(warm_up_plotting) for _ in range(render_pool.max_workers)]
+    calls.append(compute_pool.run(warm_up_preprocessing))
+    warm_up_tasks.extend(asyncio.ensure_future(call) for call in calls)
+
+@app.on_event("shutdown")
+async def stop_executors():
+    shutdown_pools()
+    shutdown_excel_pool()
@@ -0,0 +1,468 @@
+# data_benchmark.py
+# Reproducible benchmarks for the data.py endpoints. Synthetic datasets
+# (mixed numeric / categorical columns with a configurable share of missing
+# values) are generated with a fixed seed and cached as CSV. Each endpoint is
+# driven in-process through the ASGI app, so no server or network is needed.
+#
+#   python data_benchmark.py run --rows 10000 1000000 --output results.json
+#   python data_benchmark.py compare baseline.json results.json
+#   python data_benchmark.py startup
+#   python data_benchmark.py spill
+#
+# For every dataset size and endpoint the results file records latency
+# percentiles, peak RSS while the endpoint ran (this process plus the render
+# pool's worker processes when psutil is installed) and, from one extra
+# traced call, the number of Python allocations and their peak size.
+# `compare` exits with status 1 when any endpoint got slower or bigger than
+# the threshold allows. `startup` imports data.py in fresh interpreters and
+# exits with status 1 when the import is slower than the budget, loads one of
+# the libraries that are meant to load lazily, or writes into the app directory.
+# `spill` applies a series of operations, spills the operation log to disk the
+# way the session store does, reloads it and exits with status 1 when the
+# replayed frame or the version differ from the originals.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+# Generated datasets are kept here between runs
+BENCH_DIR = os.environ.get("DATA_BENCH_DIR") or os.path.join(tempfile.gettempdir(), "data_bench")
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+# Relative slowdown (or memory growth) that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+# Seconds between RSS samples while an endpoint runs
+RSS_INTERVAL = 0.005
+SESSION_ID = "benchmark"
+# Median milliseconds allowed for `import data` in a fresh interpreter
+STARTUP_BUDGET_MS = float(os.environ.get("DATA_STARTUP_BUDGET_MS", 1500))
+# Libraries data.py must not import at startup
+LAZY_MODULES = ("matplotlib", "seaborn", "sklearn", "scipy")
+CATEGORIES = ["north", "south", "east", "west", "central", "coastal", "hill", "desert"]
+
+
+# Synthetic dataset with `numeric` float columns, `categorical` text columns
+# and about `null_ratio` of every column missing
+def make_dataset(rows: int, numeric: int = 6, categorical: int = 3, null_ratio: float = 0.05,
+                 seed: int = 0) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for i in range(numeric):
+        values = rng.normal(loc=i * 10, scale=i + 1, size=rows)
+        values[rng.random(rows) < null_ratio] = np.nan
+        columns[f"num_{i}"] = values
+    for i in range(categorical):
+        # Cardinality grows with the column index: 2, 4, 8, ... categories
+        labels = np.array(CATEGORIES[:min(2 ** (i + 1), len(CATEGORIES))], dtype=object)
+        values = labels[rng.integers(0, len(labels), size=rows)]
+        values[rng.random(rows) < null_ratio] = None
+        columns[f"cat_{i}"] = values
+    return pd.DataFrame(columns)
+
+
+# Path of the cached CSV for a dataset, generating it on first use
+def dataset_path(rows: int, numeric: int, categorical: int, null_ratio: float, seed: int = 0) -> str:
+    os.makedirs(BENCH_DIR, exist_ok=True)
+    name = f"bench_{rows}r_{numeric}n_{categorical}c_{null_ratio:g}null_{seed}s.csv"
+    path = os.path.join(BENCH_DIR, name)
+    if not os.path.exists(path):
+        partial = path + ".partial"
+        make_dataset(rows, numeric, categorical, null_ratio, seed).to_csv(partial, index=False)
+        os.replace(partial, path)
+    return path
+
+
+def _rss() -> int:
+    if psutil is not None:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+# Samples RSS on a background thread and keeps the highest value seen
+class PeakRSS:
+    def __enter__(self):
+        self.start = self.peak = _rss()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(RSS_INTERVAL):
+            self.peak = max(self.peak, _rss())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, _rss())
+
+
+def _percentiles(latencies: list) -> dict:
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 3),
+        "p90": round(float(np.percentile(values, 90)), 3),
+        "p99": round(float(np.percentile(values, 99)), 3),
+        "mean": round(float(values.mean()), 3),
+        "min": round(float(values.min()), 3),
+        "max": round(float(values.max()), 3),
+    }
+
+
+def _error(response) -> str:
+    if response.status_code >= 400:
+        return f"HTTP {response.status_code}"
+    if response.headers.get("content-type", "").startswith("application/json"):
+        body = response.json()
+        if isinstance(body, dict) and "error" in body:
+            return body["error"]
+    return None
+
+
+# Benchmarked endpoints: (name, request builder, reset after each call).
+# A request builder takes the dataset path and the iteration number and
+# returns the arguments for client.request. Chart titles include the
+# iteration so every call renders instead of hitting the chart cache.
+def _upload(path, i):
+    return "POST", "/upload/", {"files": {"file": (os.path.basename(path), open(path, "rb"), "text/csv")}}
+
+
+# Upload with an empty ingest cache, so the file is parsed every time
+def _upload_uncached(path, i):
+    from data_ingest_cache import ingest_cache
+    ingest_cache.clear()
+    return _upload(path, i)
+
+
+ENDPOINTS = [
+    ("upload", _upload_uncached, False),
+    ("upload_cached", _upload, False),
+    ("handle_missing", lambda path, i: ("POST", "/preprocess/handle-missing/", {
+        "data": {"columns": ["num_0", "num_1", "cat_0"], "method": "mode"}}), True),
+    ("normalize", lambda path, i: ("POST", "/preprocess/normalize/", {
+        "data": {"columns": ["num_0", "num_1", "num_2"], "method": "standard"}}), True),
+    ("encode_label", lambda path, i: ("POST", "/preprocess/encode-categorical/", {
+        "data": {"columns": ["cat_0", "cat_1"], "method": "label"}}), True),
+    ("encode_onehot", lambda path, i: ("POST", "/preprocess/encode-categorical/", {
+        "data": {"columns": ["cat_1", "cat_2"], "method": "onehot"}}), True),
+    ("drop_columns", lambda path, i: ("POST", "/preprocess/drop-columns/", {
+        "data": {"columns": ["num_5"]}}), True),
+    ("chart_histogram", lambda path, i: ("POST", "/visualization/create/", {
+        "data": {"chart_type": "histogram", "x_column": "num_0", "title": f"histogram {i}"}}), False),
+    ("chart_scatter", lambda path, i: ("POST", "/visualization/create/", {
+        "data": {"chart_type": "scatter", "x_column": "num_0", "y_column": "num_1", "title": f"scatter {i}"}}), False),
+    ("chart_heatmap", lambda path, i: ("POST", "/visualization/create/", {
+        "data": {"chart_type": "heatmap", "x_column": "num_0", "title": f"heatmap {i}"}}), False),
+    ("download", lambda path, i: ("GET", "/data/download/", {}), False),
+]
+
+
+async def _call(client, request):
+    method, url, kwargs = request
+    try:
+        return await client.request(method, url, **kwargs)
+    finally:
+        # Uploads hand over an open file
+        for value in kwargs.get("files", {}).values():
+            value[1].close()
+
+
+async def _bench_endpoint(client, path, name, build, reset, iterations, warmup):
+    for i in range(warmup):
+        await _call(client, build(path, i))
+        if reset:
+            await client.post("/preprocess/reset/")
+
+    latencies = []
+    errors = []
+    with PeakRSS() as rss:
+        for i in range(warmup, warmup + iterations):
+            request = build(path, i)
+            started = time.perf_counter()
+            response = await _call(client, request)
+            latencies.append(time.perf_counter() - started)
+            error = _error(response)
+            if error:
+                errors.append(error)
+            if reset:
+                await client.post("/preprocess/reset/")
+
+    # One more call under tracemalloc, kept out of the latencies since tracing slows it down
+    tracemalloc.start()
+    response = await _call(client, build(path, warmup + iterations))
+    snapshot = tracemalloc.take_snapshot()
+    _, traced_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    if reset:
+        await client.post("/preprocess/reset/")
+    blocks = sum(stat.count for stat in snapshot.statistics("filename"))
+
+    return {
+        "endpoint": name,
+        "iterations": iterations,
+        "latency_ms": _percentiles(latencies),
+        "peak_rss_mb": round(rss.peak / 1024 ** 2, 2),
+        "rss_growth_mb": round((rss.peak - rss.start) / 1024 ** 2, 2),
+        "allocations": {"live_blocks": blocks, "peak_traced_mb": round(traced_peak / 1024 ** 2, 2)},
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+    }
+
+
+async def _bench_dataset(app, path, endpoints, iterations, warmup):
+    # Exceptions in the app become 500 responses, counted as errors
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    headers = {"X-Session-ID": SESSION_ID}
+    results = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", headers=headers,
+                                 timeout=None) as client:
+        # Every other endpoint works on the uploaded dataset
+        request = _upload(path, 0)
+        response = await _call(client, request)
+        if _error(response):
+            print(f"  initial upload reported an error: {_error(response)}", file=sys.stderr)
+        for name, build, reset in ENDPOINTS:
+            if endpoints and name not in endpoints:
+                continue
+            results.append(await _bench_endpoint(client, path, name, build, reset, iterations, warmup))
+            print(f"  {name:<16} p50 {results[-1]['latency_ms']['p50']:>10.1f} ms  "
+                  f"peak RSS {results[-1]['peak_rss_mb']:>8.1f} MB  errors {results[-1]['errors']}",
+                  file=sys.stderr)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(rows=DEFAULT_ROWS, numeric=6, categorical=3, null_ratio=0.05, iterations=5, warmup=1,
+                   endpoints=None) -> dict:
+    if httpx is None:
+        raise RuntimeError("The benchmark needs httpx (pip install httpx).")
+    # Imported here so generating data does not start the app's worker pools
+    import data
+
+    runs = []
+    try:
+        for n in rows:
+            path = dataset_path(n, numeric, categorical, null_ratio)
+            print(f"{n} rows ({os.path.getsize(path) / 1024 ** 2:.1f} MB CSV)", file=sys.stderr)
+            results = asyncio.run(_bench_dataset(data.app, path, endpoints, iterations, warmup))
+            data.dataset_store.drop(SESSION_ID)
+            dataset = {"rows": n, "numeric": numeric, "categorical": categorical, "null_ratio": null_ratio}
+            runs.extend({"dataset": dataset, **result} for result in results)
+    finally:
+        data.shutdown_pools()
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "iterations": iterations,
+            "warmup": warmup,
+        },
+        "results": runs,
+    }
+
+
+# Endpoints whose p50 latency or peak RSS grew by more than `threshold`
+# between two results files
+def compare_results(baseline: dict, current: dict, threshold: float = DEFAULT_THRESHOLD) -> list:
+    def key(result):
+        return (result["dataset"]["rows"], result["dataset"]["null_ratio"], result["endpoint"])
+
+    before = {key(result): result for result in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        for metric, old_value, new_value in (
+            ("p50_ms", old["latency_ms"]["p50"], result["latency_ms"]["p50"]),
+            ("p99_ms", old["latency_ms"]["p99"], result["latency_ms"]["p99"]),
+            ("peak_rss_mb", old["peak_rss_mb"], result["peak_rss_mb"]),
+        ):
+            change = (new_value - old_value) / old_value if old_value else 0.0
+            rows.append({
+                "rows": result["dataset"]["rows"],
+                "endpoint": result["endpoint"],
+                "metric": metric,
+                "baseline": old_value,
+                "current": new_value,
+                "change": round(change, 4),
+                "regression": change > threshold,
+            })
+    return rows
+
+
+_IMPORT_PROBE = """
+import json, sys, time
+started = time.perf_counter()
+import data
+elapsed = time.perf_counter() - started
+print(json.dumps({"ms": elapsed * 1000, "modules": [m for m in sys.argv[1:] if m in sys.modules]}))
+"""
+
+
+def _tree_state(root: str) -> dict:
+    state = {}
+    for directory in (root, os.path.join(root, "templates"), os.path.join(root, "static")):
+        for entry in os.scandir(directory):
+            if entry.is_file():
+                state[entry.path] = entry.stat().st_mtime_ns
+    return state
+
+
+# Time `import data` in `runs` fresh interpreters
+def measure_startup(runs: int = 5, root: str = os.path.dirname(os.path.abspath(__file__))) -> dict:
+    before = _tree_state(root)
+    timings = []
+    loaded = set()
+    for _ in range(runs):
+        output = subprocess.run([sys.executable, "-c", _IMPORT_PROBE, *LAZY_MODULES], cwd=root,
+                                capture_output=True, text=True, check=True).stdout
+        probe = json.loads(output.strip().splitlines()[-1])
+        timings.append(probe["ms"])
+        loaded.update(probe["modules"])
+    after = _tree_state(root)
+    return {
+        "import_ms": {"median": round(float(np.median(timings)), 1), "min": round(min(timings), 1),
+                      "max": round(max(timings), 1)},
+        "budget_ms": STARTUP_BUDGET_MS,
+        "eager_modules": sorted(loaded),
+        "files_written": sorted(path for path in after if before.get(path) != after[path]),
+    }
+
+
+# Operations whose fitted parameters hold values JSON has no type for
+SPILL_OPERATIONS = [
+    ("encode-categorical", {"columns": ["day", "cat_0"], "method": "onehot"}),
+    ("handle-missing", {"columns": ["num_0", "num_1"], "method": "median"}),
+    ("normalize", {"columns": ["num_0"], "method": "minmax"}),
+    ("encode-categorical", {"columns": ["cat_2"], "method": "onehot", "max_categories": 3}),
+    ("encode-categorical", {"columns": ["cat_1"], "method": "label"}),
+]
+
+
+# Spill an operation log, reload it and compare it with the original
+def check_spill_roundtrip(rows: int = 1000) -> dict:
+    from data_oplog import OperationLog
+    from data_store import _read_frame, _write_frame
+
+    df = make_dataset(rows)
+    df["day"] = pd.Timestamp("2024-01-01") + pd.to_timedelta(np.arange(rows) % 7, unit="D")
+    log = OperationLog(df)
+    for name, params in SPILL_OPERATIONS:
+        log.apply(name, **params)
+    before, version = log.current(), log.version
+    with tempfile.TemporaryDirectory() as directory:
+        log.spill_to(directory, _write_frame)
+        log.reload_from(directory, _read_frame)
+        after = log.current()
+    try:
+        pd.testing.assert_frame_equal(before, after)
+        mismatch = None
+    except AssertionError as e:
+        mismatch = str(e)
+    return {"rows": rows, "operations": len(SPILL_OPERATIONS), "frame_mismatch": mismatch,
+            "version_changed": log.version != version}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the data preprocessing endpoints.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="run the benchmarks and write a results file")
+    run.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    run.add_argument("--numeric", type=int, default=6)
+    run.add_argument("--categorical", type=int, default=3)
+    run.add_argument("--null-ratio", type=float, default=0.05)
+    run.add_argument("--iterations", type=int, default=5)
+    run.add_argument("--warmup", type=int, default=1)
+    run.add_argument("--endpoints", nargs="+", choices=[name for name, _, _ in ENDPOINTS])
+    run.add_argument("--output", default="benchmark_results.json")
+
+    compare = commands.add_parser("compare", help="flag regressions between two results files")
+    compare.add_argument("baseline")
+    compare.add_argument("current")
+    compare.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    startup = commands.add_parser("startup", help="check how long importing data.py takes")
+    startup.add_argument("--runs", type=int, default=5)
+
+    spill = commands.add_parser("spill", help="check that a spilled session replays to the same data")
+    spill.add_argument("--rows", type=int, default=1000)
+
+    args = parser.parse_args(argv)
+    if args.command == "startup":
+        result = measure_startup(args.runs)
+        print(json.dumps(result, indent=2))
+        failed = (result["import_ms"]["median"] > STARTUP_BUDGET_MS or result["eager_modules"]
+                  or result["files_written"])
+        return 1 if failed else 0
+
+    if args.command == "spill":
+        result = check_spill_roundtrip(args.rows)
+        print(json.dumps(result, indent=2))
+        return 1 if result["frame_mismatch"] or result["version_changed"] else 0
+
+    if args.command == "run":
+        if args.numeric < 6 or args.categorical < 3:
+            parser.error("the endpoints use at least 6 numeric and 3 categorical columns")
+        results = run_benchmarks(args.rows, args.numeric, args.categorical, args.null_ratio,
+                                 args.iterations, args.warmup, args.endpoints)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    rows = compare_results(baseline, current, args.threshold)
+    for row in rows:
+        flag = "REGRESSION" if row["regression"] else ""
+        print(f"{row['rows']:>10} {row['endpoint']:<16} {row['metric']:<12} "
+              f"{row['baseline']:>12.2f} -> {row['current']:>12.2f} ({row['change']:+.1%}) {flag}")
+    return 1 if any(row["regression"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
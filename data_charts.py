@@ -0,0 +1,167 @@
+# data_charts.py
+# Chart rendering for data.py. render_chart runs in the render process pool,
+# so this module only imports what plotting needs and everything it takes
+# and returns must be picklable. matplotlib and seaborn are imported by the
+# first render rather than with the module, which keeps them out of the web
+# process entirely when rendering happens in worker processes.
+import base64
+from io import BytesIO
+
+import numpy as np
+
+CHART_TYPES = ("bar", "histogram", "scatter", "box", "line", "heatmap", "pairplot")
+
+# Heatmaps wider than this are drawn without the value in each cell
+ANNOTATE_MAX_COLUMNS = 20
+
+# Chart types that need a y-axis column, with the name used in the error message
+REQUIRES_Y = {"bar": "bar chart", "scatter": "scatter plot", "line": "line chart"}
+
+
+class ChartError(ValueError):
+    pass
+
+
+# Cheap checks done before any data is shipped to a render worker
+def validate_chart(chart_type, y_column):
+    if chart_type not in CHART_TYPES:
+        raise ChartError(f"Unsupported chart type: {chart_type}")
+    if chart_type in REQUIRES_Y and not y_column:
+        raise ChartError(f"Y-axis column is required for {REQUIRES_Y[chart_type]}.")
+
+
+# Only the columns a chart reads are sent to the render worker. Heatmaps
+# get a correlation matrix and pairplots pick their columns from one
+# (see data_correlation), so neither goes through here.
+def chart_columns(df, chart_type, x_column, y_column, hue):
+    return list(dict.fromkeys(col for col in (x_column, y_column, hue) if col))
+
+
+def _plotting():
+    import matplotlib
+    matplotlib.use('Agg')  # Use non-interactive backend
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt, sns
+
+
+# Import the plotting libraries ahead of the first chart (see data.py startup)
+def warm_up():
+    _plotting()
+
+
+def _encode_png(figure) -> bytes:
+    buf = BytesIO()
+    figure.savefig(buf, format="png")
+    return buf.getvalue()
+
+
+def png_data_uri(png: bytes) -> str:
+    img_str = base64.b64encode(png).decode('utf-8')
+    return f"data:image/png;base64,{img_str}"
+
+
+# Render a chart and return the PNG bytes
+def render_chart(df, chart_type, x_column, y_column, hue, title, figsize=(10, 6)) -> bytes:
+    plt, sns = _plotting()
+    if chart_type == "pairplot":
+        # For pairplot, create a new figure with seaborn directly
+        numeric_cols = list(df.columns)
+        g = sns.pairplot(df, hue=hue if hue in numeric_cols else None)
+        try:
+            # Save the pairplot figure
+            return _encode_png(g)
+        finally:
+            plt.close(g.fig)
+
+    # Create figure
+    figure = plt.figure(figsize=figsize)
+    try:
+        # Create appropriate plot based on chart type
+        if chart_type == "bar":
+            sns.barplot(x=x_column, y=y_column, hue=hue, data=df)
+        elif chart_type == "histogram":
+            sns.histplot(df[x_column], kde=True)
+        elif chart_type == "scatter":
+            sns.scatterplot(x=x_column, y=y_column, hue=hue, data=df)
+        elif chart_type == "box":
+            sns.boxplot(x=x_column, y=y_column, hue=hue, data=df)
+        elif chart_type == "line":
+            sns.lineplot(x=x_column, y=y_column, hue=hue, data=df)
+
+        # Set title
+        plt.title(title)
+        plt.tight_layout()
+        return _encode_png(figure)
+    finally:
+        plt.close(figure)
+
+
+# Render a precomputed correlation matrix as a heatmap. Cell labels are only
+# drawn while they stay readable; on wide matrices they dominate render time.
+def render_correlation(corr, title, figsize=(10, 6)) -> bytes:
+    plt, sns = _plotting()
+    figure = plt.figure(figsize=figsize)
+    try:
+        sns.heatmap(corr, annot=len(corr) <= ANNOTATE_MAX_COLUMNS, cmap="coolwarm", vmin=-1, vmax=1)
+        plt.title(title)
+        plt.tight_layout()
+        return _encode_png(figure)
+    finally:
+        plt.close(figure)
+
+
+# Render a chart from the summary built by data_downsample.aggregate_chart
+def render_aggregated(summary, chart_type, x_column, y_column, hue, title, figsize=(10, 6)) -> bytes:
+    plt, sns = _plotting()
+    from matplotlib.colors import LogNorm
+
+    figure = plt.figure(figsize=figsize)
+    try:
+        if chart_type == "line":
+            # Points are already averaged and downsampled: draw them as-is
+            sns.lineplot(x=x_column, y=y_column, hue=hue, data=summary, estimator=None, errorbar=None)
+        elif chart_type == "scatter" and isinstance(summary, dict) and "levels" in summary:
+            # Occupied bins of each hue level as points in the level's colour,
+            # more opaque where the level is denser
+            x_edges, y_edges = summary["x_edges"], summary["y_edges"]
+            x_centers, y_centers = (x_edges[:-1] + x_edges[1:]) / 2, (y_edges[:-1] + y_edges[1:]) / 2
+            palette = sns.color_palette(n_colors=len(summary["levels"]))
+            peak = np.log1p(max((counts.max() for counts in summary["level_counts"]), default=1))
+            for level, counts, color in zip(summary["levels"], summary["level_counts"], palette):
+                i, j = np.nonzero(counts)
+                alpha = 0.25 + 0.75 * np.log1p(counts[i, j]) / max(peak, 1e-12)
+                plt.scatter(x_centers[i], y_centers[j], s=12, color=color, alpha=alpha, label=str(level),
+                            edgecolors="none")
+            plt.legend(title=hue)
+            plt.xlabel(x_column)
+            plt.ylabel(y_column)
+        elif chart_type == "scatter" and isinstance(summary, dict):
+            counts = np.ma.masked_equal(summary["counts"].T, 0)
+            mesh = plt.pcolormesh(summary["x_edges"], summary["y_edges"], counts, norm=LogNorm(), cmap="viridis")
+            plt.colorbar(mesh, label="count")
+            plt.xlabel(x_column)
+            plt.ylabel(y_column)
+        elif chart_type == "scatter":
+            sns.scatterplot(x=x_column, y=y_column, hue=hue, data=summary)
+        elif chart_type == "bar":
+            # One row per group, so there is nothing left to bootstrap
+            sns.barplot(x=x_column, y=y_column, hue=hue, data=summary, errorbar=None)
+        elif chart_type == "histogram" and "edges" in summary:
+            edges = summary["edges"]
+            plt.stairs(summary["counts"], edges, fill=True, alpha=0.6)
+            if "kde_x" in summary:
+                plt.plot(summary["kde_x"], summary["kde_y"])
+            plt.xlabel(x_column)
+            plt.ylabel("Count")
+        elif chart_type == "histogram":
+            plt.bar(summary["labels"], summary["counts"])
+            plt.xlabel(x_column)
+            plt.ylabel("Count")
+
+        # Set title
+        plt.title(title)
+        plt.tight_layout()
+        return _encode_png(figure)
+    finally:
+        plt.close(figure)
@@ -0,0 +1,75 @@
+# data_compact.py
+# Optional dtype compaction for freshly parsed uploads:
+#  - integers are downcast to the smallest signed type that holds them
+#  - floats become float32 when that loses nothing (e.g. integer columns
+#    with missing values)
+#  - low-cardinality text becomes category; other text becomes an
+#    Arrow-backed string column where pandas does not already use one
+# Nullable integer dtypes are deliberately not used: mean/median fills and
+# the sklearn scalers do not accept them.
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    infer_dtype, is_bool_dtype, is_float_dtype, is_integer_dtype, is_object_dtype, is_string_dtype
+)
+
+try:
+    import pyarrow  # noqa: F401 (needed for string[pyarrow])
+    HAVE_PYARROW = True
+except ImportError:
+    HAVE_PYARROW = False
+
+# Compact uploads unless the request says otherwise
+COMPACT_BY_DEFAULT = os.environ.get("DATA_COMPACT_DTYPES", "0").lower() in ("1", "true", "yes")
+# Text columns with at most this share of distinct values become category
+CATEGORY_RATIO = float(os.environ.get("DATA_CATEGORY_RATIO", 0.5))
+
+
+def _compact_column(series: pd.Series) -> pd.Series:
+    if is_bool_dtype(series) or isinstance(series.dtype, pd.CategoricalDtype):
+        return series
+    if is_integer_dtype(series):
+        return pd.to_numeric(series, downcast="integer")
+    if is_float_dtype(series):
+        if series.dtype == np.float32:
+            return series
+        narrow = series.astype(np.float32)
+        # Only when every value survives the round trip (NaN compares unequal, so mask it)
+        if (narrow.astype(np.float64) == series)[series.notna()].all():
+            return narrow
+        return series
+    if is_object_dtype(series) or is_string_dtype(series):
+        if infer_dtype(series, skipna=True) not in ("string", "empty"):
+            # Mixed values have no single compact representation
+            return series
+        values = series.dropna()
+        if len(values) and values.nunique() <= CATEGORY_RATIO * len(values):
+            return series.astype("category")
+        if is_object_dtype(series) and HAVE_PYARROW:
+            return series.astype("string[pyarrow]")
+    return series
+
+
+# Returns the compacted frame and a per-column memory report
+def compact_frame(df: pd.DataFrame):
+    columns = {}
+    compacted = {}
+    for col in df.columns:
+        before = int(df[col].memory_usage(deep=True, index=False))
+        series = _compact_column(df[col])
+        compacted[col] = series
+        columns[col] = {
+            "dtype_before": str(df[col].dtype),
+            "dtype_after": str(series.dtype),
+            "bytes_before": before,
+            "bytes_after": int(series.memory_usage(deep=True, index=False)),
+        }
+    result = pd.DataFrame(compacted, index=df.index)
+    return result, {
+        "columns": columns,
+        "total_bytes_before": sum(c["bytes_before"] for c in columns.values()),
+        "total_bytes_after": sum(c["bytes_after"] for c in columns.values()),
+    }
+
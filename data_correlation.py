@@ -0,0 +1,105 @@
+# data_correlation.py
+# Correlation matrices over the numeric columns of a dataset, for the heatmap
+# and pairplot charts and /data/correlation/. Matrices are computed with a
+# few NumPy matrix products (pairwise-complete, like DataFrame.corr) and
+# cached per dataset version, so repeated charts of the same data only pay
+# for drawing.
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from data_cache import LRUCache
+
+CORRELATION_METHODS = ("pearson", "spearman")
+# Memory for cached matrices (a 200-column matrix is 320 KB)
+CORRELATION_CACHE_MB = float(os.environ.get("DATA_CORRELATION_CACHE_MB", 64))
+# Columns drawn in a pairplot, picked by strongest correlation
+PAIRPLOT_COLUMNS = int(os.environ.get("DATA_PAIRPLOT_COLUMNS", 5))
+# Rows drawn in each pairplot scatter
+PAIRPLOT_SAMPLE_ROWS = int(os.environ.get("DATA_PAIRPLOT_SAMPLE_ROWS", 5000))
+
+correlation_cache = LRUCache(CORRELATION_CACHE_MB * 1024 * 1024, sizeof=lambda corr: corr.values.nbytes)
+
+
+class CorrelationError(ValueError):
+    pass
+
+
+def numeric_columns(df: pd.DataFrame) -> list:
+    return [col for col in df.columns if is_numeric_dtype(df[col])]
+
+
+def _pearson(values: np.ndarray) -> np.ndarray:
+    valid = ~np.isnan(values)
+    # Centering first keeps the sums below from cancelling catastrophically
+    with np.errstate(invalid="ignore", divide="ignore"):
+        centered = values - np.nanmean(values, axis=0)
+    if valid.all():
+        cov = centered.T @ centered
+        norms = np.sqrt(np.diag(cov))
+        with np.errstate(invalid="ignore", divide="ignore"):
+            corr = cov / np.outer(norms, norms)
+    else:
+        # Pairwise-complete sums: entry [i, j] only uses rows where both columns have a value
+        mask = valid.astype(np.float64)
+        filled = np.where(valid, centered, 0.0)
+        count = mask.T @ mask
+        sum_x = filled.T @ mask
+        sum_xx = (filled ** 2).T @ mask
+        sum_xy = filled.T @ filled
+        with np.errstate(invalid="ignore", divide="ignore"):
+            cov = sum_xy - sum_x * sum_x.T / count
+            var_x = sum_xx - sum_x ** 2 / count
+            corr = cov / np.sqrt(var_x * var_x.T)
+        corr[count < 1] = np.nan
+    corr = np.clip(corr, -1.0, 1.0)
+    diagonal = np.diag(corr).copy()
+    diagonal[np.isfinite(diagonal)] = 1.0
+    np.fill_diagonal(corr, diagonal)
+    return corr
+
+
+# Correlation of every numeric column with every other. Spearman is Pearson
+# over each column's ranks (ranked once per column rather than per pair).
+def correlation_matrix(df: pd.DataFrame, method: str = "pearson") -> pd.DataFrame:
+    if method not in CORRELATION_METHODS:
+        raise CorrelationError(f"Unsupported correlation method '{method}'. Use pearson or spearman.")
+    columns = numeric_columns(df)
+    if len(columns) < 2:
+        raise CorrelationError("At least two numeric columns are needed for a correlation matrix.")
+    numeric = df[columns]
+    if method == "spearman":
+        numeric = numeric.rank()
+    values = np.column_stack([numeric[col].to_numpy(dtype=np.float64, na_value=np.nan) for col in columns])
+    return pd.DataFrame(_pearson(values), index=columns, columns=columns)
+
+
+def cached_correlation(version: str, df: pd.DataFrame, method: str = "pearson") -> pd.DataFrame:
+    key = (version, method)
+    corr = correlation_cache.get(key)
+    if corr is None:
+        corr = correlation_matrix(df, method)
+        correlation_cache.put(key, corr)
+    return corr
+
+
+# The n columns taking part in the strongest correlations, in dataset order
+def top_correlated(corr: pd.DataFrame, n: int = PAIRPLOT_COLUMNS) -> list:
+    strength = corr.abs().to_numpy(copy=True)
+    rows, cols = np.triu_indices(len(strength), 1)
+    pairs = np.nan_to_num(strength[rows, cols], nan=-1.0)
+    chosen = []
+    for k in np.argsort(-pairs, kind="stable"):
+        for position in (rows[k], cols[k]):
+            if position not in chosen and len(chosen) < n:
+                chosen.append(position)
+        if len(chosen) >= n:
+            break
+    return [corr.columns[position] for position in sorted(chosen)]
+
+
+# Fixed-seed row sample, so the same version always draws the same chart
+def sample_rows(df: pd.DataFrame, n: int = PAIRPLOT_SAMPLE_ROWS) -> pd.DataFrame:
+    return df if len(df) <= n else df.sample(n=n, random_state=0)
@@ -0,0 +1,164 @@
+# data_downsample.py
+# Pre-aggregation for charts over large datasets. Above AGGREGATE_ROWS rows
+# the chart is drawn from a small summary computed with pandas / NumPy
+# instead of handing every row to seaborn:
+#  - line: per-x means, then Largest-Triangle-Three-Buckets downsampling
+#  - scatter: 2D histogram density, one per hue level (a fixed-seed sample for
+#    non-numeric axes or a hue with too many levels)
+#  - bar: precomputed group means (no bootstrap confidence intervals)
+#  - histogram: bin counts from np.histogram, with the KDE overlay evaluated
+#    from the bins
+# Runs in the compute pool; the result is small enough to ship to a render worker.
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype, is_numeric_dtype
+
+# Charts over more rows than this are pre-aggregated
+AGGREGATE_ROWS = int(os.environ.get("DATA_AGGREGATE_ROWS", 50_000))
+# Points kept per line chart (shared between hue groups)
+LINE_POINTS = int(os.environ.get("DATA_LINE_POINTS", 2000))
+# Bins per axis for scatter density
+DENSITY_BINS = int(os.environ.get("DATA_DENSITY_BINS", 200))
+# Rows sampled for scatter plots whose axes cannot be binned
+SCATTER_SAMPLE = int(os.environ.get("DATA_SCATTER_SAMPLE", 20_000))
+# Upper bound on histogram bins
+MAX_HISTOGRAM_BINS = int(os.environ.get("DATA_MAX_HISTOGRAM_BINS", 100))
+# Hue levels a scatter density is split into; more levels are sampled instead
+MAX_DENSITY_HUES = int(os.environ.get("DATA_MAX_DENSITY_HUES", 10))
+# Points the histogram's KDE curve is evaluated at
+KDE_POINTS = 200
+
+AGGREGATED_CHARTS = ("line", "scatter", "bar", "histogram")
+
+
+def should_aggregate(df: pd.DataFrame, chart_type: str) -> bool:
+    return chart_type in AGGREGATED_CHARTS and len(df) > AGGREGATE_ROWS
+
+
+def _as_float(series: pd.Series) -> np.ndarray:
+    if is_datetime64_any_dtype(series):
+        return series.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype(np.float64)
+    return series.to_numpy(dtype=np.float64)
+
+
+# Indices of the points kept by Largest-Triangle-Three-Buckets. x must be sorted.
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    every = (n - 2) / (n_out - 2)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0] = 0
+    a = 0
+    for i in range(n_out - 2):
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        # Average of the next bucket (the last point for the final bucket)
+        next_end = min(int((i + 2) * every) + 1, n)
+        next_start = min(end, n - 1)
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[n - 1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[n - 1]
+
+        # Pick the point forming the largest triangle with the previous pick and that average
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        kept[i + 1] = a
+    kept[-1] = n - 1
+    return kept
+
+
+def _aggregate_line(df, x_column, y_column, hue):
+    keys = list(dict.fromkeys([hue, x_column] if hue else [x_column]))
+    # seaborn draws the mean of y at each x, so average duplicates first
+    means = df.groupby(keys, observed=True, sort=True)[y_column].mean().reset_index()
+    if not (is_numeric_dtype(means[x_column]) or is_datetime64_any_dtype(means[x_column])):
+        return means
+
+    groups = [group for _, group in means.groupby(hue, observed=True)] if hue else [means]
+    points = max(LINE_POINTS // max(len(groups), 1), 3)
+    parts = []
+    for group in groups:
+        group = group.dropna(subset=[x_column, y_column])
+        kept = lttb_indices(_as_float(group[x_column]), _as_float(group[y_column]), points)
+        parts.append(group.iloc[kept])
+    return pd.concat(parts, ignore_index=True) if parts else means
+
+
+def _aggregate_scatter(df, x_column, y_column, hue):
+    levels = None
+    if hue:
+        levels = df[hue].dropna().unique()
+        # A hue like a continuous measure has too many levels to split by
+        if len(levels) > MAX_DENSITY_HUES:
+            levels = None
+        else:
+            levels = sorted(levels.tolist(), key=None if is_numeric_dtype(df[hue]) else str)
+    binnable = is_numeric_dtype(df[x_column]) and is_numeric_dtype(df[y_column])
+    if binnable and (not hue or levels is not None):
+        values = df[list(dict.fromkeys([x_column, y_column] + ([hue] if hue else [])))].dropna()
+        x = values[x_column].to_numpy(dtype=np.float64)
+        y = values[y_column].to_numpy(dtype=np.float64)
+        counts, x_edges, y_edges = np.histogram2d(x, y, bins=DENSITY_BINS)
+        summary = {"counts": counts, "x_edges": x_edges, "y_edges": y_edges}
+        if hue:
+            # One density per hue level over the same bins, like seaborn's one colour per level
+            column = values[hue].to_numpy()
+            summary["levels"] = levels
+            summary["level_counts"] = [
+                np.histogram2d(x[column == level], y[column == level], bins=[x_edges, y_edges])[0] for level in levels
+            ]
+        return summary
+    # Categorical axes cannot be binned; a fixed seed keeps the image stable for the cache
+    return df.sample(n=min(SCATTER_SAMPLE, len(df)), random_state=0)
+
+
+def _aggregate_bar(df, x_column, y_column, hue):
+    keys = list(dict.fromkeys([x_column, hue] if hue else [x_column]))
+    return df.groupby(keys, observed=True, sort=True)[y_column].mean().reset_index()
+
+
+def _aggregate_histogram(df, x_column):
+    series = df[x_column].dropna()
+    if not is_numeric_dtype(series):
+        counts = series.value_counts(sort=False)
+        return {"labels": counts.index.astype(str).tolist(), "counts": counts.to_numpy()}
+
+    values = series.to_numpy(dtype=np.float64)
+    edges = np.histogram_bin_edges(values, bins="auto")
+    if len(edges) - 1 > MAX_HISTOGRAM_BINS:
+        edges = np.histogram_bin_edges(values, bins=MAX_HISTOGRAM_BINS)
+    counts, edges = np.histogram(values, bins=edges)
+    return {"counts": counts, "edges": edges, **_histogram_kde(values, counts, edges)}
+
+
+# The KDE curve seaborn's histplot(kde=True) draws: a Gaussian KDE with
+# Scott's bandwidth over the data range, scaled to counts. The kernel sum runs
+# over the bin centres weighted by their counts instead of over every value.
+def _histogram_kde(values: np.ndarray, counts: np.ndarray, edges: np.ndarray) -> dict:
+    total = counts.sum()
+    std = values.std(ddof=1) if len(values) > 1 else 0.0
+    if total < 2 or not std > 0:
+        return {}
+    bandwidth = std * total ** (-1 / 5)
+    centers = (edges[:-1] + edges[1:]) / 2
+    grid = np.linspace(edges[0], edges[-1], KDE_POINTS)
+    kernel = np.exp(-0.5 * ((grid[:, None] - centers[None, :]) / bandwidth) ** 2) / (bandwidth * np.sqrt(2 * np.pi))
+    density = kernel @ counts / total
+    # Counts per bin: density times the number of values times the bin width
+    return {"kde_x": grid, "kde_y": density * total * np.diff(edges).mean()}
+
+
+# Summarize a frame for one of AGGREGATED_CHARTS
+def aggregate_chart(df, chart_type, x_column, y_column, hue):
+    if chart_type == "line":
+        return _aggregate_line(df, x_column, y_column, hue)
+    if chart_type == "scatter":
+        return _aggregate_scatter(df, x_column, y_column, hue)
+    if chart_type == "bar":
+        return _aggregate_bar(df, x_column, y_column, hue)
+    if chart_type == "histogram":
+        return _aggregate_histogram(df, x_column)
+    raise ValueError(f"Chart type '{chart_type}' cannot be aggregated.")
@@ -0,0 +1,149 @@
+# data_executor.py
+# Executor layer that keeps heavy work off the asyncio event loop.
+#  - "compute": a thread pool for pandas / NumPy / sklearn work, which releases the GIL
+#  - "render": a process pool for matplotlib, whose global pyplot state is not thread-safe
+# Every pool tracks its queue depth and latency so they can be exposed by the app.
+# Executors are created on first use and dropped by shutdown_pools(), so an app
+# started again in the same process (a second lifespan) gets fresh ones.
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+
+from metrics import register_collector, span
+
+COMPUTE_WORKERS = int(os.environ.get("DATA_COMPUTE_WORKERS", min(8, os.cpu_count() or 1)))
+# Set to 0 to render in the compute pool instead, serialized by a lock
+RENDER_WORKERS = int(os.environ.get("DATA_RENDER_WORKERS", 2))
+# Number of recent latencies kept per pool for percentiles
+LATENCY_WINDOW = 1000
+
+
+def _percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+class InstrumentedPool:
+    # make_executor() creates the executor; with shared_with the pool runs on
+    # that pool's executor instead of owning one
+    def __init__(self, name, make_executor, max_workers, serialize=False, shared_with=None):
+        self.name = name
+        self._make_executor = make_executor
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._shared_with = shared_with
+        self.max_workers = max_workers
+        # Serialize calls when the work itself is not thread-safe (matplotlib in threads)
+        self._serial_lock = threading.Lock() if serialize else None
+        self._stats_lock = threading.Lock()
+        self.pending = 0
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+    @property
+    def executor(self):
+        if self._shared_with is not None:
+            return self._shared_with.executor
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = self._make_executor()
+            return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        call = partial(fn, *args, **kwargs)
+        if self._serial_lock is not None:
+            call = partial(_run_locked, self._serial_lock, call)
+
+        # Recorded as a request stage named after the pool and the function, e.g. "render:render_chart"
+        stage = f"{self.name}:{getattr(fn, '__name__', type(fn).__name__)}"
+        started = time.perf_counter()
+        with self._stats_lock:
+            self.pending += 1
+            self.submitted += 1
+        try:
+            with span(stage):
+                return await loop.run_in_executor(self.executor, call)
+        except BaseException:
+            with self._stats_lock:
+                self.failed += 1
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._stats_lock:
+                self.pending -= 1
+                self.completed += 1
+                self.latencies.append(elapsed)
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            latencies = list(self.latencies)
+            return {
+                "workers": self.max_workers,
+                "in_flight": self.pending,
+                # Calls waiting for a free worker
+                "queue_depth": max(self.pending - self.max_workers, 0),
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "latency_p50_ms": round(_percentile(latencies, 0.50) * 1000, 3),
+                "latency_p95_ms": round(_percentile(latencies, 0.95) * 1000, 3),
+                "latency_max_ms": round(max(latencies, default=0.0) * 1000, 3),
+            }
+
+    # Stop the executor; the next call creates a new one
+    def shutdown(self):
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _run_locked(lock, call):
+    with lock:
+        return call()
+
+
+compute_pool = InstrumentedPool(
+    "compute",
+    partial(ThreadPoolExecutor, max_workers=COMPUTE_WORKERS, thread_name_prefix="data-compute"),
+    COMPUTE_WORKERS,
+)
+
+if RENDER_WORKERS > 0:
+    # spawn keeps workers from inheriting the server's threads and open sockets
+    render_pool = InstrumentedPool(
+        "render",
+        partial(ProcessPoolExecutor, max_workers=RENDER_WORKERS, mp_context=multiprocessing.get_context("spawn")),
+        RENDER_WORKERS,
+    )
+else:
+    render_pool = InstrumentedPool("render", None, 1, serialize=True, shared_with=compute_pool)
+
+
+def pool_stats() -> dict:
+    return {pool.name: pool.stats() for pool in (compute_pool, render_pool)}
+
+
+register_collector(
+    "executor_in_flight", "gauge", "Calls submitted to an executor pool and not finished yet.",
+    lambda: [({"pool": name}, stats["in_flight"]) for name, stats in pool_stats().items()]
+)
+register_collector(
+    "executor_queue_depth", "gauge", "Calls waiting for a free executor worker.",
+    lambda: [({"pool": name}, stats["queue_depth"]) for name, stats in pool_stats().items()]
+)
+
+
+def shutdown_pools():
+    render_pool.shutdown()
+    compute_pool.shutdown()
@@ -0,0 +1,188 @@
+# data_export.py
+# Streaming export of the preprocessed frame. Each writer is a generator that
+# encodes EXPORT_CHUNK_ROWS rows at a time, so the first bytes go out
+# immediately and memory does not depend on the size of the dataset.
+# Out-of-core datasets (data_outofcore.ParquetFrame) are exported one row
+# group at a time.
+import os
+import zlib
+from urllib.parse import quote
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc as pa_ipc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet and Arrow exports need pyarrow
+    pa = None
+
+EXPORT_CHUNK_ROWS = int(os.environ.get("DATA_EXPORT_CHUNK_ROWS", 50_000))
+
+# format -> (file extension, media type)
+EXPORT_FORMATS = {
+    "csv": ("csv", "text/csv"),
+    "csv.gz": ("csv.gz", "application/gzip"),
+    "parquet": ("parquet", "application/vnd.apache.parquet"),
+    "arrow": ("arrow", "application/vnd.apache.arrow.stream"),
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+# Sparse one-hot columns are written out dense, one chunk at a time
+def _dense(chunk: pd.DataFrame) -> pd.DataFrame:
+    sparse = {col: dtype.subtype for col, dtype in chunk.dtypes.items() if isinstance(dtype, pd.SparseDtype)}
+    return chunk.astype(sparse) if sparse else chunk
+
+
+def _row_chunks(df: pd.DataFrame, chunk_rows: int):
+    if hasattr(df, "iter_chunks"):
+        yield from df.iter_chunks()
+        return
+    for start in range(0, len(df), chunk_rows):
+        yield _dense(df.iloc[start:start + chunk_rows])
+
+
+def iter_csv(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    if len(df) == 0:
+        yield df.head(0).to_csv(index=False).encode()
+        return
+    for i, chunk in enumerate(_row_chunks(df, chunk_rows)):
+        yield chunk.to_csv(index=False, header=(i == 0)).encode()
+
+
+def iter_csv_gzip(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    # wbits=31 writes a gzip header and trailer around the deflate stream
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for data in iter_csv(df, chunk_rows):
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# File-like object that pyarrow writes into and the generator drains after each chunk
+class _DrainableSink:
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+        self.closed = False
+
+    def write(self, data):
+        data = bytes(data)
+        self._parts.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+# One schema for every chunk, taken from the whole frame: columns with a
+# numeric, datetime, categorical or string dtype map to the same Arrow type in
+# every chunk, and object columns are inferred chunk by chunk and unified, so
+# a column that is all-null or all-integer in the first chunk does not lock
+# the export to a type later rows do not fit. Object columns mixing
+# incompatible values (numbers and text) are exported as strings.
+def _arrow_schema(df: pd.DataFrame, chunk_rows: int):
+    if hasattr(df, "iter_tables"):
+        return df.schema
+    schema = pa.Schema.from_pandas(_dense(df.head(0)), preserve_index=False)
+    objects = [name for name, dtype in df.dtypes.items() if dtype == object]
+    for name in objects:
+        types = set()
+        for start in range(0, len(df), chunk_rows):
+            values = df[name].iloc[start:start + chunk_rows].dropna()
+            if not len(values):
+                continue
+            try:
+                types.add(pa.array(values, from_pandas=True).type)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                types = {pa.string()}
+                break
+        try:
+            inferred = pa.unify_schemas([pa.schema([(name, t)]) for t in types],
+                                        promote_options="permissive").field(name).type if types else pa.string()
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            inferred = pa.string()
+        i = schema.get_field_index(name)
+        schema = schema.set(i, schema.field(i).with_type(inferred))
+    return schema
+
+
+def _arrow_tables(df: pd.DataFrame, schema, chunk_rows: int):
+    if hasattr(df, "iter_tables"):
+        yield from df.iter_tables()
+        return
+    for chunk in _row_chunks(df, chunk_rows):
+        try:
+            yield pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # Mixed object columns exported as strings: convert their values here
+            text = [field.name for field in schema
+                    if pa.types.is_string(field.type) and chunk[field.name].dtype == object]
+            chunk = chunk.assign(**{name: chunk[name].map(lambda v: v if pd.isna(v) else str(v)) for name in text})
+            yield pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+
+
+def iter_parquet(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    schema = _arrow_schema(df, chunk_rows)
+    sink = _DrainableSink()
+    # Each chunk becomes one row group
+    with pq.ParquetWriter(sink, schema) as writer:
+        for table in _arrow_tables(df, schema, chunk_rows):
+            writer.write_table(table)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def iter_arrow(df: pd.DataFrame, chunk_rows: int = EXPORT_CHUNK_ROWS):
+    schema = _arrow_schema(df, chunk_rows)
+    sink = _DrainableSink()
+    with pa_ipc.new_stream(sink, schema) as writer:
+        for table in _arrow_tables(df, schema, chunk_rows):
+            writer.write_table(table)
+            yield sink.drain()
+    yield sink.drain()
+
+
+WRITERS = {
+    "csv": iter_csv,
+    "csv.gz": iter_csv_gzip,
+    "parquet": iter_parquet,
+    "arrow": iter_arrow,
+}
+
+
+# Returns (byte iterator, download filename, media type) for a frame
+def export_stream(df: pd.DataFrame, filename: str, export_format: str):
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unsupported export format '{export_format}'. Use one of: {', '.join(EXPORT_FORMATS)}.")
+    if export_format in ("parquet", "arrow") and pa is None:
+        raise ExportError(f"Exporting to {export_format} requires pyarrow to be installed.")
+
+    extension, media_type = EXPORT_FORMATS[export_format]
+    stem = os.path.splitext(os.path.basename(filename or "data"))[0]
+    download_name = f"preprocessed_{stem}.{extension}"
+    return WRITERS[export_format](df), download_name, media_type
+
+
+# ASCII filename for old clients plus the RFC 5987 UTF-8 form
+def content_disposition(filename: str) -> str:
+    fallback = filename.encode("ascii", "replace").decode().replace('"', "").replace("\\", "")
+    fallback = fallback.replace("\r", "").replace("\n", "")
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
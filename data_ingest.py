@@ -0,0 +1,315 @@
+# data_ingest.py
+# Streaming ingestion for data.py: uploads are spooled to disk in chunks and
+# parsed incrementally, so peak memory is one chunk plus the final frame.
+# The bytes are hashed while they are spooled (see data_ingest_cache).
+import hashlib
+import multiprocessing
+import os
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Optional
+
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+try:
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow is optional, fall back to the pandas chunked reader
+    pa = None
+    pa_csv = None
+    pq = None
+
+# Bytes pulled from the upload stream per read
+SPOOL_CHUNK_BYTES = int(os.environ.get("DATA_SPOOL_CHUNK_BYTES", 1024 * 1024))
+# Bytes parsed per CSV block when using the Arrow reader
+CSV_BLOCK_BYTES = int(os.environ.get("DATA_CSV_BLOCK_BYTES", 8 * 1024 * 1024))
+# Rows parsed per CSV chunk when using the pandas reader
+CSV_CHUNK_ROWS = int(os.environ.get("DATA_CSV_CHUNK_ROWS", 100_000))
+# Rows per Parquet row group when converting uploads for out-of-core mode
+PARQUET_ROW_GROUP_ROWS = int(os.environ.get("DATA_PARQUET_ROW_GROUP_ROWS", 250_000))
+# Directory used for spooled uploads (defaults to the system temp dir)
+SPOOL_DIR = os.environ.get("DATA_SPOOL_DIR") or None
+# Worker processes parsing the sheets of a workbook in parallel
+EXCEL_WORKERS = int(os.environ.get("DATA_EXCEL_WORKERS", min(4, os.cpu_count() or 1)))
+# Smaller workbooks are parsed sheet by sheet in the calling thread, where
+# starting worker processes would cost more than it saves
+EXCEL_PARALLEL_MIN_BYTES = int(os.environ.get("DATA_EXCEL_PARALLEL_MIN_BYTES", 2 * 1024 * 1024))
+
+SUPPORTED_EXTENSIONS = ("csv", "xls", "xlsx")
+
+
+class UnsupportedFormatError(ValueError):
+    pass
+
+
+def file_extension(filename: str) -> str:
+    return filename.split('.')[-1].lower()
+
+
+def is_excel(path: str) -> bool:
+    return file_extension(path) in ("xls", "xlsx")
+
+
+# Copy an async byte stream (UploadFile or request.stream()) to a temp file on
+# disk. Returns the file's path and a hash of its contents.
+async def spool_to_disk(chunks, filename: str):
+    extension = file_extension(filename)
+    if extension not in SUPPORTED_EXTENSIONS:
+        raise UnsupportedFormatError("Unsupported file format. Please upload CSV or Excel files.")
+
+    digest = hashlib.blake2b(digest_size=20)
+    spool = tempfile.NamedTemporaryFile(delete=False, suffix="." + extension, dir=SPOOL_DIR)
+    try:
+        async for chunk in chunks:
+            digest.update(chunk)
+            spool.write(chunk)
+    except BaseException:
+        spool.close()
+        os.unlink(spool.name)
+        raise
+    spool.close()
+    return spool.name, digest.hexdigest()
+
+
+# Async iterator over an UploadFile in fixed size chunks
+async def iter_upload(file, chunk_size: int = SPOOL_CHUNK_BYTES):
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
+
+
+# Running summary of everything parsed so far
+class IngestProgress:
+    def __init__(self):
+        self.rows = 0
+        self.chunks = 0
+        self.column_types = {}
+        self.missing_values = {}
+
+    def update(self, columns, dtypes_numeric, null_counts, rows):
+        self.rows += rows
+        self.chunks += 1
+        for col, numeric, nulls in zip(columns, dtypes_numeric, null_counts):
+            # A column stays numeric only if every chunk parsed as numeric
+            if numeric and self.column_types.get(col, "numeric") == "numeric":
+                self.column_types[col] = "numeric"
+            else:
+                self.column_types[col] = "categorical"
+            self.missing_values[col] = self.missing_values.get(col, 0) + int(nulls)
+
+    def snapshot(self) -> dict:
+        return {
+            "rows": self.rows,
+            "chunks": self.chunks,
+            "column_types": dict(self.column_types),
+            "missing_values": dict(self.missing_values),
+        }
+
+
+def _iter_pandas_chunks(path: str, progress: IngestProgress) -> Iterator[pd.DataFrame]:
+    for chunk in pd.read_csv(path, chunksize=CSV_CHUNK_ROWS):
+        progress.update(
+            chunk.columns,
+            [is_numeric_dtype(chunk[col]) for col in chunk.columns],
+            chunk.isna().sum().tolist(),
+            len(chunk),
+        )
+        yield chunk
+
+
+def _is_temporal(arrow_type) -> bool:
+    return pa.types.is_date(arrow_type) or pa.types.is_time(arrow_type) or pa.types.is_timestamp(arrow_type)
+
+
+# Arrow CSV reader that types columns the way pd.read_csv does.
+# strings_can_be_null matches pandas, which treats empty fields as NaN. Arrow
+# also infers dates, times and timestamps, which pandas leaves as text: the
+# reader is opened once to see the inferred schema (from the first block
+# only), then again with those columns read as strings.
+def _open_arrow_csv(path: str):
+    read_options = pa_csv.ReadOptions(block_size=CSV_BLOCK_BYTES)
+    reader = pa_csv.open_csv(path, read_options=read_options,
+                             convert_options=pa_csv.ConvertOptions(strings_can_be_null=True))
+    temporal = {field.name: pa.string() for field in reader.schema if _is_temporal(field.type)}
+    if not temporal:
+        return reader
+    reader.close()
+    return pa_csv.open_csv(path, read_options=read_options,
+                           convert_options=pa_csv.ConvertOptions(strings_can_be_null=True, column_types=temporal))
+
+
+def _iter_arrow_batches(path: str, progress: IngestProgress):
+    reader = _open_arrow_csv(path)
+    for batch in reader:
+        progress.update(
+            batch.schema.names,
+            [pa.types.is_integer(f.type) or pa.types.is_floating(f.type) or pa.types.is_decimal(f.type)
+             for f in batch.schema],
+            [column.null_count for column in batch.columns],
+            batch.num_rows,
+        )
+        yield batch
+
+
+def _frame_summary(df: pd.DataFrame) -> dict:
+    progress = IngestProgress()
+    progress.update(
+        df.columns,
+        [is_numeric_dtype(df[col]) for col in df.columns],
+        df.isna().sum().tolist(),
+        len(df),
+    )
+    return progress.snapshot()
+
+
+def excel_sheets(path: str) -> list:
+    with pd.ExcelFile(path) as book:
+        return [str(name) for name in book.sheet_names]
+
+
+# Parse a spooled file, calling on_progress after every chunk. Workbooks are
+# read from `sheet` (default: the first sheet).
+# Returns the final frame and the summary gathered while parsing.
+def read_spooled(path: str, on_progress: Optional[Callable[[dict], None]] = None, sheet: Optional[str] = None):
+    extension = file_extension(path)
+    progress = IngestProgress()
+    reported = 0
+
+    if extension in ("xls", "xlsx"):
+        # Excel has no chunked reader, but reading from disk avoids holding the raw bytes too
+        df = pd.read_excel(path, sheet_name=sheet if sheet is not None else 0)
+        summary = _frame_summary(df)
+        if on_progress:
+            on_progress(summary)
+        return df, summary
+
+    if pa_csv is not None:
+        try:
+            batches = []
+            for batch in _iter_arrow_batches(path, progress):
+                batches.append(batch)
+                if on_progress:
+                    on_progress(progress.snapshot())
+            table = pa.Table.from_batches(batches, schema=batches[0].schema) if batches else None
+            del batches
+            if table is not None:
+                # self_destruct releases each Arrow buffer as soon as it is converted
+                return table.to_pandas(split_blocks=True, self_destruct=True), progress.snapshot()
+        except pa.ArrowInvalid:
+            # Type inference only looks at the first block; when a later block
+            # disagrees, re-read the spooled file with the more forgiving pandas
+            # parser. The re-read reports progress again only once it gets past
+            # the rows already reported, so progress never goes backwards.
+            reported = progress.rows
+            progress = IngestProgress()
+
+    chunks = []
+    for chunk in _iter_pandas_chunks(path, progress):
+        chunks.append(chunk)
+        if on_progress and progress.rows > reported:
+            on_progress(progress.snapshot())
+    if not chunks:
+        return pd.read_csv(path), progress.snapshot()
+    return pd.concat(chunks, ignore_index=True), progress.snapshot()
+
+
+
+def write_parquet(df: pd.DataFrame, out_path: str, row_group_rows: int = PARQUET_ROW_GROUP_ROWS):
+    if pq is None:
+        raise UnsupportedFormatError("Writing Parquet requires pyarrow to be installed.")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), out_path, row_group_size=row_group_rows)
+
+
+# Convert a spooled file to Parquet without ever holding more than one row
+# group in memory (out-of-core mode). Returns the summary gathered while parsing.
+def convert_to_parquet(path: str, out_path: str, on_progress: Optional[Callable[[dict], None]] = None,
+                       row_group_rows: int = PARQUET_ROW_GROUP_ROWS, sheet: Optional[str] = None):
+    if pq is None or pa_csv is None:
+        raise UnsupportedFormatError("Out-of-core mode requires pyarrow to be installed.")
+    progress = IngestProgress()
+
+    if file_extension(path) in ("xls", "xlsx"):
+        # Excel has no chunked reader; the parsed sheet is written out and released
+        df, summary = read_spooled(path, on_progress, sheet)
+        write_parquet(df, out_path, row_group_rows)
+        return summary
+
+    writer = None
+    pending, pending_rows = [], 0
+    try:
+        # The Arrow reader infers column types from the first block; a later
+        # block that disagrees fails the conversion instead of silently
+        # changing a column's type between row groups
+        for batch in _iter_arrow_batches(path, progress):
+            if writer is None:
+                writer = pq.ParquetWriter(out_path, batch.schema)
+            pending.append(batch)
+            pending_rows += batch.num_rows
+            if pending_rows >= row_group_rows:
+                writer.write_table(pa.Table.from_batches(pending), row_group_size=pending_rows)
+                pending, pending_rows = [], 0
+            if on_progress:
+                on_progress(progress.snapshot())
+        if pending:
+            writer.write_table(pa.Table.from_batches(pending), row_group_size=pending_rows)
+    finally:
+        if writer is not None:
+            writer.close()
+    if writer is None:
+        raise ValueError("The uploaded file contains no data.")
+    return progress.snapshot()
+
+
+_excel_pool = None
+_excel_pool_lock = threading.Lock()
+
+
+def _excel_executor() -> ProcessPoolExecutor:
+    global _excel_pool
+    with _excel_pool_lock:
+        if _excel_pool is None:
+            # spawn keeps workers from inheriting the server's threads and open sockets
+            _excel_pool = ProcessPoolExecutor(max_workers=EXCEL_WORKERS,
+                                              mp_context=multiprocessing.get_context("spawn"))
+        return _excel_pool
+
+
+def shutdown_excel_pool():
+    global _excel_pool
+    with _excel_pool_lock:
+        if _excel_pool is not None:
+            _excel_pool.shutdown(wait=False, cancel_futures=True)
+            _excel_pool = None
+
+
+# Parse one sheet into a Parquet file. Runs in an Excel worker process, so
+# only the small summary and profile travel back, not the frame. Returns None
+# when the sheet cannot be stored as Parquet (mixed-type columns, or no pyarrow).
+def _sheet_to_parquet(path: str, sheet: str, out_path: str):
+    from data_profile import profile_frame
+
+    if pq is None:
+        return None
+    df = pd.read_excel(path, sheet_name=sheet)
+    try:
+        write_parquet(df, out_path)
+    except (pa.ArrowException, TypeError, ValueError):
+        return None
+    return _frame_summary(df), profile_frame(df)
+
+
+# Parse several sheets of a workbook into Parquet files, in parallel worker
+# processes when the workbook is large enough. `sheets` maps sheet name to
+# output path. Returns {sheet: (summary, profile) or None}.
+def sheets_to_parquet(path: str, sheets: dict) -> dict:
+    if len(sheets) > 1 and EXCEL_WORKERS > 1 and os.path.getsize(path) >= EXCEL_PARALLEL_MIN_BYTES:
+        executor = _excel_executor()
+        futures = {sheet: executor.submit(_sheet_to_parquet, path, sheet, out_path)
+                   for sheet, out_path in sheets.items()}
+        return {sheet: future.result() for sheet, future in futures.items()}
+    return {sheet: _sheet_to_parquet(path, sheet, out_path) for sheet, out_path in sheets.items()}
@@ -0,0 +1,300 @@
+# data_ingest_cache.py
+# Disk cache of parsed uploads, keyed by a hash of the uploaded bytes (taken
+# by spool_to_disk while the upload streams in). Each entry is the dataset as
+# Parquet plus a small JSON file with its column profile, so uploading the
+# same file again reads Parquet instead of parsing CSV or Excel and skips
+# profiling too. Workbooks get one entry per sheet, all parsed on the first
+# upload (in parallel worker processes), plus an entry listing the sheets so
+# another sheet can be picked without uploading the file again.
+# The cache is bounded by total size; the least recently used entries go first.
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Optional
+
+import pandas as pd
+
+from data_ingest import (
+    convert_to_parquet, excel_sheets, is_excel, read_spooled, sheets_to_parquet, write_parquet
+)
+from data_json import dumps
+from data_profile import profile_frame
+
+# Where parsed uploads are kept
+INGEST_CACHE_DIR = os.environ.get("DATA_INGEST_CACHE_DIR") or os.path.join(tempfile.gettempdir(), "data_ingest_cache")
+# Total size of the cache in megabytes (0 disables it)
+INGEST_CACHE_MB = float(os.environ.get("DATA_INGEST_CACHE_MB", 2048))
+# Reserved files left behind by a crashed parse are removed after this many seconds
+_STALE_TMP_SECONDS = 3600
+
+
+class IngestCacheMiss(LookupError):
+    pass
+
+
+class SheetNotFoundError(LookupError):
+    pass
+
+
+class IngestCache:
+    def __init__(self, directory=INGEST_CACHE_DIR, max_mb=INGEST_CACHE_MB):
+        self.directory = directory
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.directory, key + suffix)
+
+    # Metadata of a cached entry (with the Parquet file's path under "path",
+    # if it has one), or None. A hit marks the entry as recently used.
+    def get(self, key: str) -> Optional[dict]:
+        meta_path = self._path(key, ".json")
+        try:
+            with open(meta_path, "rb") as f:
+                meta = json.loads(f.read())
+            if meta.get("parquet"):
+                meta["path"] = self._path(key, ".parquet")
+                os.utime(meta["path"])
+            os.utime(meta_path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return meta
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key, ".json"))
+
+    # A fresh path inside the cache directory to write a Parquet file to
+    def reserve(self) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        return os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}.parquet")
+
+    # Move a reserved Parquet file (or None, for a metadata-only entry) into
+    # the cache under `key`, then evict down to the size budget. Returns the
+    # Parquet file's path in the cache, or None when there is no file or it is
+    # larger than the whole budget: such a file is not cached and stays at
+    # tmp_path, for the caller to use and discard.
+    def put(self, key: str, meta: dict, tmp_path: Optional[str] = None) -> Optional[str]:
+        os.makedirs(self.directory, exist_ok=True)
+        path = None
+        if tmp_path is not None:
+            if os.path.getsize(tmp_path) > self.max_bytes:
+                return None
+            path = self._path(key, ".parquet")
+            os.replace(tmp_path, path)
+        meta_tmp = os.path.join(self.directory, f".tmp-{uuid.uuid4().hex}.json")
+        with open(meta_tmp, "wb") as f:
+            f.write(dumps({**meta, "parquet": tmp_path is not None}))
+        # The metadata is written last: an entry only exists once it is complete
+        os.replace(meta_tmp, self._path(key, ".json"))
+        self._evict()
+        return path
+
+    def discard(self, tmp_path: str):
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+
+    # {key: (bytes, last used)} for every entry on disk
+    def _entries(self) -> dict:
+        entries = {}
+        try:
+            names = os.listdir(self.directory)
+        except OSError:
+            return entries
+        now = time.time()
+        for name in names:
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if name.startswith(".tmp-"):
+                if now - stat.st_mtime > _STALE_TMP_SECONDS:
+                    self.discard(path)
+                continue
+            key, _ = os.path.splitext(name)
+            size, used = entries.get(key, (0, 0.0))
+            entries[key] = (size + stat.st_size, max(used, stat.st_mtime))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = self._entries()
+            total = sum(size for size, _ in entries.values())
+            for key, (size, _) in sorted(entries.items(), key=lambda item: item[1][1]):
+                if total <= self.max_bytes:
+                    break
+                # Metadata first, so a concurrent get() never sees a half-removed entry
+                for suffix in (".json", ".parquet"):
+                    self.discard(self._path(key, suffix))
+                total -= size
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries():
+                for suffix in (".json", ".parquet"):
+                    self.discard(self._path(key, suffix))
+
+    def stats(self) -> dict:
+        entries = self._entries()
+        return {
+            "entries": len(entries),
+            "bytes": sum(size for size, _ in entries.values()),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+ingest_cache = IngestCache()
+
+
+def _sheet_key(digest: str, extension: str, index: int) -> str:
+    return f"{digest}.{extension}.{index}"
+
+
+def _pick_sheet(sheets: list, sheet: Optional[str]) -> int:
+    if sheet is None:
+        return 0
+    if sheet not in sheets:
+        raise SheetNotFoundError(f"Sheet '{sheet}' not found. Available sheets: {', '.join(sheets)}.")
+    return sheets.index(sheet)
+
+
+# The sheets of a workbook, listed once and cached with its entries
+def _workbook_sheets(path: Optional[str], digest: str, extension: str) -> list:
+    key = f"{digest}.{extension}"
+    meta = ingest_cache.get(key)
+    if meta is not None:
+        return meta["sheets"]
+    if path is None:
+        raise IngestCacheMiss("The workbook is no longer cached. Upload it again to pick another sheet.")
+    sheets = excel_sheets(path)
+    ingest_cache.put(key, {"sheets": sheets})
+    return sheets
+
+
+# Parse every sheet of the workbook that is not cached yet, in parallel.
+# Sheets Parquet cannot store (mixed-type columns) are left uncached.
+def _cache_sheets(path: str, digest: str, extension: str, sheets: list):
+    missing = {
+        sheet: ingest_cache.reserve() for index, sheet in enumerate(sheets)
+        if not ingest_cache.contains(_sheet_key(digest, extension, index))
+    }
+    try:
+        parsed = sheets_to_parquet(path, missing)
+    except BaseException:
+        for tmp_path in missing.values():
+            ingest_cache.discard(tmp_path)
+        raise
+    for sheet, result in parsed.items():
+        if result is None:
+            ingest_cache.discard(missing[sheet])
+            continue
+        summary, profile = result
+        if ingest_cache.put(_sheet_key(digest, extension, sheets.index(sheet)),
+                            {"summary": summary, "profile": profile}, missing[sheet]) is None:
+            # Larger than the whole cache
+            ingest_cache.discard(missing[sheet])
+
+
+# Parse a spooled upload (`path`, whose bytes hash to `digest`) through the
+# cache; with path=None the upload must already be cached. Returns a dict with
+#  - "parquet": the cached Parquet file, or None when it could not be cached
+#  - "temporary": whether "parquet" is an uncached file (too large for the
+#    cache) that the caller discards once it has used it
+#  - "frame": the parsed frame when it was parsed just now and is in memory
+#  - "profile": the column profile, when known without reading the data
+#  - "key": identifies the parsed dataset (upload and sheet)
+#  - "cached": whether the upload was parsed before
+#  - "sheets" and "sheet": for workbooks, the sheets and the one picked
+def ingest_upload(path: Optional[str], digest: str, extension: str, sheet: Optional[str] = None,
+                  out_of_core: bool = False, on_progress=None) -> dict:
+    result = {"parquet": None, "temporary": False, "frame": None, "profile": None, "cached": False,
+              "sheets": None, "sheet": None}
+
+    if is_excel("." + extension):
+        sheets = _workbook_sheets(path, digest, extension)
+        index = _pick_sheet(sheets, sheet)
+        key = _sheet_key(digest, extension, index)
+        result.update(key=key, sheets=sheets, sheet=sheets[index])
+        meta = ingest_cache.get(key)
+        result["cached"] = meta is not None
+        if meta is None:
+            if path is None:
+                raise IngestCacheMiss(f"Sheet '{sheets[index]}' is not cached. Upload the workbook again to pick it.")
+            _cache_sheets(path, digest, extension, sheets)
+            meta = ingest_cache.get(key)
+        if meta is None:
+            # The sheet could not be stored as Parquet
+            result["frame"], summary = read_spooled(path, on_progress, sheets[index])
+            return result
+        if on_progress:
+            on_progress(meta["summary"])
+        result.update(parquet=meta["path"], profile=meta["profile"])
+        return result
+
+    key = f"{digest}.{extension}"
+    result["key"] = key
+    meta = ingest_cache.get(key)
+    if meta is not None:
+        if on_progress:
+            on_progress(meta["summary"])
+        result.update(parquet=meta["path"], profile=meta["profile"], cached=True)
+        return result
+    if path is None:
+        raise IngestCacheMiss("The upload is no longer cached. Upload it again.")
+
+    tmp_path = ingest_cache.reserve()
+    if out_of_core:
+        try:
+            summary = convert_to_parquet(path, tmp_path, on_progress)
+        except BaseException:
+            ingest_cache.discard(tmp_path)
+            raise
+        cached = ingest_cache.put(key, {"summary": summary, "profile": None}, tmp_path)
+        result.update(parquet=cached or tmp_path, temporary=cached is None)
+        return result
+
+    df, summary = read_spooled(path, on_progress)
+    profile = profile_frame(df)
+    result.update(frame=df, profile=profile)
+    try:
+        write_parquet(df, tmp_path)
+    except Exception:
+        # Frames Parquet cannot store (mixed-type object columns) are not cached
+        ingest_cache.discard(tmp_path)
+        return result
+    if ingest_cache.put(key, {"summary": summary, "profile": profile}, tmp_path) is None:
+        ingest_cache.discard(tmp_path)
+    return result
+
+
+# The frame of a cached upload, with its profile while that still describes
+# the frame read back from Parquet
+def read_cached(result: dict):
+    df = pd.read_parquet(result["parquet"])
+    profile = result["profile"]
+    if profile is not None:
+        columns = profile["columns"]
+        if list(columns) != df.columns.tolist() or any(
+                columns[col]["dtype"] != str(dtype) for col, dtype in df.dtypes.items()):
+            profile = None
+    return df, profile
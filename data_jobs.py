@@ -0,0 +1,212 @@
+# data_jobs.py
+# Background jobs for long data.py operations (uploads, pipeline runs,
+# charts). Submitting returns a job id at once; at most JOB_WORKERS jobs run
+# at a time and the rest wait in FIFO order. Jobs report a stage and a
+# progress fraction that clients poll or follow as server-sent events.
+# Cancellation is cooperative: a job stops at its next report() call, or when
+# it tries to commit its changes to the session through commit(), so a
+# cancelled job never leaves the session changed. Jobs still running when the
+# event loop shuts down are cancelled the same way: they are marked cancelled
+# and their worker threads stop before committing. Finished jobs are dropped
+# after JOB_RESULT_TTL.
+import asyncio
+import os
+import threading
+import time
+import uuid
+
+from data_json import dumps
+
+# Jobs running at the same time
+JOB_WORKERS = int(os.environ.get("DATA_JOB_WORKERS", 2))
+# Seconds a finished job (and its result) is kept
+JOB_RESULT_TTL = float(os.environ.get("DATA_JOB_RESULT_TTL", 600))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+FINISHED = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    pass
+
+
+# Raised by job functions for failures whose message is shown to the client
+class JobError(Exception):
+    pass
+
+
+class Job:
+    def __init__(self, kind: str, session_id: str, loop):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.status = QUEUED
+        self.stage = "queued"
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.task = None
+        # Set once commit() has changed the session
+        self.committed = False
+        self._cancel_requested = threading.Event()
+        self._lock = threading.Lock()
+        self._loop = loop
+        # Set whenever the job changes, for event subscribers
+        self.changed = asyncio.Event()
+
+    # Called by the job (from any thread) to publish its stage and progress.
+    # Raises JobCancelled once cancellation has been requested.
+    def report(self, stage: str, progress: float = None):
+        if self._cancel_requested.is_set():
+            raise JobCancelled()
+        with self._lock:
+            self.stage = stage
+            if progress is not None:
+                self.progress = max(0.0, min(float(progress), 1.0))
+        self._notify()
+
+    # Run `apply()` (from any thread) unless cancellation was requested.
+    # Holding the lock keeps a cancel from landing between the check and the
+    # change, so a job is either cancelled or committed, never both.
+    def commit(self, apply):
+        with self._lock:
+            if self._cancel_requested.is_set():
+                raise JobCancelled()
+            result = apply()
+            self.committed = True
+            return result
+
+    def _request_cancel(self) -> bool:
+        with self._lock:
+            self._cancel_requested.set()
+            return self.committed
+
+    def cancel(self):
+        self._request_cancel()
+        # A queued job has not started, so it can be stopped right away
+        if self.status == QUEUED and self.task is not None:
+            self.task.cancel()
+
+    def _set(self, **fields):
+        with self._lock:
+            for name, value in fields.items():
+                setattr(self, name, value)
+        self._notify()
+
+    def _notify(self):
+        try:
+            in_loop = asyncio.get_running_loop() is self._loop
+        except RuntimeError:
+            in_loop = False
+        if in_loop:
+            self.changed.set()
+        else:
+            self._loop.call_soon_threadsafe(self.changed.set)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            info = {
+                "job_id": self.id,
+                "kind": self.kind,
+                "status": self.status,
+                "stage": self.stage,
+                "progress": round(self.progress, 4),
+                "created": self.created,
+                "started": self.started,
+                "finished": self.finished,
+            }
+            if self.status == DONE:
+                info["result"] = self.result
+            if self.error is not None:
+                info["error"] = self.error
+            return info
+
+
+class JobQueue:
+    def __init__(self, workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL):
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._jobs = {}
+        self._slots = None
+
+    # Start `work(job)` (a coroutine function) in the background. `cleanup()`
+    # runs once the job has finished, however it finished.
+    def submit(self, kind: str, session_id: str, work, cleanup=None) -> Job:
+        self._expire()
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        job = Job(kind, session_id, asyncio.get_running_loop())
+        self._jobs[job.id] = job
+        job.task = asyncio.ensure_future(self._run(job, work, cleanup))
+        return job
+
+    # A job belonging to `session_id`, or None
+    def get(self, job_id: str, session_id: str):
+        self._expire()
+        job = self._jobs.get(job_id)
+        if job is None or job.session_id != session_id:
+            return None
+        return job
+
+    def list(self, session_id: str) -> list:
+        self._expire()
+        return [job for job in self._jobs.values() if job.session_id == session_id]
+
+    def stats(self) -> dict:
+        self._expire()
+        counts = {status: 0 for status in (QUEUED, RUNNING, DONE, FAILED, CANCELLED)}
+        for job in self._jobs.values():
+            counts[job.status] += 1
+        return {"workers": self.workers, "jobs": len(self._jobs), **counts}
+
+    async def _run(self, job: Job, work, cleanup=None):
+        try:
+            async with self._slots:
+                if job._cancel_requested.is_set():
+                    raise JobCancelled()
+                job._set(status=RUNNING, stage="starting", started=time.time())
+                result = await work(job)
+            job._set(status=DONE, stage="done", progress=1.0, result=result, finished=time.time())
+        except JobCancelled:
+            job._set(status=CANCELLED, stage="cancelled", finished=time.time())
+        except asyncio.CancelledError:
+            # The task was cancelled (the loop is shutting down) while its work
+            # may still run in a thread; stop that work before it commits
+            if job._request_cancel():
+                job._set(status=DONE, stage="done", progress=1.0, finished=time.time())
+            else:
+                job._set(status=CANCELLED, stage="cancelled", finished=time.time())
+        except JobError as e:
+            job._set(status=FAILED, stage="failed", error=str(e), finished=time.time())
+        except Exception as e:
+            job._set(status=FAILED, stage="failed", error=f"Job failed: {str(e)}", finished=time.time())
+        finally:
+            if cleanup is not None:
+                cleanup()
+
+    def _expire(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+
+# Server-sent events with the job's state after every change, ending once
+# it has finished. A comment line every `keepalive` seconds keeps proxies
+# from closing an idle stream.
+async def job_events(job: Job, keepalive: float = 15.0):
+    while True:
+        job.changed.clear()
+        info = job.snapshot()
+        yield f"event: {info['status']}\ndata: {dumps(info).decode()}\n\n"
+        if info["status"] in FINISHED:
+            return
+        while True:
+            try:
+                await asyncio.wait_for(job.changed.wait(), timeout=keepalive)
+                break
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
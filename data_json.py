@@ -0,0 +1,228 @@
+# data_json.py
+# JSON encoding for data.py responses that carry DataFrame slices, Series
+# and NumPy values. Frames are written straight to JSON text a column (or a
+# block of same-dtype columns) at a time with vectorized NumPy formatting,
+# instead of going through to_dict() and a dict of boxed Python objects per
+# row. Missing values (NaN, None, NaT, pd.NA) and infinities become null,
+# NumPy scalars become plain numbers and timestamps ISO 8601 strings.
+#
+# FastAPI runs returned dicts through jsonable_encoder, which would box every
+# value again, so endpoints put fragment(df) in their response instead: the
+# frame already encoded, as a str subclass that jsonable_encoder passes
+# through and FrameJSONResponse writes out verbatim. A DataFrame is encoded
+# as a list of records, or with orient="columns" as {"column": [values, ...]};
+# a Series as an object keyed by its index, like Series.to_dict().
+import datetime
+import decimal
+import json
+import math
+
+import numpy as np
+import pandas as pd
+from fastapi.responses import JSONResponse
+
+from metrics import span
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORIENTS = ("records", "columns")
+# Column dtypes formatted a whole block at a time
+_BLOCK_KINDS = "biuf"
+
+
+# Already-encoded JSON, written into the response as-is
+class Fragment(str):
+    pass
+
+
+if orjson is not None:
+    def _string(value: str) -> str:
+        return orjson.dumps(value).decode()
+else:
+    def _string(value: str) -> str:
+        return json.dumps(value, ensure_ascii=False)
+
+
+def _float(value) -> str:
+    value = float(value)
+    return repr(value) if math.isfinite(value) else "null"
+
+
+def _timestamp(value) -> str:
+    return '"' + value.isoformat() + '"'
+
+
+def _scalar(value) -> str:
+    if value is None or value is pd.NaT or value is pd.NA:
+        return "null"
+    if isinstance(value, str):
+        return _string(value)
+    if isinstance(value, (bool, np.bool_)):
+        return "true" if value else "false"
+    if isinstance(value, (int, np.integer)):
+        return str(int(value))
+    if isinstance(value, (float, np.floating, decimal.Decimal)):
+        return _float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return _timestamp(value)
+    if isinstance(value, np.datetime64):
+        return "null" if np.isnat(value) else _timestamp(pd.Timestamp(value))
+    if isinstance(value, (datetime.timedelta, np.timedelta64)):
+        # Durations as seconds, like FastAPI's default encoder
+        return "null" if pd.isna(value) else _float(pd.Timedelta(value).total_seconds())
+    if isinstance(value, bytes):
+        return _string(value.decode("utf-8", errors="replace"))
+    return _encode(value)
+
+
+# JSON text for every value of a NumPy array, as a str array of the same shape
+def _block_text(values: np.ndarray) -> np.ndarray:
+    kind = values.dtype.kind
+    if kind == "b":
+        return np.where(values, "true", "false")
+    if kind in "iu":
+        return values.astype(str)
+    if kind == "f":
+        text = values.astype(str)
+        text[~np.isfinite(values)] = "null"
+        return text
+    if kind == "M":
+        valid = ~np.isnat(values)
+        ticks = values[valid].astype("datetime64[ns]").astype(np.int64)
+        unit = "s" if not (ticks % 10 ** 9).any() else "us" if not (ticks % 1000).any() else "ns"
+        text = np.char.add(np.char.add('"', np.datetime_as_string(values, unit=unit)), '"').astype(object)
+        text[~valid] = "null"
+        return text
+    if kind == "m":
+        seconds = values / np.timedelta64(1, "s")
+        return _block_text(seconds)
+    text = np.empty(values.shape, dtype=object)
+    for index, value in np.ndenumerate(values):
+        text[index] = _scalar(value)
+    return text
+
+
+# JSON text for every value of a column
+def _column_text(series: pd.Series) -> np.ndarray:
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        # Encode each category once; code -1 (missing) picks the trailing null
+        categories = _column_text(pd.Series(dtype.categories))
+        return np.append(categories, "null")[series.cat.codes.to_numpy()]
+    if isinstance(dtype, pd.SparseDtype):
+        return _column_text(series.sparse.to_dense())
+    if isinstance(dtype, np.dtype):
+        return _block_text(series.to_numpy())
+    # Extension dtypes (nullable integers, Arrow strings, tz-aware timestamps, ...)
+    values = series.to_numpy(dtype=object, na_value=None)
+    return np.array([_scalar(value) for value in values], dtype=object)
+
+
+# JSON text of each column of a 2-D numeric block, as one list per column.
+# orjson writes the whole block at once; numbers contain no brackets or
+# commas, so its output splits safely into rows and cells.
+def _block_columns(values: np.ndarray) -> list:
+    if orjson is not None and len(values):
+        try:
+            text = orjson.dumps(np.ascontiguousarray(values), option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except orjson.JSONEncodeError:
+            # e.g. float16, which orjson does not write
+            pass
+        else:
+            rows = [row.split(",") for row in text[2:-2].split("],[")]
+            return [list(column) for column in zip(*rows)]
+    text = _block_text(values)
+    return [text[:, offset].tolist() for offset in range(values.shape[1])]
+
+
+# JSON text of each column, converting same-dtype NumPy columns as one block
+def _frame_text(df: pd.DataFrame) -> list:
+    texts = [None] * df.shape[1]
+    blocks = {}
+    for position, dtype in enumerate(df.dtypes):
+        if isinstance(dtype, np.dtype) and dtype.kind in _BLOCK_KINDS:
+            blocks.setdefault(dtype, []).append(position)
+        else:
+            texts[position] = _column_text(df.iloc[:, position]).tolist()
+    for dtype, positions in blocks.items():
+        block = _block_columns(df.iloc[:, positions].to_numpy(dtype=dtype))
+        for offset, position in enumerate(positions):
+            texts[position] = block[offset]
+    return texts
+
+
+def _keys(labels) -> list:
+    return [_string(str(label)) + ":" for label in labels]
+
+
+def _records(df: pd.DataFrame) -> str:
+    keys = _keys(df.columns)
+    if not keys:
+        return "[" + ",".join("{}" for _ in range(len(df))) + "]"
+    rows = ("{" + ",".join(map(str.__add__, keys, row)) + "}" for row in zip(*_frame_text(df)))
+    return "[" + ",".join(rows) + "]"
+
+
+def _array_json(values: np.ndarray) -> str:
+    if orjson is not None and values.dtype.kind in _BLOCK_KINDS and values.ndim == 1:
+        # orjson writes numeric arrays directly (NaN and infinities as null)
+        try:
+            return orjson.dumps(np.ascontiguousarray(values), option=orjson.OPT_SERIALIZE_NUMPY).decode()
+        except orjson.JSONEncodeError:
+            pass
+    return "[" + ",".join(_block_text(values).tolist()) + "]"
+
+
+def _columns(df: pd.DataFrame) -> str:
+    parts = (key + "[" + ",".join(text) + "]" for key, text in zip(_keys(df.columns), _frame_text(df)))
+    return "{" + ",".join(parts) + "}"
+
+
+def _encode(value) -> str:
+    if isinstance(value, Fragment):
+        return value
+    if isinstance(value, dict):
+        return "{" + ",".join(_string(str(key)) + ":" + _encode(item) for key, item in value.items()) + "}"
+    if isinstance(value, (list, tuple)):
+        return "[" + ",".join(_encode(item) for item in value) + "]"
+    if isinstance(value, pd.DataFrame):
+        return _records(value)
+    if isinstance(value, pd.Series):
+        return "{" + ",".join(map(str.__add__, _keys(value.index), _column_text(value).tolist())) + "}"
+    if isinstance(value, pd.Index):
+        return "[" + ",".join(_column_text(value.to_series()).tolist()) + "]"
+    if isinstance(value, np.ndarray):
+        if value.ndim > 1:
+            return "[" + ",".join(_encode(row) for row in value) + "]"
+        return _array_json(value)
+    if isinstance(value, (set, frozenset)):
+        return _encode(list(value))
+    if hasattr(value, "model_dump"):
+        return _encode(value.model_dump())
+    if isinstance(value, (str, int, float, bool, type(None), np.generic, datetime.date, datetime.time,
+                          datetime.timedelta, decimal.Decimal, bytes)) or value is pd.NaT or value is pd.NA:
+        return _scalar(value)
+    return _string(str(value))
+
+
+# JSON for a DataFrame (as records or columns), Series, array or plain value
+def fragment(value, orient: str = "records") -> Fragment:
+    if orient not in ORIENTS:
+        raise ValueError(f"Unsupported orient '{orient}'. Use records or columns.")
+    if isinstance(value, pd.DataFrame) and orient == "columns":
+        return Fragment(_columns(value))
+    return Fragment(_encode(value))
+
+
+def dumps(value) -> bytes:
+    return _encode(value).encode("utf-8")
+
+
+# Default response class for data.py: serialization is timed as the "serialize" stage
+class FrameJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with span("serialize"):
+            return dumps(content)
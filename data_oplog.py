@@ -0,0 +1,435 @@
+# data_oplog.py
+# Preprocessing as an append-only log of operations over an immutable base frame.
+# Materialized frames are cached at checkpoints; with copy-on-write each
+# checkpoint only owns the columns its operation rewrote, so reset and undo
+# are cursor moves rather than full copies.
+import contextvars
+import hashlib
+import json
+import os
+import pickle
+import threading
+import uuid
+from typing import List, Optional
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from data_profile import profile_frame, update_profile
+
+# Materialize a checkpoint every N operations
+CHECKPOINT_EVERY = int(os.environ.get("DATA_CHECKPOINT_EVERY", 1))
+# Checkpoints kept besides the base frame and the current frame
+MAX_CHECKPOINTS = int(os.environ.get("DATA_MAX_CHECKPOINTS", 8))
+
+
+# Raised for invalid input; the message is returned to the client as-is
+class OperationError(ValueError):
+    pass
+
+
+def _validate_columns(df, columns):
+    for col in columns:
+        if col not in df.columns:
+            raise OperationError(f"Column '{col}' not found in the dataset.")
+
+
+# Imputation methods that fill values in place (drop_rows removes rows instead)
+FILL_METHODS = ("mean", "median", "mode", "constant")
+
+
+def _fill_missing(series: pd.Series, method: str) -> pd.Series:
+    if method == "mean" and is_numeric_dtype(series):
+        value = series.mean()
+    elif method == "median" and is_numeric_dtype(series):
+        value = series.median()
+    elif method == "mode":
+        value = series.mode()[0]
+    elif method == "constant":
+        value = 0 if is_numeric_dtype(series) else "unknown"
+    else:
+        raise OperationError(f"Invalid method '{method}' for column '{series.name}'.")
+    # Compacted text columns are categorical and only accept known categories
+    if isinstance(series.dtype, pd.CategoricalDtype) and value not in series.cat.categories:
+        series = series.cat.add_categories([value])
+    return series.fillna(value)
+
+
+def _make_scaler(method: str):
+    # sklearn takes most of a second to import, so it is loaded on first use
+    from sklearn.preprocessing import StandardScaler, MinMaxScaler, RobustScaler
+
+    if method == "minmax":
+        return MinMaxScaler()
+    elif method == "standard":
+        return StandardScaler()
+    elif method == "robust":
+        return RobustScaler()
+    raise OperationError(f"Invalid normalization method '{method}'.")
+
+
+# Every operation takes a frame and returns a new one, never touching its input.
+# df.copy(deep=False) is free under copy-on-write: only reassigned columns are copied.
+def handle_missing(df: pd.DataFrame, columns: List[str], method: str) -> pd.DataFrame:
+    _validate_columns(df, columns)
+    if method == "drop_rows":
+        # One pass over all the selected columns, not one per column
+        return df.dropna(subset=columns)
+    df = df.copy(deep=False)
+    for col in columns:
+        df[col] = _fill_missing(df[col], method)
+    return df
+
+
+def normalize(df: pd.DataFrame, columns: List[str], method: str) -> pd.DataFrame:
+    for col in columns:
+        if col not in df.columns:
+            raise OperationError(f"Column '{col}' not found in the dataset.")
+        if not is_numeric_dtype(df[col]):
+            raise OperationError(f"Column '{col}' is not numeric and cannot be normalized.")
+
+    scaler = _make_scaler(method)
+    df = df.copy(deep=False)
+    df[columns] = scaler.fit_transform(df[columns])
+    return df
+
+
+# Fused handle-missing + normalize over the same columns: one validation pass,
+# one copy of the frame, and the filled columns go straight into the scaler
+# without an intermediate frame
+def impute_and_scale(df: pd.DataFrame, columns: List[str], impute: str, scale: str) -> pd.DataFrame:
+    _validate_columns(df, columns)
+    if impute not in FILL_METHODS:
+        raise OperationError(f"Invalid method '{impute}' for column '{columns[0]}'.")
+    for col in columns:
+        if not is_numeric_dtype(df[col]):
+            raise OperationError(f"Column '{col}' is not numeric and cannot be normalized.")
+    scaler = _make_scaler(scale)
+
+    filled = np.column_stack([_fill_missing(df[col], impute).to_numpy(dtype=np.float64) for col in columns])
+    df = df.copy(deep=False)
+    df[columns] = scaler.fit_transform(filled)
+    return df
+
+
+# One-hot categories per column: {"categories": [...], "other": bool}. With
+# max_categories only the most frequent values keep a column of their own and
+# the rest share a "<col>_other" column.
+def fit_onehot(df: pd.DataFrame, columns: List[str], max_categories: Optional[int] = None) -> dict:
+    if max_categories is not None and max_categories < 1:
+        raise OperationError("max_categories must be at least 1.")
+    mapping = {}
+    for col in columns:
+        counts = df[col].value_counts(dropna=True, sort=True)
+        counts = counts[counts > 0]
+        other = max_categories is not None and len(counts) > max_categories
+        if other:
+            counts = counts.iloc[:max_categories]
+        # Sorted like pd.get_dummies
+        mapping[col] = {"categories": counts.index.sort_values().tolist(), "other": bool(other)}
+    return mapping
+
+
+# All requested columns are encoded in one pass into a single block (dense
+# bool, or a scipy sparse matrix), then joined to the frame with one concat.
+# Values missing from the mapping go to the "other" column when there is one,
+# otherwise their row is all zeros, as for missing values.
+def _onehot(df: pd.DataFrame, columns: List[str], mapping: dict, sparse: bool) -> pd.DataFrame:
+    names, rows, cols = [], [], []
+    for col in columns:
+        if col not in mapping:
+            raise OperationError(f"No category mapping given for column '{col}'.")
+        categories = mapping[col]["categories"]
+        codes = pd.Categorical(df[col], categories=categories).codes.astype(np.int64)
+        if mapping[col].get("other"):
+            codes[(codes == -1) & df[col].notna().to_numpy()] = len(categories)
+        hit = np.flatnonzero(codes >= 0)
+        rows.append(hit)
+        cols.append(codes[hit] + len(names))
+        names.extend(f"{col}_{value}" for value in categories)
+        if mapping[col].get("other"):
+            names.append(f"{col}_other")
+
+    rows, cols = np.concatenate(rows), np.concatenate(cols)
+    if sparse:
+        import scipy.sparse as sp
+
+        matrix = sp.csc_matrix((np.ones(len(rows), dtype=bool), (rows, cols)), shape=(len(df), len(names)))
+        dummies = pd.DataFrame.sparse.from_spmatrix(matrix, index=df.index, columns=names)
+    else:
+        matrix = np.zeros((len(df), len(names)), dtype=bool)
+        matrix[rows, cols] = True
+        dummies = pd.DataFrame(matrix, index=df.index, columns=names)
+    return pd.concat([df.drop(columns=columns), dummies], axis=1)
+
+
+def encode_categorical(df: pd.DataFrame, columns: List[str], method: str, sparse: bool = False,
+                       max_categories: Optional[int] = None, mapping: Optional[dict] = None) -> pd.DataFrame:
+    _validate_columns(df, columns)
+
+    if method == "onehot":
+        if mapping is None:
+            mapping = fit_onehot(df, columns, max_categories)
+        df = _onehot(df, columns, mapping, sparse)
+    elif method == "label":
+        df = df.copy(deep=False)
+        for col in columns:
+            # Map each unique value to a number
+            df[col] = df[col].astype('category').cat.codes
+    else:
+        raise OperationError(f"Invalid encoding method '{method}'.")
+    return df
+
+
+def drop_columns(df: pd.DataFrame, columns: List[str]) -> pd.DataFrame:
+    _validate_columns(df, columns)
+    return df.drop(columns=columns)
+
+
+# Called as report(step_number, total_steps, step) before each pipeline step,
+# e.g. to publish job progress. It may raise to abort the run; the log only
+# records the pipeline once every step has finished.
+pipeline_progress = contextvars.ContextVar("pipeline_progress", default=None)
+
+
+# Several operations recorded as a single log entry (see data_pipeline)
+def run_pipeline(df: pd.DataFrame, steps: List[dict]) -> pd.DataFrame:
+    report = pipeline_progress.get()
+    for i, step in enumerate(steps, start=1):
+        if report is not None:
+            report(i, len(steps), step)
+        if step.get("op") not in OPERATIONS or step["op"] == "pipeline":
+            raise OperationError(f"Step {i}: unknown operation '{step.get('op')}'.")
+        try:
+            df = apply_operation(df, step)
+        except TypeError as e:
+            raise OperationError(f"Step {i}: invalid parameters for '{step['op']}': {e}")
+    return df
+
+
+OPERATIONS = {
+    "handle-missing": handle_missing,
+    "normalize": normalize,
+    "encode-categorical": encode_categorical,
+    "drop-columns": drop_columns,
+    "impute-scale": impute_and_scale,
+    "pipeline": run_pipeline,
+}
+
+
+def apply_operation(df: pd.DataFrame, op: dict) -> pd.DataFrame:
+    return OPERATIONS[op["op"]](df, **op.get("params", {}))
+
+
+# Fill in the fitted state of an operation before it is recorded (currently
+# the one-hot category mapping), so replaying the log or reusing the
+# operation on new data never refits
+def fit_operation(df: pd.DataFrame, op: dict) -> dict:
+    params = op.get("params", {})
+    if op["op"] == "encode-categorical" and params.get("method") == "onehot" and params.get("mapping") is None:
+        _validate_columns(df, params["columns"])
+        mapping = fit_onehot(df, params["columns"], params.get("max_categories"))
+        return {"op": op["op"], "params": {**params, "mapping": mapping}}
+    return op
+
+
+# Columns an operation rewrites, for incremental profiling. None means every
+# column may have changed (dropping rows changes all of them). Columns that
+# appear or disappear are picked up by the profile update itself.
+def touched_columns(op: dict) -> Optional[List[str]]:
+    params = op.get("params", {})
+    if op["op"] == "pipeline":
+        touched = []
+        for step in params["steps"]:
+            step_touched = touched_columns(step)
+            if step_touched is None:
+                return None
+            touched.extend(step_touched)
+        return touched
+    if op["op"] == "handle-missing" and params["method"] == "drop_rows":
+        return None
+    if op["op"] == "drop-columns":
+        return []
+    return list(params["columns"])
+
+
+# Stand-in for values JSON has no type for (Timestamps, numpy scalars...) in the
+# version digest; the type is kept so 1, np.int64(1) and "1" hash differently
+def _typed_repr(value) -> str:
+    return f"{type(value).__module__}.{type(value).__qualname__}:{value!r}"
+
+
+class OperationLog:
+    def __init__(self, base: pd.DataFrame, profile: dict = None, token: str = None):
+        self.base = base
+        # Identifies this upload; combined with the applied operations it
+        # gives a version that caches can key on. Uploads of the same content
+        # may pass the same token so they share cached results.
+        self.base_token = token or uuid.uuid4().hex
+        # Append-only list of {"op": name, "params": {...}}; entries past the
+        # cursor are kept for redo until a new operation is applied
+        self.ops = []
+        self.cursor = 0
+        # position -> materialized frame after that many operations
+        self._checkpoints = {0: base}
+        # position -> column profile; profiles are small, so every position is kept
+        self._profiles = {} if profile is None else {0: profile}
+        # Operations run in the compute thread pool, so concurrent requests
+        # on the same session must not interleave
+        self._lock = threading.RLock()
+
+    # The preprocessed frame at the cursor
+    def current(self) -> pd.DataFrame:
+        with self._lock:
+            return self._materialize(self.cursor)
+
+    # Run an operation on the current frame and append it to the log
+    def apply(self, name: str, **params) -> pd.DataFrame:
+        return self.apply_recorded(name, **params)[0]
+
+    # apply() that also returns the operation as recorded, with its fitted
+    # parameters (read under the same lock, so a concurrent undo cannot swap it)
+    def apply_recorded(self, name: str, **params) -> tuple:
+        if name not in OPERATIONS:
+            raise OperationError(f"Unknown operation '{name}'.")
+        op = {"op": name, "params": params}
+        with self._lock:
+            current = self.current()
+            op = self._fit(current, op)
+            df = self._run(current, op)
+
+            # A new operation discards anything that was undone
+            del self.ops[self.cursor:]
+            for position in [p for p in self._checkpoints if p > self.cursor]:
+                del self._checkpoints[position]
+            for position in [p for p in self._profiles if p > self.cursor]:
+                del self._profiles[position]
+
+            self.ops.append(op)
+            self.cursor += 1
+            self._checkpoints[self.cursor] = df
+            self._prune_checkpoints()
+            # Re-profile only the columns this operation touched
+            if self.cursor - 1 in self._profiles:
+                self._profiles[self.cursor] = self._profile(df, self._profiles[self.cursor - 1], touched_columns(op))
+            return df, op
+
+    def undo(self, steps: int = 1) -> pd.DataFrame:
+        with self._lock:
+            if steps < 1 or steps > self.cursor:
+                raise OperationError(f"Cannot undo {steps} step(s); {self.cursor} operation(s) applied.")
+            self.cursor -= steps
+            return self.current()
+
+    def redo(self, steps: int = 1) -> pd.DataFrame:
+        with self._lock:
+            if steps < 1 or self.cursor + steps > len(self.ops):
+                raise OperationError(f"Cannot redo {steps} step(s); {len(self.ops) - self.cursor} operation(s) undone.")
+            self.cursor += steps
+            return self.current()
+
+    def reset(self) -> pd.DataFrame:
+        with self._lock:
+            self.cursor = 0
+            return self.base
+
+    def history(self) -> dict:
+        with self._lock:
+            return {"operations": list(self.ops), "cursor": self.cursor, "checkpoints": sorted(self._checkpoints)}
+
+    # Column profile of the frame at the cursor
+    def profile(self) -> dict:
+        with self._lock:
+            return self._profile_at(self.cursor)
+
+    # Hash of the upload and the operations applied up to the cursor. Undoing
+    # back to an earlier state gives back that state's version.
+    @property
+    def version(self) -> str:
+        with self._lock:
+            digest = hashlib.sha1(self.base_token.encode())
+            digest.update(json.dumps(self.ops[:self.cursor], sort_keys=True, default=_typed_repr).encode())
+            return digest.hexdigest()
+
+    # Every frame currently held in memory (shared columns are deduplicated by the store)
+    def frames(self) -> list:
+        with self._lock:
+            return list(self._checkpoints.values())
+
+    def _materialize(self, position: int) -> pd.DataFrame:
+        start = max(p for p in self._checkpoints if p <= position)
+        df = self._checkpoints[start]
+        for op in self.ops[start:position]:
+            df = self._run(df, op)
+        if start != position:
+            self._checkpoints[position] = df
+            self._prune_checkpoints()
+        return df
+
+    def _profile_at(self, position: int) -> dict:
+        if position in self._profiles:
+            return self._profiles[position]
+        known = max((p for p in self._profiles if p <= position), default=None)
+        if known is None:
+            self._profiles[0] = self._profile(self.base)
+            known = 0
+        # Walk forward from the nearest known profile, one operation at a time
+        for p in range(known + 1, position + 1):
+            self._profiles[p] = self._profile(self._materialize(p), self._profiles[p - 1], touched_columns(self.ops[p - 1]))
+        return self._profiles[position]
+
+    # How operations are fitted, run and profiled; the out-of-core log overrides these
+    def _fit(self, df, op):
+        return fit_operation(df, op)
+
+    def _run(self, df, op):
+        return apply_operation(df, op)
+
+    def _profile(self, df, previous=None, touched=None) -> dict:
+        if previous is None:
+            return profile_frame(df)
+        return update_profile(previous, df, touched)
+
+    def _prune_checkpoints(self):
+        # Always keep the base frame and the frame at the cursor; between those,
+        # keep every CHECKPOINT_EVERY-th position, newest first, up to MAX_CHECKPOINTS
+        keep = {0, self.cursor}
+        candidates = sorted(
+            (p for p in self._checkpoints if p not in keep and p % CHECKPOINT_EVERY == 0),
+            reverse=True,
+        )
+        keep.update(candidates[:MAX_CHECKPOINTS])
+        for position in [p for p in self._checkpoints if p not in keep]:
+            del self._checkpoints[position]
+
+    # Spill support for the session store: only the base frame and the log are
+    # written; checkpoints are rebuilt by replay after reloading
+    def spill_to(self, directory: str, write_frame):
+        with self._lock:
+            self._spill_to(directory, write_frame)
+
+    def reload_from(self, directory: str, read_frame):
+        with self._lock:
+            self._reload_from(directory, read_frame)
+
+    def _spill_to(self, directory: str, write_frame):
+        os.makedirs(directory, exist_ok=True)
+        write_frame(self.base, os.path.join(directory, "base"))
+        # Pickled rather than JSON: fitted parameters hold Timestamps, numpy
+        # scalars and category lists that must replay exactly as they were
+        with open(os.path.join(directory, "ops.pkl"), "wb") as f:
+            pickle.dump({"ops": self.ops, "cursor": self.cursor, "base_token": self.base_token}, f)
+        self.base = None
+        self._checkpoints = {}
+
+    def _reload_from(self, directory: str, read_frame):
+        for name in os.listdir(directory):
+            if name.startswith("base."):
+                self.base = read_frame(os.path.join(directory, name))
+        with open(os.path.join(directory, "ops.pkl"), "rb") as f:
+            state = pickle.load(f)
+        self.ops = state["ops"]
+        self.cursor = state["cursor"]
+        self.base_token = state["base_token"]
+        self._checkpoints = {0: self.base}
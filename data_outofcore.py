@@ -0,0 +1,576 @@
+# data_outofcore.py
+# Opt-in out-of-core mode for datasets larger than RAM. The upload is
+# converted to Parquet once; after that every preprocessing state is a
+# Parquet file on disk plus a column projection (a ParquetFrame), and
+# operations stream one memory-mapped row group at a time:
+#  - a first pass gathers mergeable statistics per column (count, mean and
+#    variance combined chunk by chunk, min/max, value counts, category sets);
+#    medians and quartiles take a second, histogram pass
+#  - a final pass rewrites only the touched columns of each row group and
+#    writes it to a new file, so peak memory is one row group
+#  - dropping columns only narrows the projection; nothing is rewritten
+import os
+import shutil
+import tempfile
+import uuid
+from collections import Counter
+from typing import List
+
+import numpy as np
+import pandas as pd
+
+from data_ingest import convert_to_parquet
+from data_oplog import FILL_METHODS, OperationError, OperationLog, pipeline_progress
+from data_profile import profile_chunks
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # out-of-core mode needs pyarrow
+    pa = None
+
+# Where out-of-core datasets are kept, one directory per upload
+OUT_OF_CORE_DIR = os.environ.get("DATA_OUT_OF_CORE_DIR") or os.path.join(tempfile.gettempdir(), "data_outofcore")
+# Histogram bins used for medians and quartiles; they are exact to within
+# (max - min) / QUANTILE_BINS
+QUANTILE_BINS = int(os.environ.get("DATA_QUANTILE_BINS", 1 << 16))
+# Rows sampled from an out-of-core dataset to draw a chart
+CHART_SAMPLE_ROWS = int(os.environ.get("DATA_OUT_OF_CORE_CHART_ROWS", 200_000))
+
+
+def _is_numeric(arrow_type) -> bool:
+    return (pa.types.is_integer(arrow_type) or pa.types.is_floating(arrow_type)
+            or pa.types.is_decimal(arrow_type) or pa.types.is_boolean(arrow_type))
+
+
+# Read-only view of a Parquet file, restricted to some of its columns. It
+# offers the parts of the DataFrame interface the endpoints use on the
+# current frame (columns, len, head, column selection), reading row groups
+# from a memory-mapped file on demand.
+class ParquetFrame:
+    def __init__(self, path: str, columns=None):
+        self.path = path
+        self._file = pq.ParquetFile(path, memory_map=True)
+        names = self._file.schema_arrow.names
+        self.columns = pd.Index(list(columns) if columns is not None else names)
+
+    def __len__(self):
+        return self._file.metadata.num_rows
+
+    def __getitem__(self, columns):
+        columns = list(columns)
+        missing = [col for col in columns if col not in self.columns]
+        if missing:
+            raise KeyError(missing)
+        return ParquetFrame(self.path, columns)
+
+    @property
+    def schema(self):
+        full = self._file.schema_arrow
+        return pa.schema([full.field(col) for col in self.columns])
+
+    # pandas dtypes the columns convert to. An empty table converts integers
+    # and booleans as if they had no nulls; columns that do have some come
+    # back as float64 and object, like the data read from the file.
+    @property
+    def dtypes(self) -> pd.Series:
+        dtypes = self.schema.empty_table().to_pandas().dtypes
+        for col in self._columns_with_nulls():
+            field = self.schema.field(col)
+            if pa.types.is_integer(field.type):
+                dtypes[col] = np.dtype("float64")
+            elif pa.types.is_boolean(field.type):
+                dtypes[col] = np.dtype("object")
+        return dtypes
+
+    # Integer and boolean columns with nulls, from the row group statistics
+    # where the file has them and from the data otherwise
+    def _columns_with_nulls(self) -> list:
+        positions = {name: i for i, name in enumerate(self._file.schema_arrow.names)}
+        found = []
+        for col in self.columns:
+            arrow_type = self.schema.field(col).type
+            if not (pa.types.is_integer(arrow_type) or pa.types.is_boolean(arrow_type)):
+                continue
+            for i in range(self.num_row_groups):
+                stats = self._file.metadata.row_group(i).column(positions[col]).statistics
+                if stats is not None and stats.has_null_count:
+                    nulls = stats.null_count
+                else:
+                    nulls = self._read_row_group(i, [col]).column(0).null_count
+                if nulls:
+                    found.append(col)
+                    break
+        return found
+
+    @property
+    def num_row_groups(self) -> int:
+        return self._file.metadata.num_row_groups
+
+    # Row group i as Arrow. Pandas metadata in the file is dropped: an adopted
+    # ingest cache entry carries the dtypes of the upload it was written
+    # from, and the Arrow types are what the file actually holds.
+    def _read_row_group(self, i: int, columns):
+        return self._file.read_row_group(i, columns=columns).replace_schema_metadata(None)
+
+    def iter_tables(self, columns=None):
+        columns = list(self.columns if columns is None else columns)
+        for i in range(self.num_row_groups):
+            yield self._read_row_group(i, columns)
+
+    def iter_chunks(self, columns=None):
+        for table in self.iter_tables(columns):
+            yield table.to_pandas()
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        return self.slice(0, n)
+
+    # Rows [offset, offset + limit), reading only the row groups they fall in
+    def slice(self, offset: int, limit: int, columns=None) -> pd.DataFrame:
+        columns = list(self.columns if columns is None else columns)
+        tables = []
+        start = 0
+        for i in range(self.num_row_groups):
+            rows = self._file.metadata.row_group(i).num_rows
+            if start + rows > offset and start < offset + limit:
+                table = self._read_row_group(i, columns)
+                tables.append(table.slice(max(offset - start, 0), offset + limit - max(start, offset)))
+            start += rows
+            if start >= offset + limit:
+                break
+        if not tables:
+            return self.schema.empty_table().select(columns).to_pandas()
+        table = pa.concat_tables(tables)
+        # Keep the row numbers of the whole dataset, like slicing a DataFrame would
+        df = table.to_pandas()
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        return df
+
+    # Fixed-seed sample of about n rows spread over every row group, so charts
+    # of the same version are identical (and cacheable)
+    def sample(self, n: int, columns=None) -> pd.DataFrame:
+        total = len(self)
+        if total <= n:
+            return pa.concat_tables(list(self.iter_tables(columns))).to_pandas() if total else self.head(0)
+        rng = np.random.default_rng(0)
+        parts = []
+        for table in self.iter_tables(columns):
+            take = int(round(table.num_rows * n / total))
+            if take:
+                parts.append(table.take(np.sort(rng.choice(table.num_rows, take, replace=False))))
+        return pa.concat_tables(parts).to_pandas()
+
+
+def _validate_columns(frame: ParquetFrame, columns):
+    for col in columns:
+        if col not in frame.columns:
+            raise OperationError(f"Column '{col}' not found in the dataset.")
+
+
+def _validate_numeric(frame: ParquetFrame, columns):
+    schema = frame.schema
+    for col in columns:
+        if not _is_numeric(schema.field(col).type):
+            raise OperationError(f"Column '{col}' is not numeric and cannot be normalized.")
+
+
+# Running count, mean, variance, min and max of one numeric column, merged
+# chunk by chunk (Chan et al.'s parallel variance update)
+class _NumericStats:
+    def __init__(self):
+        self.count = 0
+        self.nulls = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, column):
+        values = column.to_numpy(zero_copy_only=False).astype(np.float64)
+        values = values[~np.isnan(values)]
+        self.nulls += len(column) - len(values)
+        n = len(values)
+        if not n:
+            return
+        mean = values.mean()
+        m2 = ((values - mean) ** 2).sum()
+        delta = mean - self.mean
+        total = self.count + n
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.count * n / total
+        self.count = total
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    @property
+    def std(self) -> float:
+        return float(np.sqrt(self.m2 / self.count)) if self.count else 0.0
+
+
+def _numeric_stats(frame: ParquetFrame, columns) -> dict:
+    stats = {col: _NumericStats() for col in columns}
+    for table in frame.iter_tables(columns):
+        for col in columns:
+            stats[col].update(table.column(col))
+    return stats
+
+
+# Second pass: quantiles from a fixed-width histogram between min and max,
+# interpolated linearly inside the bin like pandas' quantile
+def _quantiles(frame: ParquetFrame, columns, stats: dict, qs) -> dict:
+    bounded = [col for col in columns if stats[col].count and stats[col].max > stats[col].min]
+    counts = {col: np.zeros(QUANTILE_BINS, dtype=np.int64) for col in bounded}
+    if bounded:
+        for table in frame.iter_tables(bounded):
+            for col in bounded:
+                values = table.column(col).to_numpy(zero_copy_only=False).astype(np.float64)
+                values = values[~np.isnan(values)]
+                counts[col] += np.histogram(values, bins=QUANTILE_BINS, range=(stats[col].min, stats[col].max))[0]
+
+    result = {}
+    for col in columns:
+        s = stats[col]
+        if not s.count:
+            result[col] = [np.nan for _ in qs]
+            continue
+        if col not in counts:
+            result[col] = [float(s.min) for _ in qs]
+            continue
+        width = (s.max - s.min) / QUANTILE_BINS
+        cumulative = np.cumsum(counts[col])
+        values = []
+        for q in qs:
+            target = q * (s.count - 1)
+            b = int(np.searchsorted(cumulative, target, side="right"))
+            b = min(b, QUANTILE_BINS - 1)
+            below = cumulative[b - 1] if b else 0
+            within = (target - below) / counts[col][b] if counts[col][b] else 0.0
+            values.append(float(s.min + (b + within) * width))
+        result[col] = values
+    return result
+
+
+def _value_counts(frame: ParquetFrame, columns) -> dict:
+    counts = {col: Counter() for col in columns}
+    for table in frame.iter_tables(columns):
+        for col in columns:
+            result = pc.value_counts(table.column(col).drop_null())
+            counts[col].update(dict(zip(result.field("values").to_pylist(), result.field("counts").to_pylist())))
+    return counts
+
+
+def _mode(counts: Counter):
+    if not counts:
+        return None
+    top = max(counts.values())
+    candidates = [value for value, count in counts.items() if count == top]
+    # pandas returns the modes sorted, and the fill uses the first one
+    try:
+        return min(candidates)
+    except TypeError:
+        return candidates[0]
+
+
+def _null_counts(frame: ParquetFrame, columns) -> dict:
+    nulls = dict.fromkeys(columns, 0)
+    for table in frame.iter_tables(columns):
+        for col in columns:
+            nulls[col] += pc.sum(pc.is_null(table.column(col), nan_is_null=True)).as_py() or 0
+    return nulls
+
+
+# Value each column's missing entries are filled with (None when it has none)
+def _fill_values(frame: ParquetFrame, columns, method: str) -> dict:
+    if method not in FILL_METHODS:
+        raise OperationError(f"Invalid method '{method}' for column '{columns[0]}'.")
+    schema = frame.schema
+    nulls = _null_counts(frame, columns)
+    columns = [col for col in columns if nulls[col]]
+    for col in columns:
+        if method in ("mean", "median") and not _is_numeric(schema.field(col).type):
+            raise OperationError(f"Invalid method '{method}' for column '{col}'.")
+
+    if method == "mean":
+        stats = _numeric_stats(frame, columns)
+        return {col: stats[col].mean if stats[col].count else None for col in columns}
+    if method == "median":
+        stats = _numeric_stats(frame, columns)
+        medians = _quantiles(frame, columns, stats, [0.5])
+        return {col: medians[col][0] if stats[col].count else None for col in columns}
+    if method == "mode":
+        counts = _value_counts(frame, columns)
+        return {col: _mode(counts[col]) for col in columns}
+    return {col: 0 if _is_numeric(schema.field(col).type) else "unknown" for col in columns}
+
+
+# (center, scale) per column so that scaled = (value - center) / scale,
+# matching MinMaxScaler, StandardScaler and RobustScaler
+def _scaling(frame: ParquetFrame, columns, method: str, fills=None) -> dict:
+    if method not in ("minmax", "standard", "robust"):
+        raise OperationError(f"Invalid normalization method '{method}'.")
+    # Statistics of the filled column are needed when imputation is fused in
+    source = frame if not fills else _Filled(frame, fills)
+    stats = _numeric_stats(source, columns)
+
+    def nonzero(scale):
+        return scale if scale and np.isfinite(scale) else 1.0
+
+    if method == "minmax":
+        return {col: (float(stats[col].min), nonzero(float(stats[col].max - stats[col].min))) for col in columns}
+    if method == "standard":
+        return {col: (stats[col].mean, nonzero(stats[col].std)) for col in columns}
+    quartiles = _quantiles(source, columns, stats, [0.25, 0.5, 0.75])
+    return {col: (quartiles[col][1], nonzero(quartiles[col][2] - quartiles[col][0])) for col in columns}
+
+
+def _fill(table, col, value):
+    column = table.column(col)
+    if value is None:
+        return table
+    if pa.types.is_integer(column.type) and isinstance(value, float):
+        column = column.cast(pa.float64())
+    if pa.types.is_floating(column.type):
+        # NaN counts as missing, like in pandas
+        column = pc.if_else(pc.is_nan(column), None, column)
+    filled = pc.fill_null(column, pa.scalar(value, type=column.type))
+    return table.set_column(table.schema.get_field_index(col), pa.field(col, filled.type), filled)
+
+
+def _scale(table, col, center, scale):
+    column = table.column(col).cast(pa.float64())
+    scaled = pc.divide(pc.subtract(column, center), scale)
+    return table.set_column(table.schema.get_field_index(col), pa.field(col, pa.float64()), scaled)
+
+
+# A frame whose row groups come back with missing values already filled
+class _Filled:
+    def __init__(self, frame: ParquetFrame, fills: dict):
+        self.frame = frame
+        self.fills = fills
+
+    def iter_tables(self, columns=None):
+        for table in self.frame.iter_tables(columns):
+            for col, value in self.fills.items():
+                if col in table.column_names:
+                    table = _fill(table, col, value)
+            yield table
+
+
+# Stream every row group of `frame` through `transform` into a new Parquet file
+def _rewrite(frame: ParquetFrame, transform) -> ParquetFrame:
+    path = os.path.join(os.path.dirname(frame.path), uuid.uuid4().hex + ".parquet")
+    writer = None
+    try:
+        for table in frame.iter_tables():
+            # Pandas metadata would describe the columns as they were before the transform
+            table = transform(table).replace_schema_metadata(None)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table, row_group_size=max(table.num_rows, 1))
+        if writer is None:
+            writer = pq.ParquetWriter(path, transform(frame.schema.empty_table()).schema.remove_metadata())
+    except BaseException:
+        if writer is not None:
+            writer.close()
+        if os.path.exists(path):
+            os.unlink(path)
+        raise
+    writer.close()
+    return ParquetFrame(path)
+
+
+# The operations, with the same names and parameters as data_oplog's
+def handle_missing(frame: ParquetFrame, columns: List[str], method: str) -> ParquetFrame:
+    _validate_columns(frame, columns)
+    if method == "drop_rows":
+        def keep_complete(table):
+            mask = None
+            for col in columns:
+                valid = pc.invert(pc.is_null(table.column(col), nan_is_null=True))
+                mask = valid if mask is None else pc.and_(mask, valid)
+            return table.filter(mask)
+        return _rewrite(frame, keep_complete)
+
+    fills = _fill_values(frame, columns, method)
+    if not fills:
+        return frame
+
+    def fill(table):
+        for col, value in fills.items():
+            table = _fill(table, col, value)
+        return table
+    return _rewrite(frame, fill)
+
+
+def normalize(frame: ParquetFrame, columns: List[str], method: str) -> ParquetFrame:
+    _validate_columns(frame, columns)
+    _validate_numeric(frame, columns)
+    scaling = _scaling(frame, columns, method)
+
+    def scale(table):
+        for col, (center, factor) in scaling.items():
+            table = _scale(table, col, center, factor)
+        return table
+    return _rewrite(frame, scale)
+
+
+def impute_and_scale(frame: ParquetFrame, columns: List[str], impute: str, scale: str) -> ParquetFrame:
+    _validate_columns(frame, columns)
+    _validate_numeric(frame, columns)
+    fills = _fill_values(frame, columns, impute)
+    scaling = _scaling(frame, columns, scale, fills)
+
+    def fill_and_scale(table):
+        for col, (center, factor) in scaling.items():
+            table = _scale(_fill(table, col, fills.get(col)), col, center, factor)
+        return table
+    return _rewrite(frame, fill_and_scale)
+
+
+def encode_categorical(frame: ParquetFrame, columns: List[str], method: str, sparse: bool = False,
+                       max_categories=None, mapping=None) -> ParquetFrame:
+    _validate_columns(frame, columns)
+    if method == "onehot":
+        raise OperationError("One-hot encoding is not available in out-of-core mode; use label encoding.")
+    if method != "label":
+        raise OperationError(f"Invalid encoding method '{method}'.")
+
+    # First pass: every distinct value, sorted like pandas' categories
+    categories = {col: set() for col in columns}
+    for table in frame.iter_tables(columns):
+        for col in columns:
+            categories[col].update(pc.unique(table.column(col).drop_null()).to_pylist())
+    value_sets = {}
+    for col, values in categories.items():
+        try:
+            values = sorted(values)
+        except TypeError:
+            values = list(values)
+        value_sets[col] = pa.array(values, type=frame.schema.field(col).type)
+
+    def label(table):
+        for col, value_set in value_sets.items():
+            # Same code width as pandas' cat.codes; missing values become -1
+            code_type = pa.int8() if len(value_set) < 2 ** 7 else pa.int16() if len(value_set) < 2 ** 15 else pa.int32()
+            codes = pc.fill_null(pc.index_in(table.column(col), value_set=value_set), -1).cast(code_type)
+            table = table.set_column(table.schema.get_field_index(col), pa.field(col, code_type), codes)
+        return table
+    return _rewrite(frame, label)
+
+
+def drop_columns(frame: ParquetFrame, columns: List[str]) -> ParquetFrame:
+    _validate_columns(frame, columns)
+    return ParquetFrame(frame.path, [col for col in frame.columns if col not in columns])
+
+
+def run_pipeline(frame: ParquetFrame, steps: List[dict]) -> ParquetFrame:
+    report = pipeline_progress.get()
+    for i, step in enumerate(steps, start=1):
+        if report is not None:
+            report(i, len(steps), step)
+        if step.get("op") not in OPERATIONS or step["op"] == "pipeline":
+            raise OperationError(f"Step {i}: unknown operation '{step.get('op')}'.")
+        try:
+            frame = OPERATIONS[step["op"]](frame, **step.get("params", {}))
+        except TypeError as e:
+            raise OperationError(f"Step {i}: invalid parameters for '{step['op']}': {e}")
+    return frame
+
+
+OPERATIONS = {
+    "handle-missing": handle_missing,
+    "normalize": normalize,
+    "encode-categorical": encode_categorical,
+    "drop-columns": drop_columns,
+    "impute-scale": impute_and_scale,
+    "pipeline": run_pipeline,
+}
+
+
+# Convert a spooled upload into a new out-of-core dataset directory
+def load_out_of_core(path: str, on_progress=None, sheet=None):
+    if pa is None:
+        raise OperationError("Out-of-core mode requires pyarrow to be installed.")
+    directory = os.path.join(OUT_OF_CORE_DIR, uuid.uuid4().hex)
+    os.makedirs(directory)
+    out_path = os.path.join(directory, "base.parquet")
+    try:
+        summary = convert_to_parquet(path, out_path, on_progress, sheet=sheet)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+    return ParquetFrame(out_path), summary
+
+
+# Out-of-core dataset over a copy of an existing Parquet file (an ingest cache
+# entry), hard-linked when possible so nothing is copied
+def adopt_parquet(source: str) -> ParquetFrame:
+    if pa is None:
+        raise OperationError("Out-of-core mode requires pyarrow to be installed.")
+    directory = os.path.join(OUT_OF_CORE_DIR, uuid.uuid4().hex)
+    os.makedirs(directory)
+    out_path = os.path.join(directory, "base.parquet")
+    try:
+        try:
+            os.link(source, out_path)
+        except OSError:
+            shutil.copyfile(source, out_path)
+        return ParquetFrame(out_path)
+    except BaseException:
+        shutil.rmtree(directory, ignore_errors=True)
+        raise
+
+
+# OperationLog over a ParquetFrame. Every state is a file on disk, so all
+# checkpoints are kept (undo, redo and reset never recompute anything) and
+# the session store sees no memory to account for or spill.
+class OutOfCoreLog(OperationLog):
+    def __init__(self, base: ParquetFrame, profile: dict = None, token: str = None):
+        super().__init__(base, profile, token)
+        self.directory = os.path.dirname(base.path)
+
+    def apply_recorded(self, name: str, **params) -> tuple:
+        with self._lock:
+            recorded = super().apply_recorded(name, **params)
+            self._remove_unused_files()
+            return recorded
+
+    def frames(self) -> list:
+        return []
+
+    # Remove the dataset's files (when the session is dropped or replaced)
+    def close(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def _fit(self, frame, op):
+        return op
+
+    def _run(self, frame, op):
+        return OPERATIONS[op["op"]](frame, **op.get("params", {}))
+
+    def _profile(self, frame, previous=None, touched=None) -> dict:
+        if previous is None or touched is None or len(frame) != previous["rows"]:
+            return profile_chunks(frame.iter_chunks(), frame.dtypes)
+        # Re-profile only the touched and new columns, reading just those
+        stale = [col for col in frame.columns if col in set(touched) or col not in previous["columns"]]
+        fresh = profile_chunks(frame.iter_chunks(stale), frame.dtypes[stale])["columns"] if stale else {}
+        columns = {col: fresh[col] if col in fresh else previous["columns"][col] for col in frame.columns}
+        return {"rows": len(frame), "columns": columns}
+
+    def _prune_checkpoints(self):
+        pass
+
+    # Files written by undone operations or by intermediate pipeline steps
+    def _remove_unused_files(self):
+        used = {os.path.basename(frame.path) for frame in self._checkpoints.values()}
+        for name in os.listdir(self.directory):
+            if name.endswith(".parquet") and name not in used:
+                os.unlink(os.path.join(self.directory, name))
+
+    # Nothing to spill: every state already lives on disk
+    def spill_to(self, directory: str, write_frame):
+        pass
+
+    def reload_from(self, directory: str, read_frame):
+        pass
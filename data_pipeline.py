@@ -0,0 +1,157 @@
+# data_pipeline.py
+# Batched preprocessing: an ordered list of steps is planned, then run as one
+# "pipeline" entry in the session's OperationLog. Planning
+#  - pushes column drops as early as they can go, so nothing imputes, scales
+#    or encodes a column that is about to be dropped, and
+#  - fuses imputation directly followed by scaling of the same columns into
+#    a single impute-scale step.
+# Specs can be saved by name and replayed against newly uploaded files.
+import json
+import os
+import re
+import tempfile
+from typing import List
+
+from data_oplog import FILL_METHODS, OPERATIONS, OperationError
+
+# Where named pipeline specs are saved; outside the application tree, so the
+# app can run from a read-only install
+PIPELINE_DIR = os.environ.get("DATA_PIPELINE_DIR") or os.path.join(tempfile.gettempdir(), "data_pipelines")
+
+_PIPELINE_NAME_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Steps whose only effect on a column is rewriting it in place, so a later
+# drop of that column can move in front of them (and the wasted work is skipped)
+_COLUMNWISE = ("normalize", "impute-scale")
+
+
+def _is_columnwise(step) -> bool:
+    params = step["params"]
+    if step["op"] in _COLUMNWISE:
+        return True
+    if step["op"] == "handle-missing":
+        return params.get("method") in FILL_METHODS
+    if step["op"] == "encode-categorical":
+        return params.get("method") == "label"
+    return False
+
+
+def _can_move_before(step, dropped, input_columns) -> bool:
+    if _is_columnwise(step) or step["op"] == "drop-columns":
+        return True
+    # Dropping rows only depends on the subset columns
+    if step["op"] == "handle-missing" and step["params"].get("method") == "drop_rows":
+        return not set(step["params"].get("columns", [])) & set(dropped)
+    # One-hot encoding creates columns whose names depend on the data, so only
+    # drops of columns that existed before the pipeline may move past it
+    if step["op"] == "encode-categorical" and step["params"].get("method") == "onehot":
+        return set(dropped) <= input_columns and not set(step["params"]["columns"]) & set(dropped)
+    return False
+
+
+def _without_columns(step, dropped):
+    if not _is_columnwise(step):
+        return step
+    columns = [col for col in step["params"]["columns"] if col not in dropped]
+    if not columns:
+        return None
+    return {"op": step["op"], "params": {**step["params"], "columns": columns}}
+
+
+def _push_drops_forward(steps, input_columns):
+    planned = []
+    for step in steps:
+        if step["op"] != "drop-columns":
+            planned.append(step)
+            continue
+
+        dropped = list(step["params"]["columns"])
+        position = len(planned)
+        while position > 0 and _can_move_before(planned[position - 1], dropped, input_columns):
+            position -= 1
+
+        passed = [s for s in (_without_columns(s, dropped) for s in planned[position:]) if s is not None]
+        planned = planned[:position] + [{"op": "drop-columns", "params": {"columns": dropped}}] + passed
+    return _merge_drops(planned)
+
+
+def _merge_drops(steps):
+    planned = []
+    for step in steps:
+        if step["op"] == "drop-columns" and planned and planned[-1]["op"] == "drop-columns":
+            previous = planned[-1]["params"]["columns"]
+            merged = previous + [col for col in step["params"]["columns"] if col not in previous]
+            planned[-1] = {"op": "drop-columns", "params": {"columns": merged}}
+        else:
+            planned.append(step)
+    return planned
+
+
+def _fuse_impute_scale(steps):
+    planned = []
+    for step in steps:
+        previous = planned[-1] if planned else None
+        if (
+            previous is not None
+            and step["op"] == "normalize"
+            and previous["op"] == "handle-missing"
+            and previous["params"].get("method") in FILL_METHODS
+            and set(previous["params"]["columns"]) == set(step["params"]["columns"])
+        ):
+            planned[-1] = {
+                "op": "impute-scale",
+                "params": {
+                    "columns": list(step["params"]["columns"]),
+                    "impute": previous["params"]["method"],
+                    "scale": step["params"]["method"],
+                },
+            }
+        else:
+            planned.append(step)
+    return planned
+
+
+def validate_steps(steps: List[dict]):
+    if not steps:
+        raise OperationError("A pipeline needs at least one step.")
+    for i, step in enumerate(steps, start=1):
+        if step.get("op") not in OPERATIONS or step["op"] == "pipeline":
+            raise OperationError(f"Step {i}: unknown operation '{step.get('op')}'.")
+        columns = step.get("params", {}).get("columns")
+        if not isinstance(columns, list) or not columns:
+            raise OperationError(f"Step {i}: 'columns' must be a non-empty list.")
+
+
+# The steps that will actually run, in order, for a frame with `input_columns`
+def plan_pipeline(steps: List[dict], input_columns=()) -> List[dict]:
+    validate_steps(steps)
+    steps = [{"op": step["op"], "params": dict(step.get("params", {}))} for step in steps]
+    return _fuse_impute_scale(_push_drops_forward(steps, set(input_columns)))
+
+
+def _pipeline_path(name: str) -> str:
+    if not _PIPELINE_NAME_RE.match(name or ""):
+        raise OperationError("Pipeline names may only contain letters, digits, '-' and '_'.")
+    return os.path.join(PIPELINE_DIR, name + ".json")
+
+
+def save_pipeline(name: str, steps: List[dict]):
+    validate_steps(steps)
+    path = _pipeline_path(name)
+    os.makedirs(PIPELINE_DIR, exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"name": name, "steps": steps}, f, indent=2)
+
+
+def load_pipeline(name: str) -> List[dict]:
+    path = _pipeline_path(name)
+    if not os.path.exists(path):
+        raise OperationError(f"Pipeline '{name}' not found.")
+    with open(path) as f:
+        return json.load(f)["steps"]
+
+
+def list_pipelines() -> List[str]:
+    if not os.path.isdir(PIPELINE_DIR):
+        return []
+    return sorted(name[:-5] for name in os.listdir(PIPELINE_DIR) if name.endswith(".json"))
@@ -0,0 +1,56 @@
+# data_preview.py
+# Paging through the preprocessed frame. A page only slices the rows and
+# columns it returns; sorting needs one argsort of the sort column, which is
+# cached per dataset version so later pages are plain positional lookups.
+import os
+
+import numpy as np
+import pandas as pd
+
+from data_cache import LRUCache
+
+# Largest page a client may request
+MAX_PAGE_ROWS = int(os.environ.get("DATA_MAX_PAGE_ROWS", 10_000))
+# Memory for cached sort orders (8 bytes per row each)
+SORT_CACHE_MB = float(os.environ.get("DATA_SORT_CACHE_MB", 256))
+
+sort_cache = LRUCache(SORT_CACHE_MB * 1024 * 1024, sizeof=lambda order: order.nbytes)
+
+
+class PreviewError(ValueError):
+    pass
+
+
+# Row positions of `df` ordered by `column`, missing values last
+def sort_order(df: pd.DataFrame, column: str, descending: bool = False) -> np.ndarray:
+    ordered = df[column].reset_index(drop=True).sort_values(
+        ascending=not descending, kind="stable", na_position="last"
+    )
+    return ordered.index.to_numpy()
+
+
+def cached_sort_order(version: str, df: pd.DataFrame, column: str, descending: bool) -> np.ndarray:
+    key = (version, column, descending)
+    order = sort_cache.get(key)
+    if order is None:
+        order = sort_order(df, column, descending)
+        sort_cache.put(key, order)
+    return order
+
+
+def validate_page(df: pd.DataFrame, offset: int, limit: int, columns, sort):
+    if offset < 0:
+        raise PreviewError("Offset must not be negative.")
+    if limit < 1 or limit > MAX_PAGE_ROWS:
+        raise PreviewError(f"Limit must be between 1 and {MAX_PAGE_ROWS}.")
+    for col in list(columns or []) + ([sort] if sort else []):
+        if col not in df.columns:
+            raise PreviewError(f"Column '{col}' not found in the dataset.")
+
+
+# Slice one page: project the columns first, then take only the requested rows
+def page(df: pd.DataFrame, offset: int, limit: int, columns=None, order=None) -> pd.DataFrame:
+    projected = df[list(columns)] if columns else df
+    if order is not None:
+        return projected.iloc[order[offset:offset + limit]]
+    return projected.iloc[offset:offset + limit]
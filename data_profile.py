@@ -0,0 +1,178 @@
+# data_profile.py
+# Per-column profile of a dataset: dtype, null count, min/max, mean, distinct
+# estimate and memory. Built once at ingest and then updated only for the
+# columns each preprocessing operation touched, so status and preview calls
+# never rescan the whole frame. Out-of-core datasets are profiled chunk by
+# chunk with mergeable statistics (see profile_chunks).
+import math
+import os
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_datetime64_any_dtype, is_numeric_dtype
+
+# Columns with at most this many values get an exact distinct count
+EXACT_DISTINCT_ROWS = int(os.environ.get("DATA_EXACT_DISTINCT_ROWS", 1_000_000))
+# Number of minimum hash values kept by the KMV distinct estimator
+KMV_K = 4096
+
+
+def _scalar(value):
+    if value is None:
+        return None
+    if isinstance(value, (np.integer,)):
+        return int(value)
+    if isinstance(value, (np.floating, float)):
+        return None if math.isnan(value) or math.isinf(value) else float(value)
+    if isinstance(value, np.bool_):
+        return bool(value)
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if pd.isna(value):
+        return None
+    return value if isinstance(value, (int, str, bool)) else str(value)
+
+
+# K-minimum-values estimate of the number of distinct values
+def estimate_distinct(values: pd.Series) -> int:
+    n = len(values)
+    if n <= EXACT_DISTINCT_ROWS:
+        return int(values.nunique())
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    take = min(4 * KMV_K, n - 1)
+    smallest = np.unique(np.partition(hashes, take)[:take + 1])
+    if len(smallest) < KMV_K:
+        # Heavily duplicated column: few distinct values, exact count is cheap
+        return int(values.nunique())
+    kth = float(smallest[KMV_K - 1]) / 2.0 ** 64
+    return int((KMV_K - 1) / kth)
+
+
+# The KMV_K smallest distinct hashes of a column; sketches of separate chunks
+# merge with kmv_merge and give the same estimate as the whole column would
+def kmv_sketch(values: pd.Series) -> np.ndarray:
+    if is_numeric_dtype(values) and not is_bool_dtype(values):
+        # Hash 1 and 1.0 alike, since chunks of one column may differ in dtype
+        values = values.astype(np.float64)
+    hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+    return np.unique(hashes)[:KMV_K]
+
+
+def kmv_merge(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    return np.union1d(a, b)[:KMV_K]
+
+
+def kmv_estimate(sketch: np.ndarray) -> int:
+    if len(sketch) < KMV_K:
+        # Fewer distinct values than the sketch holds: the count is exact
+        return len(sketch)
+    kth = float(sketch[KMV_K - 1]) / 2.0 ** 64
+    return int((KMV_K - 1) / kth)
+
+
+def profile_column(series: pd.Series) -> dict:
+    null_count = int(series.isna().sum())
+    values = series.dropna() if null_count else series
+    profile = {
+        "dtype": str(series.dtype),
+        "type": "numeric" if is_numeric_dtype(series) else "categorical",
+        "null_count": null_count,
+        "min": None,
+        "max": None,
+        "mean": None,
+        "distinct": estimate_distinct(values),
+        "memory_bytes": int(series.memory_usage(deep=True, index=False)),
+    }
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Unordered categoricals have no min/max; report those of the values present
+        values = values.astype(values.cat.categories.dtype)
+    if len(values):
+        try:
+            profile["min"] = _scalar(values.min())
+            profile["max"] = _scalar(values.max())
+        except TypeError:
+            # Mixed-type object columns have no ordering
+            pass
+        if is_numeric_dtype(series) and not is_bool_dtype(series):
+            profile["mean"] = _scalar(values.mean())
+        elif is_datetime64_any_dtype(series):
+            profile["mean"] = _scalar(values.mean())
+    return profile
+
+
+def profile_frame(df: pd.DataFrame) -> dict:
+    return {"rows": len(df), "columns": {col: profile_column(df[col]) for col in df.columns}}
+
+
+# Profile of `df` derived from the profile of the frame it was computed from.
+# `touched` lists the columns the operation rewrote; None means every column.
+def update_profile(previous: dict, df: pd.DataFrame, touched=None) -> dict:
+    if previous is None or touched is None or len(df) != previous["rows"]:
+        return profile_frame(df)
+
+    touched = set(touched)
+    columns = {}
+    for col in df.columns:
+        if col in touched or col not in previous["columns"]:
+            columns[col] = profile_column(df[col])
+        else:
+            columns[col] = previous["columns"][col]
+    return {"rows": len(df), "columns": columns}
+
+
+# Profile of a dataset read as a sequence of row chunks (pandas frames), for
+# data that never fits in memory at once. `dtypes` maps each column to the
+# dtype of the whole dataset, since a single chunk may parse differently.
+def profile_chunks(chunks, dtypes) -> dict:
+    rows = 0
+    state = {
+        col: {"null_count": 0, "min": None, "max": None, "sum": 0.0, "count": 0,
+              "sketch": np.empty(0, dtype=np.uint64), "memory_bytes": 0, "ordered": True}
+        for col in dtypes.index
+    }
+    for chunk in chunks:
+        rows += len(chunk)
+        for col, acc in state.items():
+            series = chunk[col]
+            values = series.dropna()
+            acc["null_count"] += len(series) - len(values)
+            acc["memory_bytes"] += int(series.memory_usage(deep=True, index=False))
+            acc["sketch"] = kmv_merge(acc["sketch"], kmv_sketch(values))
+            if not len(values):
+                continue
+            if acc["ordered"]:
+                try:
+                    low, high = values.min(), values.max()
+                    acc["min"] = low if acc["min"] is None else min(acc["min"], low)
+                    acc["max"] = high if acc["max"] is None else max(acc["max"], high)
+                except TypeError:
+                    # Mixed-type object columns have no ordering
+                    acc["ordered"] = False
+                    acc["min"] = acc["max"] = None
+            if is_numeric_dtype(values) and not is_bool_dtype(values):
+                acc["sum"] += float(values.sum())
+                acc["count"] += len(values)
+
+    columns = {}
+    for col, acc in state.items():
+        dtype = dtypes[col]
+        numeric = is_numeric_dtype(dtype)
+        columns[col] = {
+            "dtype": str(dtype),
+            "type": "numeric" if numeric else "categorical",
+            "null_count": acc["null_count"],
+            "min": _scalar(acc["min"]),
+            "max": _scalar(acc["max"]),
+            "mean": _scalar(acc["sum"] / acc["count"]) if acc["count"] else None,
+            "distinct": kmv_estimate(acc["sketch"]),
+            "memory_bytes": acc["memory_bytes"],
+        }
+    return {"rows": rows, "columns": columns}
+
+
+def missing_values(profile: dict) -> dict:
+    return {col: stats["null_count"] for col, stats in profile["columns"].items()}
+
+
+def column_types(profile: dict) -> dict:
+    return {col: stats["type"] for col, stats in profile["columns"].items()}
@@ -0,0 +1,221 @@
+# data_store.py
+# Keyed, memory-bounded store for the datasets held by data.py.
+# Every session gets its own {"filename", "history", "source"} dict, where
+# "history" is the preprocessing OperationLog over the uploaded frame and
+# "source" identifies the upload in the ingest cache.
+# When the frames held in memory exceed the budget, the least recently used
+# sessions are written to Parquet on disk and reloaded on their next access.
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# RAM budget for all in-memory frames, in megabytes
+MEMORY_BUDGET_MB = float(os.environ.get("DATA_MEMORY_BUDGET_MB", 1024))
+# Where evicted sessions are written
+SPILL_DIR = os.environ.get("DATA_SPILL_DIR") or os.path.join(tempfile.gettempdir(), "data_sessions")
+# Sessions idle for longer than this are dropped entirely (seconds)
+SESSION_TTL = float(os.environ.get("DATA_SESSION_TTL", 24 * 3600))
+
+_SESSION_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id) -> bool:
+    return bool(session_id) and _SESSION_ID_RE.match(session_id) is not None
+
+
+# The per-session dataset dict handed to the request handlers
+class SessionData(dict):
+    def __init__(self, session_id):
+        super().__init__(filename=None, history=None, source=None)
+        self.session_id = session_id
+
+
+# Real memory held by a set of frames. Columns shared between frames
+# (copy-on-write shallow copies) are only counted once.
+def frames_memory(*frames) -> int:
+    seen = set()
+    total = 0
+    for df in frames:
+        if df is None:
+            continue
+        total += int(df.index.memory_usage(deep=True))
+        for _, series in df.items():
+            values = series.array
+            ndarray = getattr(values, "_ndarray", None)
+            if isinstance(ndarray, np.ndarray) and ndarray.dtype != object:
+                key = (ndarray.__array_interface__["data"][0], ndarray.nbytes)
+                if key in seen:
+                    continue
+                seen.add(key)
+                total += ndarray.nbytes
+            else:
+                total += int(series.memory_usage(deep=True, index=False))
+    return total
+
+
+class StoredSession:
+    def __init__(self, session_id):
+        self.data = SessionData(session_id)
+        self.nbytes = 0
+        # Identities of the frames nbytes was measured over
+        self.measured = ()
+        self.spilled = False
+        self.last_access = time.monotonic()
+        # Requests currently holding this session; active sessions are never evicted
+        self.active = 0
+
+
+class SessionStore:
+    def __init__(self, memory_budget_mb=MEMORY_BUDGET_MB, spill_dir=SPILL_DIR, session_ttl=SESSION_TTL):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self.spill_dir = spill_dir
+        self.session_ttl = session_ttl
+        # Least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.RLock()
+        self.evictions = 0
+        self.reloads = 0
+
+    # Fetch (or create) a session, reloading it from disk if it was evicted
+    def get(self, session_id) -> SessionData:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = StoredSession(session_id)
+                self._sessions[session_id] = entry
+            self._sessions.move_to_end(session_id)
+            entry.last_access = time.monotonic()
+            entry.active += 1
+            if entry.spilled:
+                self._reload(entry)
+            return entry.data
+
+    # Called once a request is done with a session: re-measure it and enforce
+    # the budget. Reads can change the frames held too (a reload from disk, a
+    # checkpoint materialized by undo or a preview), so the session is also
+    # re-measured whenever its set of frames is not the one last measured.
+    def release(self, session_id, modified=True):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return
+            entry.active = max(entry.active - 1, 0)
+            if not entry.spilled:
+                frames = self._frames(entry.data)
+                held = tuple(id(df) for df in frames)
+                if modified or held != entry.measured:
+                    entry.nbytes = frames_memory(*frames)
+                    entry.measured = held
+            self._expire_idle()
+            self._enforce_budget(keep=session_id)
+
+    def drop(self, session_id):
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            if entry is not None:
+                # Out-of-core datasets keep their own files on disk
+                for value in entry.data.values():
+                    if hasattr(value, "close"):
+                        value.close()
+                shutil.rmtree(self._session_dir(session_id), ignore_errors=True)
+
+    def memory_in_use(self) -> int:
+        with self._lock:
+            return sum(entry.nbytes for entry in self._sessions.values() if not entry.spilled)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "in_memory": sum(1 for entry in self._sessions.values() if not entry.spilled),
+                "spilled": sum(1 for entry in self._sessions.values() if entry.spilled),
+                "memory_bytes": self.memory_in_use(),
+                "memory_budget_bytes": self.memory_budget,
+                "evictions": self.evictions,
+                "reloads": self.reloads,
+            }
+
+    # Frames held by a session, either directly or through objects that
+    # expose frames() (such as the preprocessing OperationLog)
+    @staticmethod
+    def _frames(data) -> list:
+        frames = []
+        for value in data.values():
+            if isinstance(value, pd.DataFrame):
+                frames.append(value)
+            elif hasattr(value, "frames"):
+                frames.extend(value.frames())
+        return frames
+
+    def _session_dir(self, session_id) -> str:
+        return os.path.join(self.spill_dir, session_id)
+
+    def _enforce_budget(self, keep=None):
+        for session_id in list(self._sessions):
+            if self.memory_in_use() <= self.memory_budget:
+                break
+            entry = self._sessions[session_id]
+            if session_id == keep or entry.spilled or entry.active or entry.nbytes == 0:
+                continue
+            self._spill(entry)
+
+    def _expire_idle(self):
+        cutoff = time.monotonic() - self.session_ttl
+        for session_id, entry in list(self._sessions.items()):
+            if entry.last_access < cutoff and not entry.active:
+                self.drop(session_id)
+
+    def _spill(self, entry: StoredSession):
+        directory = self._session_dir(entry.data.session_id)
+        os.makedirs(directory, exist_ok=True)
+        for key, value in entry.data.items():
+            if isinstance(value, pd.DataFrame):
+                _write_frame(value, os.path.join(directory, key))
+                entry.data[key] = None
+            elif hasattr(value, "spill_to"):
+                # The object stays in the session and drops its own frames
+                value.spill_to(os.path.join(directory, key), _write_frame)
+        entry.spilled = True
+        self.evictions += 1
+
+    def _reload(self, entry: StoredSession):
+        directory = self._session_dir(entry.data.session_id)
+        for name in os.listdir(directory):
+            path = os.path.join(directory, name)
+            key, _ = os.path.splitext(name)
+            if os.path.isdir(path):
+                entry.data[key].reload_from(path, _read_frame)
+            else:
+                entry.data[key] = _read_frame(path)
+        shutil.rmtree(directory, ignore_errors=True)
+        entry.spilled = False
+        self.reloads += 1
+
+
+# Parquet keeps the spill compact and columnar; frames Parquet cannot
+# represent (mixed-type object columns, non-string labels) fall back to pickle
+def _write_frame(df: pd.DataFrame, path_stem: str):
+    try:
+        df.to_parquet(path_stem + ".parquet")
+    except Exception:
+        if os.path.exists(path_stem + ".parquet"):
+            os.unlink(path_stem + ".parquet")
+        df.to_pickle(path_stem + ".pkl")
+
+
+def _read_frame(path: str) -> pd.DataFrame:
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    return pd.read_pickle(path)
@@ -1,54 +1,192 @@
 from fastapi import FastAPI, Request, Form
-import mysql.connector
-import pandas as pd
+from typing import Dict, List, Optional
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
-from sklearn.metrics.pairwise import cosine_similarity
+from fastapi.responses import HTMLResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field
+import numpy as np
+from data_json import dumps
+from food_catalogue import CachedCatalogue
+from food_features import FeatureQueryError, FeatureStore
+from food_recommend import BATCH_CHUNK, BATCH_MAX_TARGETS, RECOMMEND_K, RECOMMEND_MAX_K, NutrientIndex
+from metrics import instrument, register_collector, span
 
 app = FastAPI()
+instrument(app, "food")
 templates = Jinja2Templates(directory="static")  # Your HTML should be inside static/index.html
 
+# Products from the database, pooled and cached in memory (see food_catalogue.py)
+catalogue = CachedCatalogue()
+# Normalized nutrient matrix for similarity search (see food_recommend.py)
+nutrients = NutrientIndex()
+# Every nutrient of the full CSV, standardized and memory-mapped (see food_features.py)
+features = FeatureStore()
+
+register_collector(
+    "food_catalogue_products", "gauge", "Products in the cached catalogue.", lambda: catalogue.stats()["products"]
+)
+register_collector(
+    "food_catalogue_loads_total", "counter", "Times the catalogue was read from the database.",
+    lambda: catalogue.loads
+)
+
 # Function to fetch all products
 def get_all_products():
-    conn = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",
-        database="food_system"
-    )
-    cursor = conn.cursor()
-    cursor.execute("SELECT * FROM tbl_product")
-    data = cursor.fetchall()
-    conn.close()
-    df = pd.DataFrame(data, columns=['id', 'p_name', 'p_type', 'protin', 'fat', 'carbos', 'description'])
-    return df.to_dict(orient="records")
+    return catalogue.get().records()
 
 # GET request to load all products
 @app.get("/", response_class=HTMLResponse)
 def show_products(request: Request):
     data = get_all_products()
-    return templates.TemplateResponse("index.html", {"request": request, "products": data})
+    with span("template"):
+        return templates.TemplateResponse(request, "index.html", {"products": data})
+
 
+# Load the nutrient matrix before the first request instead of during it
+@app.on_event("startup")
+def load_nutrients():
+    nutrients.load()
+    features.load()
 
-# Function to filter products based on nutrition values
+# Function to filter products based on nutrition values: the k products
+# (default FOOD_RECOMMEND_K, at most FOOD_RECOMMEND_MAX_K) most
+# cosine-similar in carbs, protein and fat
 @app.post("/submit", response_class=HTMLResponse)
-async def handle_form(
+def handle_form(
     request: Request,
     protin: float = Form(...),
     fat: float = Form(...),
-    carbos: float = Form(...)
+    carbos: float = Form(...),
+    k: Optional[int] = Form(None, ge=1, le=RECOMMEND_MAX_K)
 ):
-    df = pd.read_csv('D:\\FastAPI-Learning\\Indian_Food_Nutrition_Processed_Cleaned.csv')
-    data = get_all_products()
-    # Vector space for similarity
-    X = df[["Carbohydrates (g)", "Protein (g)", "Fats (g)"]].values
-    target = [[carbos, protin, fat]]
-    similarity_scores = cosine_similarity(target, X)[0]
-    top_5_indices = similarity_scores.argsort()[::][::-1]
-    top_5_products = [data[i] for i in top_5_indices]
-    return templates.TemplateResponse("index.html", {"request": request, "products": top_5_products})
+    products = catalogue.get()
+    # Nutrient rows and products line up by position; rows past the end of the
+    # catalogue are masked out of the search, so k is still filled from the rest
+    with span("similarity"):
+        [(top_indices, _)] = nutrients.query_batch(
+            [[carbos, protin, fat]], [k or RECOMMEND_K], [catalogue_mask(products, len(nutrients))]
+        )
+    top_products = products.records(top_indices.tolist())
+    with span("template"):
+        return templates.TemplateResponse(request, "index.html", {"products": top_products})
+
+
+# One nutrient target of a batch; p_type limits the answer to those dish types
+class Target(BaseModel):
+    protin: float
+    fat: float
+    carbos: float
+    k: Optional[int] = Field(None, ge=1)
+    p_type: Optional[List[int]] = None
+
+class RecommendBatch(BaseModel):
+    targets: List[Target]
+    # k of the targets that set none
+    k: Optional[int] = Field(None, ge=1)
+
+# Mask of the `size` nutrient rows that have a product in the catalogue
+# (None when all of them do)
+def catalogue_mask(products, size: int):
+    if len(products) >= size:
+        return None
+    listed = np.zeros(size, dtype=bool)
+    listed[:len(products)] = True
+    return listed
+
+# Masks of the nutrient rows with a product of the wanted dish types, one per
+# distinct filter; rows past the end of the catalogue never qualify
+def dish_type_masks(products, size: int, targets) -> list:
+    types = np.asarray(products.column("p_type")[:size])
+    listed = np.zeros(size, dtype=bool)
+    listed[:len(types)] = True
+    masks = {}
+    allowed = []
+    for target in targets:
+        key = None if target.p_type is None else tuple(sorted(set(target.p_type)))
+        if key not in masks:
+            if key is None:
+                masks[key] = catalogue_mask(products, size)
+            else:
+                masks[key] = listed.copy()
+                masks[key][:len(types)] = np.isin(types, key)
+        allowed.append(masks[key])
+    return allowed
+
+# Recommendations for many targets in one call, streamed as NDJSON: one line
+# {"item": i, "products": [...]} per target, in order, each product with its
+# cosine similarity as "score". Targets are searched BATCH_CHUNK at a time,
+# each chunk with one batched index query.
+@app.post("/recommend/batch")
+def recommend_batch(batch: RecommendBatch):
+    if not batch.targets:
+        return JSONResponse({"error": "No targets given."}, status_code=400)
+    if len(batch.targets) > BATCH_MAX_TARGETS:
+        return JSONResponse({"error": f"At most {BATCH_MAX_TARGETS} targets per request."}, status_code=400)
+    products = catalogue.get()
+    size = len(nutrients)
+    default_k = batch.k or RECOMMEND_K
+
+    def lines():
+        for start in range(0, len(batch.targets), BATCH_CHUNK):
+            targets = batch.targets[start:start + BATCH_CHUNK]
+            values = [[target.carbos, target.protin, target.fat] for target in targets]
+            ks = [target.k or default_k for target in targets]
+            with span("similarity"):
+                found = nutrients.query_batch(values, ks, dish_type_masks(products, size, targets))
+            chunk = []
+            for item, (positions, scores) in enumerate(found, start):
+                records = products.records(positions.tolist())
+                for record, score in zip(records, scores.tolist()):
+                    record["score"] = score
+                chunk.append(dumps({"item": item, "products": records}) + b"\n")
+            yield b"".join(chunk)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
+# Target values of any nutrients of the full CSV (see GET /recommend/nutrients),
+# in its units, each weighted by `weights` (default 1)
+class NutrientQuery(BaseModel):
+    targets: Dict[str, float]
+    weights: Dict[str, float] = {}
+    k: Optional[int] = Field(None, ge=1)
+    p_type: Optional[List[int]] = None
+
+# The k dishes closest to the targets over the standardized nutrients, each
+# product with its weighted distance
+@app.post("/recommend/nutrients")
+def recommend_nutrients(query: NutrientQuery):
+    if not query.targets:
+        return JSONResponse({"error": "No nutrient targets given."}, status_code=400)
+    products = catalogue.get()
+    allowed = dish_type_masks(products, len(features), [query])
+    try:
+        with span("similarity"):
+            [(positions, distances)] = features.query([query.targets], query.weights, query.k or RECOMMEND_K, allowed)
+    except FeatureQueryError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    # The mask already leaves out rows past the end of the catalogue
+    records = products.records(positions.tolist())
+    for record, distance in zip(records, distances.tolist()):
+        record["distance"] = distance
+    return {"products": records}
+
+# Nutrients a query can target
+@app.get("/recommend/nutrients")
+def list_nutrients():
+    return {"nutrients": features.nutrients()}
+
+
+# Drop the cached catalogue after the product table changed
+@app.post("/catalogue/invalidate")
+def invalidate_catalogue():
+    catalogue.invalidate()
+    return {"success": True}
+
+@app.get("/catalogue/stats")
+def catalogue_stats():
+    return {**catalogue.stats(), "nutrients": nutrients.stats(), "features": features.stats()}
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,171 @@
+# food_benchmark.py
+# Recall-versus-latency benchmark for the vector indexes behind food.py's
+# similarity search (food_index.py), to pick FOOD_VECTOR_INDEX by catalogue
+# size. Catalogues of any size are made by resampling the dishes of the
+# nutrition CSV with multiplicative noise, so the vectors keep the shape of
+# real nutrient profiles; queries are drawn the same way with another seed.
+#
+#   python food_benchmark.py run --rows 10000 100000 1000000 --output index_results.json
+#   python food_benchmark.py run --rows 1000000 --kinds ivfpq --nprobe 4 16 64 --rerank 0 256 1024
+#
+# For every catalogue size and index the results record build time, size on
+# disk, the time to load it back memory-mapped, single-query latency
+# percentiles, batch throughput and recall@k against the exact search.
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from food_index import INDEX_KINDS, IVF_NPROBE, IVF_RERANK, build_index, load_index, save_index
+from food_recommend import FEATURES, NUTRITION_CSV, unit_rows
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+DEFAULT_KINDS = list(INDEX_KINDS)
+# Spread of the multiplicative noise applied to resampled dishes
+NOISE = 0.15
+# Similarities this close to the exact k-th best count as ties
+TIE_TOLERANCE = 1e-6
+
+
+# `rows` unit vectors resampled from the dishes of the nutrition CSV
+def make_catalogue(rows: int, features=FEATURES, seed: int = 0, path: str = NUTRITION_CSV) -> np.ndarray:
+    dishes = pd.read_csv(path)[list(features)].to_numpy(dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    picked = dishes[rng.integers(0, len(dishes), rows)]
+    return unit_rows(picked * rng.lognormal(0.0, NOISE, picked.shape))
+
+
+def _percentiles(latencies: list) -> dict:
+    values = np.array(latencies) * 1000
+    return {
+        "p50": round(float(np.percentile(values, 50)), 4),
+        "p99": round(float(np.percentile(values, 99)), 4),
+        "mean": round(float(values.mean()), 4),
+    }
+
+
+# Share of the results whose true similarity reaches the exact k-th best. Plain
+# set overlap would miss results tied with the exact ones, and resampled
+# catalogues are full of near-ties.
+def _recall(found: np.ndarray, vectors: np.ndarray, queries: np.ndarray, kth: np.ndarray) -> float:
+    hits = 0
+    unit = unit_rows(queries)
+    for row, query, bound in zip(found, unit, kth):
+        row = row[row >= 0]
+        hits += int(np.sum(vectors[row] @ query >= bound - TIE_TOLERANCE))
+    return hits / found.size
+
+
+def _disk_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+# Latency of each query on its own, batch throughput and recall of one configuration
+def _measure(index, vectors: np.ndarray, queries: np.ndarray, kth: np.ndarray, k: int, **search) -> dict:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        index.search(query, k, **search)
+        latencies.append(time.perf_counter() - started)
+    started = time.perf_counter()
+    found, _ = index.search(queries, k, **search)
+    batch = time.perf_counter() - started
+    return {
+        "latency_ms": _percentiles(latencies),
+        "batch_queries_per_s": round(len(queries) / batch, 1),
+        f"recall_at_{k}": round(_recall(found, vectors, queries, kth), 4),
+    }
+
+
+def _bench_kind(kind: str, vectors: np.ndarray, queries: np.ndarray, kth: np.ndarray, k: int,
+                nprobe: list, rerank: list, directory: str) -> list:
+    started = time.perf_counter()
+    index = build_index(kind, vectors)
+    build_s = time.perf_counter() - started
+    path = os.path.join(directory, kind)
+    save_index(index, path)
+    started = time.perf_counter()
+    index = load_index(path, mmap=True)
+    load_s = time.perf_counter() - started
+
+    common = {
+        "index": kind,
+        "build_s": round(build_s, 3),
+        "disk_bytes": _disk_bytes(path),
+        "mmap_load_ms": round(load_s * 1000, 3),
+    }
+    # The IVF-PQ index trades recall for speed through the number of lists it
+    # scans and of candidates it re-ranks exactly
+    settings = [{"nprobe": p, "rerank": r} for p in nprobe for r in rerank] if kind == "ivfpq" else [{}]
+    return [{**common, **setting, **_measure(index, vectors, queries, kth, k, **setting)} for setting in settings]
+
+
+def run_benchmarks(rows=DEFAULT_ROWS, kinds=DEFAULT_KINDS, queries=200, k=10, nprobe=None, rerank=None,
+                   seed=0) -> dict:
+    nprobe = nprobe or [IVF_NPROBE]
+    rerank = rerank or [IVF_RERANK]
+    results = []
+    for n in rows:
+        vectors = make_catalogue(n, seed=seed)
+        targets = make_catalogue(queries, seed=seed + 1)
+        kth = build_index("exact", vectors).search(targets, k)[1][:, -1]
+        print(f"{n} vectors", file=sys.stderr)
+        directory = tempfile.mkdtemp(prefix="food_bench_")
+        try:
+            for kind in kinds:
+                for result in _bench_kind(kind, vectors, targets, kth, k, nprobe, rerank, directory):
+                    results.append({"rows": n, **result})
+                    label = kind + (f" {result['nprobe']}/{result['rerank']}" if "nprobe" in result else "")
+                    print(f"  {label:<18} p50 {result['latency_ms']['p50']:>9.3f} ms  "
+                          f"recall@{k} {result[f'recall_at_{k}']:.3f}  build {result['build_s']:>7.2f} s  "
+                          f"{result['disk_bytes'] / 1024 ** 2:>8.1f} MB", file=sys.stderr)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+    return {
+        "meta": {
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "features": list(FEATURES),
+            "queries": queries,
+            "k": k,
+        },
+        "results": results,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the nutrient similarity indexes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="measure recall and latency of every index")
+    run.add_argument("--rows", type=int, nargs="+", default=DEFAULT_ROWS)
+    run.add_argument("--kinds", nargs="+", choices=DEFAULT_KINDS, default=DEFAULT_KINDS)
+    run.add_argument("--queries", type=int, default=200)
+    run.add_argument("-k", type=int, default=10)
+    run.add_argument("--nprobe", type=int, nargs="+", help="IVF-PQ lists scanned per query (default: FOOD_IVF_NPROBE)")
+    run.add_argument("--rerank", type=int, nargs="+",
+                     help="IVF-PQ candidates re-ranked exactly per query (default: FOOD_IVF_RERANK)")
+    run.add_argument("--output", default="index_results.json")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        results = run_benchmarks(args.rows, args.kinds, args.queries, args.k, args.nprobe, args.rerank)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+# food_catalogue.py
+# Product catalogue for food.py. Products are read from the database through
+# a connection pool and kept in memory, one tuple per column, for
+# FOOD_CATALOGUE_TTL seconds or until invalidate() is called, so page loads
+# never wait for a database connection.
+# The database is pluggable: MySQL by default, or a local SQLite file
+# (FOOD_DB_BACKEND=sqlite) for tests and benchmarks. The SQLite file is
+# created on first use and filled from the nutrition CSV shipped with the repo.
+import csv
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from metrics import span
+
+try:
+    import mysql.connector
+    import mysql.connector.pooling
+except ImportError:  # only needed with the MySQL backend
+    mysql = None
+
+PRODUCT_COLUMNS = ("id", "p_name", "p_type", "protin", "fat", "carbos", "description")
+# Rows come back in id order, which is the order they were loaded from the nutrition CSV
+PRODUCTS_QUERY = f"SELECT {', '.join(PRODUCT_COLUMNS)} FROM tbl_product ORDER BY id"
+
+# "mysql" or "sqlite"
+DB_BACKEND = os.environ.get("FOOD_DB_BACKEND", "mysql").lower()
+DB_HOST = os.environ.get("FOOD_DB_HOST", "localhost")
+DB_USER = os.environ.get("FOOD_DB_USER", "root")
+DB_PASSWORD = os.environ.get("FOOD_DB_PASSWORD", "")
+DB_NAME = os.environ.get("FOOD_DB_NAME", "food_system")
+# Connections kept open by the pool
+DB_POOL_SIZE = int(os.environ.get("FOOD_DB_POOL_SIZE", 4))
+SQLITE_PATH = os.environ.get("FOOD_SQLITE_PATH", "food_system.sqlite3")
+# CSV the SQLite stand-in is filled from
+SEED_CSV = os.environ.get("FOOD_SEED_CSV", "Indian_Food_Nutrition_Processed_Cleaned.csv")
+# Seconds a loaded catalogue is served before it is read again (0: every request)
+CATALOGUE_TTL = float(os.environ.get("FOOD_CATALOGUE_TTL", 300))
+
+logger = logging.getLogger("food_catalogue")
+
+
+class CatalogueError(RuntimeError):
+    pass
+
+
+class MySQLBackend:
+    def __init__(self, host=DB_HOST, user=DB_USER, password=DB_PASSWORD, database=DB_NAME, pool_size=DB_POOL_SIZE):
+        self.config = {"host": host, "user": user, "password": password, "database": database}
+        self.pool_size = pool_size
+        self._pool = None
+        # The connector's pool raises instead of waiting when every connection is out
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._lock = threading.Lock()
+
+    def _connection(self):
+        if mysql is None:
+            raise CatalogueError("The MySQL backend requires mysql-connector-python to be installed.")
+        with self._lock:
+            # Created on first use, so the app starts without a reachable database
+            if self._pool is None:
+                self._pool = mysql.connector.pooling.MySQLConnectionPool(
+                    pool_name="food", pool_size=self.pool_size, **self.config
+                )
+        return self._pool.get_connection()
+
+    def fetch_products(self) -> list:
+        with self._slots:
+            conn = self._connection()
+            try:
+                cursor = conn.cursor()
+                cursor.execute(PRODUCTS_QUERY)
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                # Returns the connection to the pool
+                conn.close()
+        return rows
+
+
+class SQLiteBackend:
+    def __init__(self, path=SQLITE_PATH, pool_size=DB_POOL_SIZE, seed_csv=SEED_CSV):
+        self.path = path
+        self.seed_csv = seed_csv
+        self._pool = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(pool_size)
+        self._seed_lock = threading.Lock()
+        self._seeded = False
+
+    def _connection(self):
+        try:
+            return self._pool.get_nowait()
+        except queue.Empty:
+            return sqlite3.connect(self.path, check_same_thread=False)
+
+    def _ensure_table(self, conn):
+        with self._seed_lock:
+            if self._seeded:
+                return
+            exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tbl_product'").fetchone()
+            if not exists:
+                seed_sqlite(conn, self.seed_csv)
+            self._seeded = True
+
+    def fetch_products(self) -> list:
+        with self._slots:
+            conn = self._connection()
+            try:
+                self._ensure_table(conn)
+                rows = conn.execute(PRODUCTS_QUERY).fetchall()
+            except BaseException:
+                conn.close()
+                raise
+            self._pool.put(conn)
+        return rows
+
+
+# Create tbl_product in a SQLite database and fill it from the nutrition CSV,
+# in file order. Dish types and descriptions are not in the CSV.
+def seed_sqlite(conn, csv_path=SEED_CSV):
+    with open(csv_path, newline="", encoding="utf-8") as f:
+        rows = [
+            (number, row["Dish Name"], 0, float(row["Protein (g)"]), float(row["Fats (g)"]),
+             float(row["Carbohydrates (g)"]), "")
+            for number, row in enumerate(csv.DictReader(f), start=1)
+        ]
+    with conn:
+        conn.execute(
+            "CREATE TABLE tbl_product (id INTEGER PRIMARY KEY, p_name TEXT, p_type INTEGER, "
+            "protin REAL, fat REAL, carbos REAL, description TEXT)"
+        )
+        conn.executemany(f"INSERT INTO tbl_product VALUES ({', '.join('?' * len(PRODUCT_COLUMNS))})", rows)
+
+
+BACKENDS = {"mysql": MySQLBackend, "sqlite": SQLiteBackend}
+
+
+def make_backend(name: str = DB_BACKEND):
+    if name not in BACKENDS:
+        raise CatalogueError(f"Unknown database backend '{name}'. Use one of: {', '.join(BACKENDS)}.")
+    return BACKENDS[name]()
+
+
+# The products, stored column-wise: one tuple per field instead of a dict per row
+class ProductCatalogue:
+    def __init__(self, rows):
+        rows = list(rows)
+        values = zip(*rows) if rows else ((),) * len(PRODUCT_COLUMNS)
+        self.columns = dict(zip(PRODUCT_COLUMNS, values))
+
+    def __len__(self) -> int:
+        return len(self.columns["id"])
+
+    def column(self, name: str) -> tuple:
+        return self.columns[name]
+
+    # Rows as dicts (for the templates), all of them or those at `indices`
+    def records(self, indices=None) -> list:
+        columns = [self.columns[name] for name in PRODUCT_COLUMNS]
+        if indices is None:
+            return [dict(zip(PRODUCT_COLUMNS, row)) for row in zip(*columns)]
+        return [dict(zip(PRODUCT_COLUMNS, [column[i] for column in columns])) for i in indices]
+
+
+# The catalogue last read from the backend, reloaded once it is older than
+# `ttl` seconds. Concurrent requests for a stale catalogue wait for a single
+# reload. If a reload fails, the previous catalogue is served until the next try.
+class CachedCatalogue:
+    def __init__(self, backend=None, ttl: float = CATALOGUE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.loads = 0
+        self._catalogue = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _fresh(self) -> bool:
+        return self._catalogue is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    def get(self) -> ProductCatalogue:
+        if self._fresh():
+            self.hits += 1
+            return self._catalogue
+        with self._lock:
+            if self._fresh():
+                self.hits += 1
+                return self._catalogue
+            if self.backend is None:
+                self.backend = make_backend()
+            try:
+                with span("catalogue_fetch"):
+                    rows = self.backend.fetch_products()
+            except Exception:
+                if self._catalogue is None:
+                    raise
+                logger.exception("Reloading the product catalogue failed; serving the previous one")
+                # Retry on the next request after another TTL, not on every request
+                self._loaded_at = time.monotonic()
+                return self._catalogue
+            self._catalogue = ProductCatalogue(rows)
+            self._loaded_at = time.monotonic()
+            self.loads += 1
+            return self._catalogue
+
+    # Drop the cached catalogue; the next request reads the database again
+    def invalidate(self):
+        with self._lock:
+            self._catalogue = None
+
+    def stats(self) -> dict:
+        catalogue = self._catalogue
+        return {
+            "products": 0 if catalogue is None else len(catalogue),
+            "age_seconds": None if catalogue is None else round(time.monotonic() - self._loaded_at, 3),
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "loads": self.loads,
+        }
@@ -0,0 +1,265 @@
+# food_features.py
+# Feature store for weighted similarity over every nutrient of the full
+# nutrition CSV (calories, macronutrients, sugar, fibre, sodium, calcium,
+# iron, vitamin C and folate). The CSV is converted once into a directory of
+# .npy files: each column standardized to mean 0 and standard deviation 1, so
+# sodium and calcium in milligrams no longer outweigh grams of protein, and
+# stored as float32. Every process opens the files memory-mapped, so all
+# uvicorn workers share one copy of the pages in the OS cache instead of each
+# holding its own matrix. Each CSV gets its own store under FEATURE_DIR, named
+# after its path, and the store is rebuilt when the CSV changes.
+#
+# A query is a set of nutrient targets in their original units, each with a
+# weight (1 unless given). Dishes are ranked by the weighted squared
+# euclidean distance between standardized values,
+#   d = sum_j w_j (x_j - t_j)^2 = sum_j w_j x_j^2 - 2 sum_j w_j t_j x_j + sum_j w_j t_j^2,
+# so the store keeps [x | x^2] side by side and a whole batch of queries is
+# scored in one matrix product with the columns [-2 w t | w].
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from food_index import SCORE_BLOCK, top_k_rows
+from food_recommend import RECOMMEND_K, RELOAD_CHECK_SECONDS
+from metrics import span
+
+# The full nutrition table; row i describes the product at position i of the catalogue
+FEATURE_CSV = os.environ.get("FOOD_FEATURE_CSV") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Indian_Food_Nutrition_Processed.csv"
+)
+# Where stores are built, one subdirectory per CSV; every worker maps the same files
+FEATURE_DIR = os.environ.get("FOOD_FEATURE_DIR") or os.path.join(tempfile.gettempdir(), "food_features")
+# Column holding the dish name; every other numeric column is a nutrient
+NAME_COLUMN = "Dish Name"
+# Attempts at opening a store another worker is replacing at the same moment
+OPEN_ATTEMPTS = 5
+
+logger = logging.getLogger("food_features")
+
+
+class FeatureQueryError(ValueError):
+    pass
+
+
+# Short name of a nutrient column, as used in queries: "Vitamin C (mg)" -> "vitamin_c"
+def nutrient_key(column: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", re.sub(r"\(.*?\)", "", column).lower()).strip("_")
+
+
+# Arrays of the store for a nutrition table: the standardized values followed
+# by their squares, column-major, and the mean and deviation of each column
+def standardize(df: pd.DataFrame, columns: list) -> dict:
+    values = df[columns].to_numpy(dtype=np.float64)
+    mean = np.nanmean(values, axis=0) if len(values) else np.zeros(len(columns))
+    std = np.nanstd(values, axis=0) if len(values) else np.ones(len(columns))
+    std[~(std > 0)] = 1
+    mean = np.nan_to_num(mean)
+    # Missing values sit at the column mean
+    scaled = np.nan_to_num((values - mean) / std)
+    return {
+        "features": np.asfortranarray(np.hstack([scaled, scaled ** 2]), dtype=np.float32),
+        "mean": mean.astype(np.float32),
+        "std": std.astype(np.float32),
+    }
+
+
+# Store directory of the CSV at `path` under `root`
+def store_directory(path: str, root: str = FEATURE_DIR) -> str:
+    path = os.path.abspath(path)
+    key = hashlib.sha1(path.encode()).hexdigest()[:16]
+    return os.path.join(root, f"{os.path.splitext(os.path.basename(path))[0]}-{key}")
+
+
+def _signature(path: str) -> list:
+    stat = os.stat(path)
+    return [os.path.abspath(path), stat.st_mtime_ns, stat.st_size]
+
+
+# Write the store for `path` under `directory`, atomically: a concurrent
+# reader sees either the old store or the complete new one
+def build_store(path: str, directory: str) -> dict:
+    signature = _signature(path)
+    df = pd.read_csv(path)
+    columns = [column for column in df.columns if column != NAME_COLUMN and pd.api.types.is_numeric_dtype(df[column])]
+    arrays = standardize(df, columns)
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(staging, name + ".npy"), array)
+        meta = {"columns": columns, "rows": len(df), "source": signature}
+        with open(os.path.join(staging, "store.json"), "w") as f:
+            json.dump(meta, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except OSError:
+        # Another worker put its store in place first; it describes the same file
+        shutil.rmtree(staging, ignore_errors=True)
+        if not os.path.exists(os.path.join(directory, "store.json")):
+            raise
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return meta
+
+
+# The store in `directory` with its arrays memory-mapped (None if there is
+# none). A build in another worker replaces the whole directory, so arrays
+# vanishing after store.json was read mean a new store is moving in: read it
+# again, a few times, before treating the store as missing.
+def open_store(directory: str):
+    for attempt in range(OPEN_ATTEMPTS):
+        if attempt:
+            time.sleep(0.01 * 2 ** attempt)
+        try:
+            with open(os.path.join(directory, "store.json")) as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        try:
+            arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode="r")
+                      for name in ("features", "mean", "std")}
+        except FileNotFoundError:
+            continue
+        return meta, arrays
+    return None
+
+
+class FeatureStore:
+    def __init__(self, path: str = FEATURE_CSV, root: str = FEATURE_DIR,
+                 check_every: float = RELOAD_CHECK_SECONDS):
+        self.path = path
+        self.directory = store_directory(path, root)
+        self.check_every = check_every
+        self.builds = 0
+        self.reloads = 0
+        # (meta, arrays, keys), swapped as a whole on reload
+        self._state = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    # Open the store, building it first if it is missing or older than the CSV
+    def load(self):
+        with self._lock:
+            with span("features_load"):
+                opened = open_store(self.directory)
+                if opened is None or opened[0]["source"] != _signature(self.path):
+                    build_store(self.path, self.directory)
+                    self.builds += 1
+                    opened = open_store(self.directory)
+            if opened is None:
+                raise FileNotFoundError(f"The feature store in {self.directory} was removed while opening it")
+            meta, arrays = opened
+            if self._state is not None:
+                self.reloads += 1
+            self._state = (meta, arrays, {nutrient_key(column): i for i, column in enumerate(meta["columns"])})
+            self._checked_at = time.monotonic()
+
+    def _current(self):
+        state = self._state
+        if state is None:
+            self.load()
+            return self._state
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_every:
+            self._checked_at = now
+            try:
+                if _signature(self.path) != state[0]["source"]:
+                    self.load()
+            except (OSError, ValueError, KeyError):
+                # Removed or half written: keep serving what was mapped
+                logger.exception("Rebuilding the feature store from %s failed; serving the previous one", self.path)
+            return self._state
+        return state
+
+    def __len__(self) -> int:
+        return self._current()[0]["rows"]
+
+    # Nutrient keys, in column order
+    def nutrients(self) -> list:
+        return list(self._current()[2])
+
+    # (standardized targets, weights) arrays for a batch of queries; nutrients
+    # a query leaves out get weight 0
+    def _query_arrays(self, state, targets, weights):
+        meta, arrays, keys = state
+        values = np.zeros((len(targets), len(keys)), dtype=np.float32)
+        scale = np.zeros((len(targets), len(keys)), dtype=np.float32)
+        for row, (target, weight) in enumerate(zip(targets, weights)):
+            weight = weight or {}
+            unknown = sorted((set(target) | set(weight)) - set(keys))
+            if unknown:
+                raise FeatureQueryError(
+                    f"Unknown nutrient(s): {', '.join(unknown)}. Use any of: {', '.join(keys)}."
+                )
+            for key, value in target.items():
+                column = keys[key]
+                values[row, column] = value
+                scale[row, column] = weight.get(key, 1.0)
+        if (scale < 0).any():
+            raise FeatureQueryError("Nutrient weights cannot be negative.")
+        return (values - arrays["mean"]) / arrays["std"], scale
+
+    # Positions and weighted distances of the k dishes closest to each target,
+    # nearest first. `targets` is a list of {nutrient: value} in the CSV's
+    # units, `weights` one {nutrient: weight} for all targets or a list of
+    # them, and `allowed` optionally a boolean mask over positions per target
+    # (positions past its end never qualify). Returns a list of
+    # (positions, distances) pairs, one per target.
+    def query(self, targets, weights=None, k: int = RECOMMEND_K, allowed=None) -> list:
+        state = self._current()
+        features = state[1]["features"]
+        rows = len(features)
+        if weights is None or isinstance(weights, dict):
+            weights = [weights] * len(targets)
+        values, scale = self._query_arrays(state, targets, weights)
+        # Columns matching [x | x^2], and the constant sum_j w_j t_j^2
+        coefficients = np.hstack([-2 * scale * values, scale])
+        constant = (scale * values ** 2).sum(axis=1)
+
+        # Masks padded or cut to the store's rows, once per distinct mask
+        passing = {}
+        for mask in allowed or ():
+            if mask is not None and id(mask) not in passing:
+                passing[id(mask)] = np.zeros(rows, dtype=bool)
+                passing[id(mask)][:min(len(mask), rows)] = mask[:rows]
+
+        results = []
+        step = max(1, SCORE_BLOCK // max(rows, 1))
+        for start in range(0, len(targets), step):
+            block = slice(start, start + step)
+            # One product over the mapped matrix scores the whole block
+            distances = (features @ coefficients[block].T).T + constant[block, None]
+            if allowed is not None:
+                for row, mask in enumerate(allowed[block]):
+                    if mask is not None:
+                        distances[row, ~passing[id(mask)]] = np.inf
+            positions, scores = top_k_rows(-distances, max(1, k))
+            for found, score in zip(positions, scores):
+                keep = np.isfinite(score)
+                results.append((found[keep], np.sqrt(np.maximum(-score[keep], 0))))
+        return results
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "dishes": 0 if state is None else state[0]["rows"],
+            "nutrients": [] if state is None else list(state[2]),
+            "path": self.path,
+            "directory": self.directory,
+            "mapped_bytes": 0 if state is None else sum(array.nbytes for array in state[1].values()),
+            "builds": self.builds,
+            "reloads": self.reloads,
+        }
@@ -0,0 +1,388 @@
+# food_index.py
+# Vector indexes for the nutrient similarity search in food_recommend.py.
+# Vectors are unit length, so the highest cosine similarity is the largest
+# inner product and also the nearest neighbour in euclidean distance
+# (|a - b|^2 = 2 - 2 a.b). Every index answers a batch of queries at once,
+# returning (indices, scores) arrays of shape (queries, k), best first, padded
+# with -1 / -inf when fewer than k vectors qualify. Indexes are saved to a
+# directory of .npy files and loaded back memory-mapped, so a large index is
+# paged in on demand and shared by every process that opens it.
+#  - "exact": brute force, one matrix product per batch of queries
+#  - "kdtree" / "balltree": sklearn trees over the vectors, exact
+#  - "ivfpq": inverted file with product quantization, approximate. Vectors
+#    are grouped into lists around k-means centroids and stored as one byte
+#    per subspace of their residual. A query scans the `nprobe` lists with
+#    the closest centroids, scores their vectors from the codes with lookup
+#    tables, and re-ranks the best `rerank` candidates exactly.
+import json
+import os
+import pickle
+import shutil
+import uuid
+
+import numpy as np
+
+# Entries of a (queries x vectors) score block computed at once by brute force
+SCORE_BLOCK = int(os.environ.get("FOOD_INDEX_SCORE_BLOCK", 16 * 1024 * 1024))
+# Lists scanned per query by the IVF-PQ index
+IVF_NPROBE = int(os.environ.get("FOOD_IVF_NPROBE", 8))
+# Candidates re-ranked exactly per query by the IVF-PQ index (0: codes only)
+IVF_RERANK = int(os.environ.get("FOOD_IVF_RERANK", 256))
+# Rows k-means is trained on per centroid, and at most in total
+KMEANS_ROWS_PER_CENTROID = 64
+KMEANS_SAMPLE = 100_000
+
+
+class VectorIndexError(ValueError):
+    pass
+
+
+# Positions and values of the k largest scores in every row, best first
+def top_k_rows(scores: np.ndarray, k: int):
+    n = scores.shape[1]
+    k = min(k, n)
+    if k < n:
+        positions = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        positions = np.broadcast_to(np.arange(n), scores.shape).copy()
+    values = np.take_along_axis(scores, positions, 1)
+    order = np.argsort(-values, axis=1, kind="stable")
+    return np.take_along_axis(positions, order, 1), np.take_along_axis(values, order, 1)
+
+
+# Widen (indices, scores) to k columns with -1 / -inf
+def _pad(indices: np.ndarray, scores: np.ndarray, k: int):
+    missing = k - indices.shape[1]
+    if missing <= 0:
+        return indices, scores
+    rows = indices.shape[0]
+    return (np.hstack([indices, np.full((rows, missing), -1, dtype=np.int64)]),
+            np.hstack([scores, np.full((rows, missing), -np.inf, dtype=np.float32)]))
+
+
+# Queries as a 2-D float32 array of unit rows (zero rows stay zero)
+def _as_queries(queries) -> np.ndarray:
+    queries = np.asarray(queries, dtype=np.float32)
+    if queries.ndim == 1:
+        queries = queries[None, :]
+    norms = np.linalg.norm(queries, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return queries / norms
+
+
+class VectorIndex:
+    kind = None
+
+    def __len__(self) -> int:
+        raise NotImplementedError
+
+    def search(self, queries, k: int):
+        raise NotImplementedError
+
+    # search() that may not miss any vector, for callers that filter the
+    # results and need every candidate; exact indexes need nothing more
+    def search_exhaustive(self, queries, k: int):
+        return self.search(queries, k)
+
+    # Arrays saved as .npy files and settings saved as JSON
+    def _arrays(self) -> dict:
+        raise NotImplementedError
+
+    def _settings(self) -> dict:
+        return {}
+
+    # Anything that is neither an array nor a setting
+    def _save_extra(self, directory: str):
+        pass
+
+    @classmethod
+    def _restore(cls, arrays: dict, settings: dict, directory: str):
+        raise NotImplementedError
+
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self._arrays().values())
+
+
+class ExactIndex(VectorIndex):
+    kind = "exact"
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    @classmethod
+    def build(cls, vectors: np.ndarray):
+        return cls(np.ascontiguousarray(vectors, dtype=np.float32))
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    def search(self, queries, k: int):
+        queries = _as_queries(queries)
+        if not len(self.vectors):
+            return _pad(np.empty((len(queries), 0), np.int64), np.empty((len(queries), 0), np.float32), k)
+        # Score blocks of queries so the block stays within SCORE_BLOCK entries
+        step = max(1, SCORE_BLOCK // len(self.vectors))
+        parts = [top_k_rows(queries[start:start + step] @ self.vectors.T, k) for start in range(0, len(queries), step)]
+        indices = np.vstack([part[0] for part in parts])
+        scores = np.vstack([part[1] for part in parts])
+        return _pad(indices.astype(np.int64), scores, k)
+
+    def _arrays(self) -> dict:
+        return {"vectors": self.vectors}
+
+    @classmethod
+    def _restore(cls, arrays, settings, directory):
+        return cls(arrays["vectors"])
+
+
+# sklearn KD or ball tree over the non-zero vectors (a zero vector scores 0
+# against every query, so it is only ever a filler). The tree's state is
+# saved array by array, so a loaded tree works on the memory-mapped arrays.
+class TreeIndex(VectorIndex):
+    kind = "kdtree"
+    leaf_size = 40
+
+    def __init__(self, tree, ids: np.ndarray, size: int):
+        self.tree = tree
+        self.ids = ids
+        self.size = size
+
+    @staticmethod
+    def _tree_class(kind):
+        from sklearn.neighbors import BallTree, KDTree
+        return KDTree if kind == "kdtree" else BallTree
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, leaf_size: int = None):
+        ids = np.flatnonzero(np.any(vectors != 0, axis=1))
+        data = np.asarray(vectors[ids], dtype=np.float64)
+        tree = cls._tree_class(cls.kind)(data, leaf_size=leaf_size or cls.leaf_size)
+        return cls(tree, ids, len(vectors))
+
+    def __len__(self) -> int:
+        return self.size
+
+    def search(self, queries, k: int):
+        queries = _as_queries(queries)
+        found = min(k, len(self.ids))
+        if not found:
+            return _pad(np.empty((len(queries), 0), np.int64), np.empty((len(queries), 0), np.float32), k)
+        distances, positions = self.tree.query(queries, k=found)
+        scores = (1 - distances ** 2 / 2).astype(np.float32)
+        # A zero query is equally far from everything
+        scores[~queries.any(axis=1)] = 0
+        return _pad(self.ids[positions], scores, k)
+
+    def _arrays(self) -> dict:
+        arrays = {"ids": self.ids}
+        for position, value in enumerate(self.tree.__getstate__()):
+            if isinstance(value, np.ndarray):
+                arrays[f"tree_{position}"] = value
+        return arrays
+
+    def _save_extra(self, directory: str):
+        # Everything in the tree's state that is not an array (sizes, the metric)
+        state = [None if isinstance(value, np.ndarray) else value for value in self.tree.__getstate__()]
+        with open(os.path.join(directory, "tree_state.pkl"), "wb") as f:
+            pickle.dump(state, f)
+
+    def _settings(self) -> dict:
+        return {"size": self.size}
+
+    @classmethod
+    def _restore(cls, arrays, settings, directory):
+        with open(os.path.join(directory, "tree_state.pkl"), "rb") as f:
+            state = pickle.load(f)
+        state = tuple(arrays.get(f"tree_{position}", value) for position, value in enumerate(state))
+        tree_class = cls._tree_class(cls.kind)
+        tree = tree_class.__new__(tree_class)
+        tree.__setstate__(state)
+        return cls(tree, arrays["ids"], settings["size"])
+
+
+class BallTreeIndex(TreeIndex):
+    kind = "balltree"
+
+
+# Nearest centroid of every row, a block of rows at a time: the largest
+# x.c - |c|^2 / 2, which drops the |x|^2 term of the euclidean distance
+def _assign(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    if centroids.shape[1] == 1:
+        # One dimension: binary search between the sorted centroids
+        order = np.argsort(centroids[:, 0])
+        ordered = centroids[order, 0]
+        return order[np.searchsorted((ordered[1:] + ordered[:-1]) / 2, data[:, 0])]
+    half_norms = np.einsum("ij,ij->i", centroids, centroids) / 2
+    labels = np.empty(len(data), dtype=np.int64)
+    step = max(1, SCORE_BLOCK // max(len(centroids), 1))
+    for start in range(0, len(data), step):
+        scores = data[start:start + step] @ centroids.T
+        scores -= half_norms
+        labels[start:start + step] = scores.argmax(axis=1)
+    return labels
+
+
+# Lloyd's k-means; empty clusters are re-seeded with random rows
+def kmeans(data: np.ndarray, clusters: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    data = np.asarray(data, dtype=np.float32)
+    clusters = min(clusters, len(data))
+    centroids = data[rng.choice(len(data), clusters, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(data, centroids)
+        counts = np.bincount(labels, minlength=clusters)
+        sums = np.stack([np.bincount(labels, weights=data[:, j], minlength=clusters)
+                         for j in range(data.shape[1])], axis=1)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids
+
+
+class IVFPQIndex(VectorIndex):
+    kind = "ivfpq"
+
+    def __init__(self, centroids, codebooks, offsets, ids, codes, vectors, nprobe=IVF_NPROBE, rerank=IVF_RERANK):
+        # centroids: (lists, d); codebooks: (subspaces, codes per subspace, d / subspaces)
+        # offsets: start of every list in the list-ordered ids / codes / vectors
+        self.centroids = centroids
+        self.codebooks = codebooks
+        self.offsets = offsets
+        self.ids = ids
+        self.codes = codes
+        self.vectors = vectors
+        self.nprobe = nprobe
+        self.rerank = rerank
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, lists: int = None, subspaces: int = None, nprobe: int = IVF_NPROBE,
+              rerank: int = IVF_RERANK, seed: int = 0):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        n, d = vectors.shape
+        if not n:
+            raise VectorIndexError("Cannot build an IVF-PQ index over no vectors.")
+        lists = lists or max(1, int(2 * np.sqrt(n)))
+        subspaces = subspaces or (d if d <= 16 else max(m for m in range(1, d // 2 + 1) if d % m == 0))
+        if d % subspaces:
+            raise VectorIndexError(f"{d} dimensions do not split into {subspaces} equal subspaces.")
+
+        rng = np.random.default_rng(seed)
+
+        def sample(rows, clusters):
+            return rows[rng.choice(len(rows), min(len(rows), clusters * KMEANS_ROWS_PER_CENTROID, KMEANS_SAMPLE),
+                                   replace=False)]
+
+        centroids = kmeans(sample(vectors, lists), lists, seed=seed)
+        labels = _assign(vectors, centroids)
+        residuals = vectors - centroids[labels]
+
+        width = d // subspaces
+        size = min(256, n)
+        codebooks = np.empty((subspaces, size, width), dtype=np.float32)
+        codes = np.empty((n, subspaces), dtype=np.uint8)
+        sample_residuals = sample(residuals, size)
+        for m in range(subspaces):
+            part = slice(m * width, (m + 1) * width)
+            book = kmeans(sample_residuals[:, part], size, seed=seed + m + 1)
+            codebooks[m, :len(book)] = book
+            codebooks[m, len(book):] = book[0]
+            codes[:, m] = _assign(residuals[:, part], book)
+
+        order = np.argsort(labels, kind="stable")
+        offsets = np.searchsorted(labels[order], np.arange(len(centroids) + 1)).astype(np.int64)
+        return cls(centroids, codebooks, offsets, order.astype(np.int64), codes[order],
+                   vectors[order], nprobe, rerank)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def search(self, queries, k: int, nprobe: int = None, rerank: int = None):
+        queries = _as_queries(queries)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        rerank = self.rerank if rerank is None else rerank
+        subspaces, _, width = self.codebooks.shape
+        # Closest centroids by euclidean distance: max q.c - |c|^2 / 2
+        centre_scores = queries @ self.centroids.T
+        half_norms = np.einsum("ij,ij->i", self.centroids, self.centroids) / 2
+        probes = top_k_rows(centre_scores - half_norms, nprobe)[0]
+        # Inner products of every query subvector with every code of its subspace
+        tables = np.einsum("qmw,mcw->qmc", queries.reshape(len(queries), subspaces, width), self.codebooks)
+        subspace = np.arange(subspaces)
+
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        scores = np.full((len(queries), k), -np.inf, dtype=np.float32)
+        for row, query in enumerate(queries):
+            lists = probes[row]
+            starts, ends = self.offsets[lists], self.offsets[lists + 1]
+            lengths = ends - starts
+            if not lengths.sum():
+                continue
+            positions = np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())
+            approx = (np.repeat(centre_scores[row, lists], lengths)
+                      + tables[row][subspace, self.codes[positions]].sum(axis=1))
+            if rerank:
+                keep = top_k_rows(approx[None, :], max(k, rerank))[0][0]
+                positions = positions[keep]
+                approx = self.vectors[positions] @ query
+            best, values = top_k_rows(approx[None, :], k)
+            indices[row, :best.shape[1]] = self.ids[positions[best[0]]]
+            scores[row, :best.shape[1]] = values[0]
+        return indices, scores
+
+    # Every list scanned and every vector in them re-ranked exactly
+    def search_exhaustive(self, queries, k: int):
+        return self.search(queries, k, nprobe=len(self.centroids), rerank=len(self.ids))
+
+    def _arrays(self) -> dict:
+        return {"centroids": self.centroids, "codebooks": self.codebooks, "offsets": self.offsets,
+                "ids": self.ids, "codes": self.codes, "vectors": self.vectors}
+
+    def _settings(self) -> dict:
+        return {"nprobe": self.nprobe, "rerank": self.rerank}
+
+    @classmethod
+    def _restore(cls, arrays, settings, directory):
+        return cls(**arrays, **settings)
+
+
+INDEX_KINDS = {index.kind: index for index in (ExactIndex, TreeIndex, BallTreeIndex, IVFPQIndex)}
+
+
+def build_index(kind: str, vectors: np.ndarray, **params) -> VectorIndex:
+    if kind not in INDEX_KINDS:
+        raise VectorIndexError(f"Unknown index '{kind}'. Use one of: {', '.join(INDEX_KINDS)}.")
+    return INDEX_KINDS[kind].build(vectors, **params)
+
+
+# Write an index to `directory`, replacing whatever was there only once
+# every file is written
+def save_index(index: VectorIndex, directory: str):
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    staging = os.path.join(parent, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(staging)
+    try:
+        for name, array in index._arrays().items():
+            np.save(os.path.join(staging, name + ".npy"), np.ascontiguousarray(array))
+        index._save_extra(staging)
+        with open(os.path.join(staging, "index.json"), "w") as f:
+            json.dump({"kind": index.kind, "settings": index._settings()}, f)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(staging, directory)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+# Load an index saved with save_index; with mmap=True its arrays stay on disk
+# and are paged in as searches touch them
+def load_index(directory: str, mmap: bool = True) -> VectorIndex:
+    with open(os.path.join(directory, "index.json")) as f:
+        meta = json.load(f)
+    index_class = INDEX_KINDS[meta["kind"]]
+    arrays = {
+        name[:-4]: np.load(os.path.join(directory, name), mmap_mode="r" if mmap else None)
+        for name in os.listdir(directory) if name.endswith(".npy")
+    }
+    return index_class._restore(arrays, meta["settings"], directory)
@@ -0,0 +1,212 @@
+# food_recommend.py
+# Nutrient-similarity search for food.py /submit. The nutrition CSV is read
+# once into a contiguous float32 matrix whose rows are scaled to unit length,
+# so cosine similarity is an inner product, and searched through a vector
+# index (food_index.py): brute force by default, or a tree or IVF-PQ index for
+# large catalogues. With FOOD_INDEX_DIR set the built index is saved there and
+# memory-mapped on later loads without reading the CSV again. The CSV is
+# re-read when it changes on disk.
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from food_index import INDEX_KINDS, VectorIndexError, build_index, load_index, save_index
+from metrics import span
+
+# Nutrition table; row i describes the product at position i of the catalogue
+NUTRITION_CSV = os.environ.get("FOOD_NUTRITION_CSV") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "Indian_Food_Nutrition_Processed_Cleaned.csv"
+)
+# Feature columns, in the order of the query vector
+FEATURES = ("Carbohydrates (g)", "Protein (g)", "Fats (g)")
+# Dishes returned per query unless the request asks for another number
+RECOMMEND_K = int(os.environ.get("FOOD_RECOMMEND_K", 5))
+# Largest k a request may ask for
+RECOMMEND_MAX_K = int(os.environ.get("FOOD_RECOMMEND_MAX_K", 100))
+# Targets answered per index call by the batch endpoint, and per request at most
+BATCH_CHUNK = int(os.environ.get("FOOD_BATCH_CHUNK", 1024))
+BATCH_MAX_TARGETS = int(os.environ.get("FOOD_BATCH_MAX_TARGETS", 100_000))
+# At most one check of the CSV's modification time per this many seconds
+RELOAD_CHECK_SECONDS = float(os.environ.get("FOOD_RELOAD_CHECK_SECONDS", 1.0))
+# Vector index kind: exact, kdtree, balltree or ivfpq
+VECTOR_INDEX = os.environ.get("FOOD_VECTOR_INDEX", "exact")
+# Where built indexes are kept between restarts (unset: built in memory on every load)
+INDEX_DIR = os.environ.get("FOOD_INDEX_DIR") or None
+# Staging directories left behind by a crashed save are removed after this many seconds
+_STALE_TMP_SECONDS = 3600
+
+logger = logging.getLogger("food_recommend")
+
+
+# Rows scaled to unit length; all-zero rows stay zero (similarity 0 with anything)
+def unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return np.ascontiguousarray(matrix / norms, dtype=np.float32)
+
+
+class NutrientIndex:
+    def __init__(self, path: str = NUTRITION_CSV, features=FEATURES, check_every: float = RELOAD_CHECK_SECONDS,
+                 index_kind: str = VECTOR_INDEX, index_dir: str = INDEX_DIR):
+        if index_kind not in INDEX_KINDS:
+            raise VectorIndexError(f"Unknown index '{index_kind}'. Use one of: {', '.join(INDEX_KINDS)}.")
+        self.path = path
+        self.features = list(features)
+        self.check_every = check_every
+        self.index_kind = index_kind
+        self.index_dir = index_dir
+        self.reloads = 0
+        # (vector index, file signature), swapped as a whole on reload
+        self._state = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return stat.st_mtime_ns, stat.st_size
+
+    # Name prefix shared by the saved indexes of every version of this CSV
+    def _saved_index_prefix(self) -> str:
+        key = hashlib.sha1(repr((os.path.abspath(self.path), self.features)).encode()).hexdigest()[:16]
+        return f"{self.index_kind}-{key}-"
+
+    # Saved index for this version of the CSV
+    def _saved_index_path(self, signature) -> str:
+        version = hashlib.sha1(repr(signature).encode()).hexdigest()[:16]
+        return os.path.join(self.index_dir, self._saved_index_prefix() + version)
+
+    # Remove indexes saved for earlier versions of this CSV, leaving other
+    # CSVs' indexes alone, and staging directories of saves that never finished
+    def _remove_stale(self, current: str):
+        prefix = self._saved_index_prefix()
+        now = time.time()
+        for name in os.listdir(self.index_dir):
+            path = os.path.join(self.index_dir, name)
+            if name.startswith(prefix) and path != current:
+                shutil.rmtree(path, ignore_errors=True)
+            elif name.startswith(".tmp-"):
+                try:
+                    stale = now - os.stat(path).st_mtime > _STALE_TMP_SECONDS
+                except OSError:
+                    continue
+                if stale:
+                    shutil.rmtree(path, ignore_errors=True)
+
+    def _build(self, signature):
+        if self.index_dir is not None:
+            directory = self._saved_index_path(signature)
+            if os.path.exists(os.path.join(directory, "index.json")):
+                return load_index(directory)
+        df = pd.read_csv(self.path)
+        matrix = unit_rows(df[self.features].to_numpy(dtype=np.float64))
+        index = build_index(self.index_kind, matrix)
+        if self.index_dir is None:
+            return index
+        save_index(index, directory)
+        self._remove_stale(directory)
+        return load_index(directory)
+
+    def load(self):
+        with self._lock:
+            signature = self._signature()
+            with span("nutrients_load"):
+                index = self._build(signature)
+            if self._state is not None:
+                self.reloads += 1
+            self._state = (index, signature)
+            self._checked_at = time.monotonic()
+
+    # Load on first use and again whenever the file changed since
+    def _current(self):
+        state = self._state
+        if state is None:
+            self.load()
+            return self._state
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_every:
+            self._checked_at = now
+            try:
+                if self._signature() != state[1]:
+                    self.load()
+            except (OSError, ValueError, KeyError):
+                # Removed or half written: keep serving what was loaded
+                logger.exception("Reloading %s failed; serving the previous nutrient matrix", self.path)
+            return self._state
+        return state
+
+    def __len__(self) -> int:
+        return len(self._current()[0])
+
+    # Positions and cosine similarities of the k dishes closest to `values`
+    # (one value per feature), most similar first. k is capped at the number
+    # of dishes, so the index never pads its answer beyond the catalogue.
+    def query(self, values, k: int = RECOMMEND_K):
+        index, _ = self._current()
+        k = min(max(1, k), max(len(index), 1))
+        indices, scores = index.search(np.asarray(values, dtype=np.float32), k)
+        found = indices[0] >= 0
+        return indices[0][found], scores[0][found]
+
+    # query() for a whole batch: `values` has one row per target, `ks` one k
+    # per target and `allowed` optionally a boolean mask over positions per
+    # target (None: any dish; targets may share a mask, and positions past
+    # its end never qualify). All targets are searched in one index call,
+    # fetching enough extra neighbours for the masks to still leave k; the
+    # few targets a mask leaves short are searched again with a wider fetch,
+    # up to all dishes. Returns a list of (positions, similarities) pairs,
+    # one per target.
+    def query_batch(self, values, ks, allowed=None) -> list:
+        index, _ = self._current()
+        size = len(index)
+        values = np.asarray(values, dtype=np.float32).reshape(len(ks), -1)
+        ks = np.clip(np.asarray(ks, dtype=np.int64), 1, max(size, 1))
+        allowed = allowed if allowed is not None else [None] * len(ks)
+        # Neighbours to fetch so that a mask passing a share p of the dishes
+        # is expected to leave k of them: k / p
+        fetch = ks.copy()
+        passing = {}
+        for row, mask in enumerate(allowed):
+            if mask is not None:
+                if id(mask) not in passing:
+                    passing[id(mask)] = max(int(np.count_nonzero(mask[:size])), 1)
+                fetch[row] = -(-ks[row] * size // passing[id(mask)])
+        fetch = np.minimum(fetch, size)
+
+        results = [None] * len(ks)
+        pending = np.arange(len(ks))
+        while len(pending):
+            wanted = int(fetch[pending].max())
+            # Fetching every dish: an approximate index must not skip any
+            search = index.search_exhaustive if wanted >= size else index.search
+            indices, scores = search(values[pending], max(wanted, 1))
+            short = []
+            for row, found, similarity in zip(pending, indices, scores):
+                keep = found >= 0
+                mask = allowed[row]
+                if mask is not None:
+                    keep &= found < len(mask)
+                    keep &= mask[np.where(keep, found, 0)]
+                if keep.sum() < ks[row] and wanted < size:
+                    short.append(row)
+                    continue
+                results[row] = (found[keep][:ks[row]], similarity[keep][:ks[row]])
+            pending = np.array(short, dtype=np.int64)
+            fetch[pending] = np.minimum(fetch[pending] * 4, size)
+        return results
+
+    def stats(self) -> dict:
+        state = self._state
+        return {
+            "dishes": 0 if state is None else len(state[0]),
+            "features": self.features,
+            "path": self.path,
+            "index": self.index_kind,
+            "index_bytes": 0 if state is None else state[0].nbytes(),
+            "reloads": self.reloads,
+        }
@@ -1,8 +1,10 @@
 from fastapi import FastAPI
 from pydantic import BaseModel
 from typing import List
+from metrics import instrument
 
 app = FastAPI()
+instrument(app, "main")
 
 class Tea(BaseModel):
     id: int
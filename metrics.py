@@ -0,0 +1,195 @@
+# metrics.py
+# Shared instrumentation for the apps in this repo (data.py, food.py, main.py,
+# app.py), exposed in the Prometheus text format at /metrics:
+#  - request latency histograms per app, route, method and status, recorded
+#    by a middleware installed with instrument(app, name)
+#  - stage histograms recorded by `with span("stage"):` around the internal
+#    steps of a request (parsing, database fetches, compute, rendering, ...)
+#  - gauges and counters read from callbacks at scrape time (dataset memory,
+#    cache sizes, ...) registered with register_collector()
+# With METRICS_SLOW_REQUEST_MS set, requests slower than that are logged
+# together with the stages they went through.
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from fastapi.responses import Response
+
+# Log requests slower than this many milliseconds with their stage breakdown (0: off)
+SLOW_REQUEST_MS = float(os.environ.get("METRICS_SLOW_REQUEST_MS", 0))
+# Upper bounds in seconds of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+logger = logging.getLogger("metrics")
+
+# Stages recorded for the current request, as (stage, seconds) in completion order
+_request_stages = contextvars.ContextVar("request_stages", default=None)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, label_names: tuple, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def expose(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted(self._series.items())
+            series = [(values, {**data, "buckets": list(data["buckets"])}) for values, data in series]
+        for label_values, data in series:
+            labels = dict(zip(self.label_names, label_values))
+            for bound, count in zip(self.buckets, data["buckets"]):
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': repr(bound)})} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {data['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {data['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {data['count']}")
+        return lines
+
+
+# A gauge or counter whose value is read from `collect()` at scrape time.
+# collect returns a number, or a list of (labels dict, number) pairs.
+class Collector:
+    def __init__(self, name: str, kind: str, help: str, collect):
+        self.name = name
+        self.kind = kind
+        self.help = help
+        self.collect = collect
+
+    def expose(self) -> list:
+        try:
+            values = self.collect()
+        except Exception:
+            logger.exception("Collecting metric %s failed", self.name)
+            return []
+        if not isinstance(values, list):
+            values = [({}, values)]
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_format_labels(labels)} {float(value)}" for labels, value in values)
+        return lines
+
+
+request_latency = Histogram(
+    "http_request_duration_seconds", "Time from request start to the end of the response body.",
+    ("app", "method", "route", "status")
+)
+stage_latency = Histogram(
+    "request_stage_duration_seconds", "Time spent in an internal stage of a request.", ("stage",)
+)
+_collectors = {}
+
+
+def register_collector(name: str, kind: str, help: str, collect):
+    _collectors[name] = Collector(name, kind, help, collect)
+
+
+def _resident_memory():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+
+
+if os.path.exists("/proc/self/statm"):
+    register_collector("process_resident_memory_bytes", "gauge", "Resident memory of this process.", _resident_memory)
+
+
+# Time a block as a named stage of the current request (or of background
+# work, which is only recorded in the histogram). Stages may nest.
+@contextmanager
+def span(stage: str):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        stage_latency.observe(elapsed, stage)
+        stages = _request_stages.get()
+        if stages is not None:
+            stages.append((stage, elapsed))
+
+
+def expose() -> str:
+    lines = request_latency.expose() + stage_latency.expose()
+    for collector in list(_collectors.values()):
+        lines.extend(collector.expose())
+    return "\n".join(lines) + "\n"
+
+
+# Times every HTTP request, labelled with the matched route rather than the
+# raw path so that path parameters do not create new series
+class MetricsMiddleware:
+    def __init__(self, app, name: str):
+        self.app = app
+        self.name = name
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = 500
+        stages = []
+        token = _request_stages.set(stages)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_stages.reset(token)
+            elapsed = time.perf_counter() - started
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            request_latency.observe(elapsed, self.name, scope["method"], route, str(status))
+            if SLOW_REQUEST_MS and elapsed * 1000 >= SLOW_REQUEST_MS:
+                logger.warning("Slow request: %s", json.dumps({
+                    "app": self.name,
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "route": route,
+                    "status": status,
+                    "ms": round(elapsed * 1000, 1),
+                    "stages": [{"stage": stage, "ms": round(seconds * 1000, 1)} for stage, seconds in stages],
+                }))
+
+
+# Add the request-timing middleware and a /metrics endpoint to an app
+def instrument(app, name: str):
+    app.add_middleware(MetricsMiddleware, name=name)
+
+    @app.get("/metrics", include_in_schema=False)
+    async def metrics():
+        return Response(expose(), media_type=CONTENT_TYPE)
+
+    return app
@@ -0,0 +1,62 @@
+# tests/conftest.py
+# Every directory the apps write to is pointed into one temporary directory
+# before any app module is imported, and the flat app modules are made
+# importable from the repository root.
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_SCRATCH = tempfile.mkdtemp(prefix="data_tests_")
+atexit.register(shutil.rmtree, _SCRATCH, ignore_errors=True)
+for variable, name in (
+    ("DATA_INGEST_CACHE_DIR", "ingest_cache"),
+    ("DATA_OUT_OF_CORE_DIR", "outofcore"),
+    ("DATA_SPILL_DIR", "spill"),
+    ("DATA_PIPELINE_DIR", "pipelines"),
+    ("DATA_BENCH_DIR", "bench"),
+    ("FOOD_FEATURE_DIR", "features"),
+):
+    os.environ.setdefault(variable, os.path.join(_SCRATCH, name))
+    os.makedirs(os.environ[variable], exist_ok=True)
+# No background imports of the plotting libraries, and a SQLite catalogue
+# seeded from the nutrition CSV instead of MySQL
+os.environ.setdefault("DATA_WARM_UP", "0")
+os.environ.setdefault("FOOD_DB_BACKEND", "sqlite")
+os.environ.setdefault("FOOD_SQLITE_PATH", os.path.join(_SCRATCH, "food.sqlite3"))
+os.environ.setdefault("FOOD_SEED_CSV", os.path.join(ROOT, "Indian_Food_Nutrition_Processed_Cleaned.csv"))
+
+
+@pytest.fixture
+def data_client():
+    from fastapi.testclient import TestClient
+
+    from data import app
+
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def food_client(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    from food import app
+
+    # food.py finds its templates relative to the working directory
+    monkeypatch.chdir(ROOT)
+    with TestClient(app) as client:
+        yield client
+
+
+# Upload a frame as CSV to a data.py client and return the response JSON
+def upload_csv(client, df, filename="data.csv", **params):
+    response = client.post("/upload/", params=params, files={"file": (filename, df.to_csv(index=False), "text/csv")})
+    assert response.status_code == 200
+    return response.json()
@@ -0,0 +1,18 @@
+# tests/test_benchmark.py
+# The startup and spill checks of data_benchmark.py, run as tests.
+from data_benchmark import LAZY_MODULES, STARTUP_BUDGET_MS, check_spill_roundtrip, measure_startup
+
+
+def test_startup_within_budget():
+    result = measure_startup(runs=3)
+    assert result["import_ms"]["median"] <= STARTUP_BUDGET_MS, result
+    # None of the heavy libraries load at import
+    assert result["eager_modules"] == [], f"imported eagerly: {result['eager_modules']} (of {LAZY_MODULES})"
+    # Importing the app writes nothing next to it
+    assert result["files_written"] == []
+
+
+def test_spill_roundtrip():
+    result = check_spill_roundtrip(rows=500)
+    assert result["frame_mismatch"] is None, result["frame_mismatch"]
+    assert not result["version_changed"]
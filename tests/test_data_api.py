@@ -0,0 +1,200 @@
+# tests/test_data_api.py
+# Behaviour of the data.py endpoints: chart ETags, paged rows, exports,
+# undo/redo and background jobs.
+import gzip
+import io
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pyarrow.ipc as pa_ipc
+import pyarrow.parquet as pq
+import pytest
+
+from conftest import upload_csv
+
+
+@pytest.fixture
+def frame():
+    rng = np.random.default_rng(1)
+    rows = 250
+    values = rng.normal(size=rows)
+    values[::10] = np.nan
+    return pd.DataFrame({
+        "id": np.arange(rows),
+        "value": values,
+        "count": rng.integers(0, 50, rows),
+        "group": rng.choice(["a", "b", "c"], rows),
+    })
+
+
+@pytest.fixture
+def uploaded(data_client, frame):
+    body = upload_csv(data_client, frame)
+    assert "error" not in body, body
+    return data_client
+
+
+CHART = {"chart_type": "histogram", "x_column": "value", "title": "Value"}
+
+
+def test_chart_etag_and_304(uploaded):
+    response = uploaded.get("/visualization/image/", params=CHART)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/png"
+    etag = response.headers["etag"]
+
+    # Same chart, same data: 304 for the tag, a weak tag, a list holding it and *
+    for header in (etag, f"W/{etag}", f'"other", {etag}', "*"):
+        response = uploaded.get("/visualization/image/", params=CHART, headers={"If-None-Match": header})
+        assert response.status_code == 304, header
+        assert response.content == b""
+    response = uploaded.get("/visualization/image/", params=CHART, headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+    # POST always sends the full response
+    response = uploaded.post("/visualization/create/", data=CHART, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()["success"]
+
+    # A change to the data changes the tag
+    uploaded.post("/preprocess/handle-missing/", data={"columns": ["value"], "method": "mean"})
+    response = uploaded.get("/visualization/image/", params=CHART, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["etag"] != etag
+
+
+def test_rows_pagination(uploaded, frame):
+    seen = []
+    for offset in range(0, len(frame), 100):
+        body = uploaded.get("/data/rows/", params={"offset": offset, "limit": 100}).json()
+        assert body["total_rows"] == len(frame)
+        seen.extend(row["id"] for row in body["rows"])
+    assert seen == frame["id"].tolist()
+
+    body = uploaded.get("/data/rows/", params={"offset": 0, "limit": 5, "sort": "count", "descending": "true",
+                                                "columns": ["id", "count"]}).json()
+    assert body["columns"] == ["id", "count"]
+    assert [row["count"] for row in body["rows"]] == sorted(frame["count"], reverse=True)[:5]
+
+    response = uploaded.get("/data/rows/", params={"offset": 10, "limit": 20, "format": "arrow"})
+    assert response.headers["x-total-rows"] == str(len(frame))
+    table = pa_ipc.open_stream(io.BytesIO(response.content)).read_all()
+    assert table.column("id").to_pylist() == list(range(10, 30))
+
+    response = uploaded.get("/data/rows/", params={"offset": 0, "limit": 5, "sort": "missing"})
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize("export_format", ["csv", "csv.gz", "parquet", "arrow"])
+def test_export_formats(uploaded, frame, export_format):
+    response = uploaded.get("/data/export/", params={"format": export_format})
+    assert response.status_code == 200
+    assert f"preprocessed_data.{export_format}" in response.headers["content-disposition"]
+    data = response.content
+    if export_format == "csv":
+        exported = pd.read_csv(io.BytesIO(data))
+    elif export_format == "csv.gz":
+        exported = pd.read_csv(io.BytesIO(gzip.decompress(data)))
+    elif export_format == "parquet":
+        exported = pq.read_table(io.BytesIO(data)).to_pandas()
+    else:
+        exported = pa_ipc.open_stream(io.BytesIO(data)).read_all().to_pandas()
+    assert exported["id"].tolist() == frame["id"].tolist()
+    np.testing.assert_allclose(exported["value"].to_numpy(dtype=float), frame["value"].to_numpy(), equal_nan=True)
+
+
+def test_export_unknown_format(uploaded):
+    assert uploaded.get("/data/export/", params={"format": "xml"}).status_code == 400
+
+
+def test_undo_redo(uploaded, frame):
+    def missing():
+        return uploaded.get("/data/preview/").json()["missing_values"]["value"]
+
+    assert missing() == frame["value"].isna().sum()
+    assert uploaded.post("/preprocess/handle-missing/", data={"columns": ["value"], "method": "median"}).json()["success"]
+    assert uploaded.post("/preprocess/drop-columns/", data={"columns": ["group"]}).json()["success"]
+    assert missing() == 0
+
+    body = uploaded.post("/preprocess/undo/", data={"steps": 2}).json()
+    assert body["history"]["cursor"] == 0
+    assert "group" in body["columns"]
+    assert missing() == frame["value"].isna().sum()
+
+    body = uploaded.post("/preprocess/redo/", data={"steps": 1}).json()
+    assert body["history"]["cursor"] == 1
+    assert "group" in body["columns"]
+    assert missing() == 0
+
+    assert "error" in uploaded.post("/preprocess/redo/", data={"steps": 5}).json()
+    # A new operation after an undo drops the steps that could be redone
+    uploaded.post("/preprocess/undo/", data={"steps": 1})
+    uploaded.post("/preprocess/drop-columns/", data={"columns": ["count"]})
+    history = uploaded.get("/preprocess/history/").json()
+    assert [op["op"] for op in history["operations"]] == ["drop-columns"]
+
+
+def _wait(client, job_id, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = client.get(f"/jobs/{job_id}/").json()
+        if job["status"] in ("done", "failed", "cancelled"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_upload_and_chart_jobs(data_client, frame):
+    job = data_client.post("/jobs/upload/", files={"file": ("data.csv", frame.to_csv(index=False), "text/csv")}).json()
+    assert job["kind"] == "upload"
+    job = _wait(data_client, job["job_id"])
+    assert job["status"] == "done", job
+    assert job["result"]["rows"] == len(frame)
+
+    job = data_client.post("/jobs/chart/", data=CHART).json()
+    job = _wait(data_client, job["job_id"])
+    assert job["status"] == "done", job
+    assert job["result"]["image"].startswith("data:image/png;base64,")
+
+    assert {job["kind"] for job in data_client.get("/jobs/").json()["jobs"]} == {"upload", "chart"}
+    # Jobs are only visible to the session that submitted them
+    other = data_client.get(f"/jobs/{job['job_id']}/", headers={"X-Session-ID": "0" * 32})
+    assert other.status_code == 404
+
+
+def test_failed_job_reports_error(data_client):
+    job = data_client.post("/jobs/chart/", data=CHART).json()
+    job = _wait(data_client, job["job_id"])
+    assert job["status"] == "failed"
+    assert "uploaded" in job["error"]
+
+
+def test_encode_returns_the_fitted_mapping(uploaded):
+    body = uploaded.post("/preprocess/encode-categorical/", data={"columns": ["group"], "method": "onehot"}).json()
+    assert body["success"], body
+    history = uploaded.get("/preprocess/history/").json()
+    assert body["mapping"] == history["operations"][-1]["params"]["mapping"]
+    assert sorted(body["mapping"]["group"]["categories"]) == ["a", "b", "c"]
+
+
+def test_saved_pipeline(uploaded):
+    import data_pipeline
+
+    spec = {"steps": [{"op": "handle-missing", "params": {"columns": ["value"], "method": "mean"}},
+                      {"op": "drop-columns", "params": {"columns": ["group"]}}]}
+    assert uploaded.post("/preprocess/pipelines/clean/", json=spec).json()["success"]
+    assert os.path.exists(os.path.join(data_pipeline.PIPELINE_DIR, "clean.json"))
+    assert "clean" in uploaded.get("/preprocess/pipelines/").json()["pipelines"]
+
+    body = uploaded.post("/preprocess/pipelines/clean/run/").json()
+    assert body["success"], body
+    assert "group" not in body["columns"]
+    assert body["missing_values"]["value"] == 0
+
+
+def test_drop_rows(uploaded, frame):
+    body = uploaded.post("/preprocess/handle-missing/", data={"columns": ["value", "count"], "method": "drop_rows"}).json()
+    assert body["rows"] == frame["value"].notna().sum()
+    assert body["missing_values"]["value"] == 0
@@ -0,0 +1,118 @@
+# tests/test_food.py
+# Batch recommendations and the nutrient feature store behind food.py.
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import ROOT
+from food_features import FeatureQueryError, FeatureStore
+from food_recommend import FEATURES, unit_rows
+
+NUTRITION_CSV = os.path.join(ROOT, "Indian_Food_Nutrition_Processed_Cleaned.csv")
+
+
+def _lines(response):
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_recommend_batch_matches_exact_search(food_client):
+    targets = [{"protin": 10, "fat": 5, "carbos": 30}, {"protin": 2, "fat": 20, "carbos": 1, "k": 3}]
+    items = _lines(food_client.post("/recommend/batch", json={"targets": targets, "k": 4}))
+    assert [item["item"] for item in items] == [0, 1]
+    assert [len(item["products"]) for item in items] == [4, 3]
+
+    matrix = unit_rows(pd.read_csv(NUTRITION_CSV)[list(FEATURES)].to_numpy(dtype=np.float64))
+    for target, item in zip(targets, items):
+        query = np.array([target["carbos"], target["protin"], target["fat"]], dtype=np.float64)
+        scores = matrix @ (query / np.linalg.norm(query))
+        found = [product["score"] for product in item["products"]]
+        assert found == sorted(found, reverse=True)
+        np.testing.assert_allclose(found, np.sort(scores)[::-1][:len(found)], rtol=1e-5)
+
+
+def test_recommend_batch_dish_type_filter(food_client):
+    # The SQLite catalogue gives every dish type 0
+    items = _lines(food_client.post("/recommend/batch", json={
+        "targets": [{"protin": 1, "fat": 1, "carbos": 1, "p_type": [0]},
+                    {"protin": 1, "fat": 1, "carbos": 1, "p_type": [1]}],
+        "k": 5,
+    }))
+    assert len(items[0]["products"]) == 5
+    assert items[1]["products"] == []
+
+
+def test_recommend_batch_rejects_empty(food_client):
+    assert food_client.post("/recommend/batch", json={"targets": []}).status_code == 400
+    assert food_client.post("/recommend/batch", json={"targets": [{"protin": 1, "fat": 1, "carbos": 1, "k": 0}]}).status_code == 422
+
+
+def test_recommend_nutrients(food_client):
+    nutrients = food_client.get("/recommend/nutrients").json()["nutrients"]
+    assert {"protein", "fats", "carbohydrates"} <= set(nutrients)
+    body = food_client.post("/recommend/nutrients", json={"targets": {"protein": 20}, "k": 3}).json()
+    distances = [product["distance"] for product in body["products"]]
+    assert len(distances) == 3 and distances == sorted(distances)
+    response = food_client.post("/recommend/nutrients", json={"targets": {"gluten": 1}})
+    assert response.status_code == 400
+
+
+@pytest.fixture
+def store(tmp_path):
+    csv = tmp_path / "nutrition.csv"
+    pd.DataFrame({
+        "Dish Name": ["a", "b", "c", "d"],
+        "Protein (g)": [1.0, 10.0, 20.0, np.nan],
+        "Sodium (mg)": [100.0, 900.0, 500.0, 300.0],
+    }).to_csv(csv, index=False)
+    return FeatureStore(str(csv), str(tmp_path / "features"), check_every=0)
+
+
+def test_feature_store_query(store):
+    assert store.nutrients() == ["protein", "sodium"]
+    [(positions, distances)] = store.query([{"protein": 10.0, "sodium": 900.0}], k=2)
+    assert positions.tolist()[0] == 1
+    assert distances[0] == pytest.approx(0.0, abs=1e-5)
+    # A weight of 0 leaves sodium out of the ranking
+    [(positions, _)] = store.query([{"protein": 19.0, "sodium": 100.0}], {"sodium": 0.0}, k=1)
+    assert positions.tolist() == [2]
+    # Masks leave out positions
+    [(positions, _)] = store.query([{"protein": 10.0}], k=4, allowed=[np.array([True, False, True, True])])
+    assert 1 not in positions.tolist()
+    with pytest.raises(FeatureQueryError):
+        store.query([{"gluten": 1.0}])
+    with pytest.raises(FeatureQueryError):
+        store.query([{"protein": 1.0}], {"protein": -1.0})
+
+
+def test_feature_store_rebuilds_when_the_csv_changes(store):
+    assert len(store) == 4
+    assert store.builds == 1
+    # Another store over the same CSV opens the files that were built
+    other = FeatureStore(store.path, os.path.dirname(store.directory))
+    assert len(other) == 4 and other.builds == 0
+
+    time.sleep(0.01)
+    pd.read_csv(store.path).head(2).to_csv(store.path, index=False)
+    assert len(store) == 2
+    assert store.builds == 2 and store.reloads == 1
+
+
+def test_submit_fills_k_when_the_catalogue_is_shorter(food_client, monkeypatch):
+    import food
+    from food_catalogue import PRODUCT_COLUMNS, ProductCatalogue
+
+    products = food.catalogue.get()
+    short = ProductCatalogue(list(zip(*(products.column(name) for name in PRODUCT_COLUMNS)))[:10])
+    monkeypatch.setattr(food.catalogue, "get", lambda: short)
+    # The nearest rows of this target lie past the 10th; the answer still has k products
+    [(nearest, _)] = food.nutrients.query_batch([[0.0, 0.0, 1.0]], [5])
+    assert (nearest >= 10).any()
+    response = food_client.post("/submit", data={"protin": 0, "fat": 1, "carbos": 0, "k": 5})
+    assert response.status_code == 200
+    assert response.text.count('class="food-title"') == 5
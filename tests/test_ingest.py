@@ -0,0 +1,16 @@
+# tests/test_ingest.py
+import pandas as pd
+import pytest
+
+import data_ingest
+from data_ingest import UnsupportedFormatError, convert_to_parquet, write_parquet
+
+
+def test_parquet_without_pyarrow(tmp_path, monkeypatch):
+    monkeypatch.setattr(data_ingest, "pq", None)
+    csv = tmp_path / "data.csv"
+    pd.DataFrame({"a": [1, 2]}).to_csv(csv, index=False)
+    with pytest.raises(UnsupportedFormatError, match="requires pyarrow"):
+        convert_to_parquet(str(csv), str(tmp_path / "out.parquet"))
+    with pytest.raises(UnsupportedFormatError, match="requires pyarrow"):
+        write_parquet(pd.DataFrame({"a": [1]}), str(tmp_path / "out.parquet"))
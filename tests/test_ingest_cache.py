@@ -0,0 +1,49 @@
+# tests/test_ingest_cache.py
+import os
+
+import numpy as np
+import pandas as pd
+
+from conftest import upload_csv
+from data_ingest_cache import ingest_cache
+
+
+def _frame(rows=20_000):
+    rng = np.random.default_rng(0)
+    return pd.DataFrame({"a": rng.normal(size=rows), "b": rng.integers(0, 1000, rows), "c": rng.choice(list("xyz"), rows)})
+
+
+def _cached_files():
+    if not os.path.isdir(ingest_cache.directory):
+        return []
+    return [name for name in os.listdir(ingest_cache.directory) if name.endswith(".parquet")]
+
+
+def test_out_of_core_upload_larger_than_cache(data_client, monkeypatch):
+    ingest_cache.clear()
+    # A few kilobytes: far less than the converted upload
+    monkeypatch.setattr(ingest_cache, "max_bytes", 4096)
+    df = _frame()
+
+    body = upload_csv(data_client, df, "big.csv", out_of_core="true")
+    assert "error" not in body, body
+    assert body["rows"] == len(df)
+    # Not cached, and the uncached conversion was not left behind
+    assert _cached_files() == []
+
+    preview = data_client.get("/data/rows/", params={"offset": 0, "limit": 5}).json()
+    assert "error" not in preview, preview
+
+    # The same upload again is converted again, not read from a missing entry
+    body = upload_csv(data_client, df, "big.csv", out_of_core="true")
+    assert "error" not in body, body
+
+
+def test_out_of_core_upload_within_cache_is_cached(data_client):
+    ingest_cache.clear()
+    df = _frame(1000)
+    assert "error" not in upload_csv(data_client, df, "small.csv", out_of_core="true")
+    assert len(_cached_files()) == 1
+    hits = ingest_cache.hits
+    assert "error" not in upload_csv(data_client, df, "small.csv", out_of_core="true")
+    assert ingest_cache.hits > hits